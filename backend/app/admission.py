@@ -0,0 +1,253 @@
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Callable
+
+from fastapi import HTTPException, status
+from starlette.requests import HTTPConnection
+
+from . import config, metrics
+
+# Priority classes, most urgent first. Interactive requests (login, profile,
+# leaderboard) may use every slot; batch requests (contest processing and
+# other admin jobs) are capped so they can never take the capacity
+# interactive traffic needs, and queued interactive requests are admitted
+# ahead of queued batch ones.
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = {INTERACTIVE: 0, BATCH: 1}
+
+# Upper bounds (seconds) of the queue time histogram buckets
+QUEUE_TIME_BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0, math.inf)
+
+
+class Waiter:
+    __slots__ = ("priority_class", "loop", "future", "granted", "abandoned")
+
+    def __init__(self, priority_class: str, loop: asyncio.AbstractEventLoop):
+        self.priority_class = priority_class
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+        self.abandoned = False
+
+
+class ClassStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0  # Admitted after waiting for a slot
+        self.timed_out = 0
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self.queue_time_buckets = [0] * len(QUEUE_TIME_BUCKETS)
+
+    def record_admission(self, waited: float):
+        self.admitted += 1
+        self.queue_seconds += waited
+        self.max_queue_seconds = max(self.max_queue_seconds, waited)
+        for i, bound in enumerate(QUEUE_TIME_BUCKETS):
+            if waited <= bound:
+                self.queue_time_buckets[i] += 1
+                break
+
+    def as_dict(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "timed_out": self.timed_out,
+            "queue_seconds": self.queue_seconds,
+            "average_queue_seconds": (
+                self.queue_seconds / self.admitted if self.admitted else 0.0
+            ),
+            "max_queue_seconds": self.max_queue_seconds,
+            "queue_time_buckets": {
+                str(bound): count
+                for bound, count in zip(QUEUE_TIME_BUCKETS, self.queue_time_buckets)
+            },
+        }
+
+
+class AdmissionController:
+    # Counting semaphore with per-class caps and a priority queue. State is
+    # guarded by a thread lock and waiters are woken on their own event loop,
+    # so one controller can serve requests from several loops (the test
+    # client runs one per request).
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        class_limits: dict[str, int],
+        queue_timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_concurrency = max_concurrency
+        self.class_limits = class_limits
+        self.queue_timeout = queue_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queue: list[tuple[int, int, Waiter]] = []
+        self._sequence = itertools.count()
+        self._stats = {name: ClassStats() for name in PRIORITIES}
+
+    def _has_slot(self, priority_class: str) -> bool:
+        limit = self.class_limits.get(priority_class)
+        return self._in_flight < self.max_concurrency and (
+            limit is None or self._stats[priority_class].in_flight < limit
+        )
+
+    def _take_slot(self, priority_class: str):
+        self._in_flight += 1
+        self._stats[priority_class].in_flight += 1
+
+    def _dispatch(self):
+        # Hand free slots to waiters in priority order, then arrival order. A
+        # waiter whose class is at its cap does not hold up the others.
+        blocked = []
+        while self._queue and self._in_flight < self.max_concurrency:
+            entry = heapq.heappop(self._queue)
+            waiter = entry[2]
+            if waiter.abandoned:
+                continue
+            if not self._has_slot(waiter.priority_class):
+                blocked.append(entry)
+                continue
+            self._take_slot(waiter.priority_class)
+            self._stats[waiter.priority_class].waiting -= 1
+            waiter.granted = True
+            waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+        for entry in blocked:
+            heapq.heappush(self._queue, entry)
+
+    async def acquire(self, priority_class: str) -> float:
+        # Returns the time spent queued; raises 503 after queue_timeout
+        started = self.clock()
+        stats = self._stats[priority_class]
+        with self._lock:
+            # Queued requests of the same or a higher priority go first
+            ahead = any(
+                not waiter.abandoned and priority <= PRIORITIES[priority_class]
+                for priority, _, waiter in self._queue
+            )
+            if not ahead and self._has_slot(priority_class):
+                self._take_slot(priority_class)
+                stats.record_admission(0.0)
+                return 0.0
+            waiter = Waiter(priority_class, asyncio.get_running_loop())
+            heapq.heappush(
+                self._queue,
+                (PRIORITIES[priority_class], next(self._sequence), waiter),
+            )
+            stats.waiting += 1
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if not waiter.granted:
+                    waiter.abandoned = True
+                    stats.waiting -= 1
+                    if isinstance(e, asyncio.TimeoutError):
+                        stats.timed_out += 1
+                    granted = False
+                else:
+                    granted = True
+            if granted:
+                # Admitted just as the wait ended: give the slot back
+                self.release(priority_class)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, try again later",
+                headers={"Retry-After": str(math.ceil(self.queue_timeout))},
+            )
+
+        waited = self.clock() - started
+        with self._lock:
+            stats.queued += 1
+            stats.record_admission(waited)
+        return waited
+
+    def release(self, priority_class: str):
+        with self._lock:
+            self._in_flight -= 1
+            self._stats[priority_class].in_flight -= 1
+            self._dispatch()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "classes": {
+                    name: {"limit": self.class_limits.get(name), **stats.as_dict()}
+                    for name, stats in self._stats.items()
+                },
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            for name, stats in self._stats.items():
+                fresh = ClassStats()
+                fresh.in_flight, fresh.waiting = stats.in_flight, stats.waiting
+                self._stats[name] = fresh
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+controller = AdmissionController(
+    max_concurrency=config.ADMISSION_MAX_CONCURRENCY,
+    class_limits={BATCH: config.ADMISSION_BATCH_CONCURRENCY},
+    queue_timeout=config.ADMISSION_QUEUE_TIMEOUT,
+)
+
+
+def _class_stat(key: str):
+    def collect():
+        for name, stats in controller.stats()["classes"].items():
+            yield (name,), stats[key]
+
+    return collect
+
+
+for _key, _kind, _documentation in (
+    ("in_flight", "gauge", "Requests holding an admission slot"),
+    ("waiting", "gauge", "Requests queued for an admission slot"),
+    ("admitted", "counter", "Requests admitted"),
+    ("timed_out", "counter", "Requests refused after queueing too long"),
+    ("queue_seconds", "counter", "Time admitted requests spent queued"),
+):
+    metrics.registry.collected(
+        f"admission_{_key}" + ("_total" if _kind == "counter" else ""),
+        _documentation,
+        _kind,
+        ("class",),
+    )(_class_stat(_key))
+
+
+def admit(priority_class: str):
+    # Router dependency holding a slot for the whole request. Async, so
+    # waiting happens on the event loop and never ties up a threadpool thread.
+    async def admission(connection: HTTPConnection):
+        if connection.scope["type"] == "websocket":
+            # Long-lived feeds are served from the cache and hold no slot
+            yield
+            return
+        await controller.acquire(priority_class)
+        try:
+            yield
+        finally:
+            controller.release(priority_class)
+
+    return admission
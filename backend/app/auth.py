@@ -1,26 +1,24 @@
-import os
 import bcrypt
 import jwt
-from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import Session
-from . import models, schemas
+from . import config, metrics, models, schemas
 
-load_dotenv()
-
-SECRET_KEY = os.getenv("SECRET_KEY", "test")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+SECRET_KEY = config.SECRET_KEY
+ALGORITHM = config.ALGORITHM
+ACCESS_TOKEN_EXPIRE_MINUTES = config.ACCESS_TOKEN_EXPIRE_MINUTES
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(
-        plain_password.encode("utf-8"), hashed_password.encode("utf-8")
-    )
+    with metrics.timed(metrics.BCRYPT_SECONDS, "verify"):
+        return bcrypt.checkpw(
+            plain_password.encode("utf-8"), hashed_password.encode("utf-8")
+        )
 
 
 def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    with metrics.timed(metrics.BCRYPT_SECONDS, "hash"):
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
 
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
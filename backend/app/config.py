@@ -0,0 +1,57 @@
+import os
+
+from dotenv import load_dotenv
+
+# The only place .env is read; every setting comes from here
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+# Optional read replica for GET requests; writes always go to DATABASE_URL
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or None
+# After a write, the client's GET requests stay on the primary this long so
+# they see their own writes despite replication lag
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+# Connections reserved for contest processing and other admin jobs, so they
+# never take the interactive pool's connections
+BATCH_POOL_SIZE = int(os.getenv("BATCH_POOL_SIZE", "2"))
+# Requests served at once (kept below the threadpool's 40 threads), how many
+# of them may be admin jobs, and how long a request may wait for a slot
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+ADMISSION_BATCH_CONCURRENCY = int(os.getenv("ADMISSION_BATCH_CONCURRENCY", "2"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+# Fail on any relationship lazy load instead of querying (debugging and tests)
+ORM_RAISELOAD = os.getenv("ORM_RAISELOAD", "false") == "true"
+# Create missing tables when the app starts; turn off once the database is
+# managed with migrations
+CREATE_SCHEMA_ON_STARTUP = os.getenv("CREATE_SCHEMA_ON_STARTUP", "true") == "true"
+
+SECRET_KEY = os.getenv("SECRET_KEY", "test")
+ALGORITHM = os.getenv("ALGORITHM", "HS256")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+# Default admin token - should be changed in production
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your-secure-admin-token")
+
+# Engine rating contests in batch mode and on close: "elo", "elo_pairwise" or
+# "glicko2"
+RATING_ENGINE = os.getenv("RATING_ENGINE", "elo")
+# "python" and "sql" compute ELO only, so other engines process in "batch"
+ELO_PROCESSING_MODE = os.getenv("ELO_PROCESSING_MODE") or (
+    "python" if RATING_ENGINE == "elo" else "batch"
+)
+if RATING_ENGINE != "elo" and ELO_PROCESSING_MODE != "batch":
+    raise ValueError(
+        f"ELO_PROCESSING_MODE={ELO_PROCESSING_MODE} only supports RATING_ENGINE=elo"
+    )
+# Where the leaderboard cache persists its standings for warm restarts
+LEADERBOARD_SNAPSHOT_PATH = os.getenv("LEADERBOARD_SNAPSHOT_PATH") or None
+# Memory-mapped ratings, ranks and roles shared by all workers
+RATING_SNAPSHOT_PATH = os.getenv("RATING_SNAPSHOT_PATH") or None
+# Share of contest runs traced (0 disables tracing); spans go to the JSON-lines
+# file when set, otherwise to an in-memory buffer of the last spans
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH") or None
+TRACE_BUFFER_SPANS = int(os.getenv("TRACE_BUFFER_SPANS", "10000"))
+LEADERBOARD_FEED_TICK = float(os.getenv("LEADERBOARD_FEED_TICK", "1.0"))
+RATE_LIMITS = {
+    name: value for name, value in os.environ.items() if name.startswith("RATE_LIMIT_")
+}
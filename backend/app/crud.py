@@ -1,14 +1,36 @@
 from datetime import datetime, timezone
 
 from fastapi import HTTPException
-from sqlalchemy import desc, func, exists
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    and_,
+    bindparam,
+    case,
+    delete,
+    desc,
+    exists,
+    func,
+    insert,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload, selectinload
 
-from . import models, schemas, auth
+from . import config, metrics, models, schemas, auth, tracing
+from .database import SessionLocal
 from .elo_service import ELOService
+from .leaderboard_cache import LeaderboardCache
+from .leaderboard_feed import LeaderboardFeed
+from .rating_distribution import QUANTILES
+from .rating_engine import get_rating_engine
+from .rating_snapshot import RatingSnapshotReader, write_rating_snapshot
 from .models import contest_participants
 
 elo_service = ELOService()
+rating_engine = get_rating_engine(config.RATING_ENGINE)
+
+LEADERBOARD_SNAPSHOT_SIZE = 100  # Covers the senior and reserve Watson ranks
 
 
 def get_user(db: Session, user_id: int):
@@ -23,6 +45,55 @@ def get_users(db: Session, skip: int = 0, limit: int = 10):
     return db.query(models.User).offset(skip).limit(limit).all()
 
 
+def get_rating_timeline(db: Session, user_id: int):
+    return (
+        db.query(models.RatingPoint)
+        .filter(models.RatingPoint.user_id == user_id)
+        .order_by(models.RatingPoint.id)
+        .all()
+    )
+
+
+def get_rating_at_contest(db: Session, user_id: int, contest_id: int):
+    point = (
+        db.query(models.RatingPoint)
+        .filter(
+            models.RatingPoint.user_id == user_id,
+            models.RatingPoint.contest_id == contest_id,
+        )
+        .first()
+    )
+    if point:
+        return point
+
+    # The user did not take part: their rating is the last point recorded
+    # before this contest was processed
+    contest_start = (
+        db.query(func.min(models.RatingPoint.id))
+        .filter(models.RatingPoint.contest_id == contest_id)
+        .scalar()
+    )
+    if contest_start is None:
+        raise HTTPException(
+            status_code=404, detail="No rating history found for this contest"
+        )
+
+    previous = (
+        db.query(models.RatingPoint)
+        .filter(
+            models.RatingPoint.user_id == user_id,
+            models.RatingPoint.id < contest_start,
+        )
+        .order_by(desc(models.RatingPoint.id))
+        .first()
+    )
+    return schemas.RatingPoint(
+        contest_id=contest_id,
+        rating=previous.rating if previous else 0,
+        delta=0,
+    )
+
+
 def create_user(db: Session, user: schemas.UserCreate):
     hashed_password = auth.get_password_hash(user.password)
     db_user = models.User(
@@ -40,82 +111,796 @@ def update_elo_points(
     db: Session, user: models.User, contest: models.Contest, elo_change: int
 ):
     models.update_elo_points(user, contest, elo_change, db)
-    db.commit()
-    db.refresh(user)
 
 
-# TODO: optimize this function
-def process_contest_elo(contest_id: int, db: Session):
+PROCESSING_CHUNK_SIZE = 500  # Participants applied per checkpoint commit
+PARTICIPANT_FETCH_SIZE = 100  # Participants fetched per round trip
+# "python" computes each participant in the app, "sql" computes the whole
+# contest inside the database with one INSERT ... SELECT; both are ELO.
+# "batch" rates the whole contest in one call to the configured rating engine.
+PROCESSING_MODES = ("python", "sql", "batch")
+PROCESSING_MODE = config.ELO_PROCESSING_MODE
+
+
+def process_contest_elo(
+    contest_id: int,
+    db: Session,
+    chunk_size: int = PROCESSING_CHUNK_SIZE,
+    mode: str | None = None,
+):
+    mode = mode or PROCESSING_MODE
+    if mode not in PROCESSING_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown processing mode: {mode}")
+    if mode != "batch" and rating_engine.name != "elo":
+        raise HTTPException(
+            status_code=400,
+            detail=f"Processing mode {mode} only supports the elo rating engine",
+        )
+
+    # One trace per run, or part of the caller's (e.g. the request's) trace
+    with tracing.trace("process_contest_elo", contest_id=contest_id, mode=mode):
+        models.take_history_rows_written(db)  # Earlier work on this session
+        outcome = "failed"
+        try:
+            with metrics.timed(metrics.ELO_PROCESSING_SECONDS, mode):
+                participant_ids = run_contest_processing(
+                    contest_id, db, chunk_size, mode
+                )
+            outcome = "completed"
+            return participant_ids
+        finally:
+            metrics.ELO_PROCESSING_RUNS.inc(1, mode, outcome)
+            metrics.ELO_PROCESSING_ROWS.observe(
+                models.take_history_rows_written(db), mode
+            )
+
+
+def run_contest_processing(contest_id: int, db: Session, chunk_size: int, mode: str):
     contest = db.query(models.Contest).filter(models.Contest.id == contest_id).first()
     if not contest:
         raise HTTPException(status_code=404, detail="Contest not found")
 
-    participants = contest.participants
+    ledger = db.get(models.ContestProcessing, contest_id)
+    if ledger is not None and ledger.status == models.PROCESSING_COMPLETED:
+        return []
+
+    with tracing.span("load_participants") as span:
+        participant_ids = [
+            user_id
+            for (user_id,) in db.query(contest_participants.c.user_id)
+            .filter(contest_participants.c.contest_id == contest_id)
+            .order_by(contest_participants.c.user_id)
+        ]
+        span.set(rows=len(participant_ids))
+    if not participant_ids:
+        raise HTTPException(
+            status_code=400, detail="No participants found for this contest"
+        )
+
+    if mode == "sql":
+        ledger = get_processing_ledger(contest_id, db)
+        with tracing.span("claim_rating_versions"):
+            claim_rating_versions(contest_id, db)
+        with tracing.span("apply_results_sql"):
+            apply_contest_results_sql(contest_id, db)
+        complete_contest_processing(ledger, db)
+        with tracing.span("commit"):
+            db.commit()
+        return participant_ids
+
+    if mode == "batch":
+        retry_on_rating_conflict(lambda: process_contest_batch(contest_id, db), db)
+        return participant_ids
+
+    # Walk the participants one chunk at a time so memory stays flat however
+    # large the contest is; each chunk is a checkpoint a retry resumes from.
+    # Rating changes are buffered and written in bulk when a chunk commits.
+    last_user_id = 0
+    while True:
+        last_user_id, finished = retry_on_rating_conflict(
+            lambda: process_contest_chunk(contest, last_user_id, chunk_size, db), db
+        )
+        if finished:
+            return participant_ids
+
+
+RATING_CONFLICT_RETRIES = 3
+
+
+def retry_on_rating_conflict(work, db: Session):
+    # work() has to commit; when another transaction changed a rating it read
+    # in the meantime, everything since the last commit is recomputed
+    for _ in range(RATING_CONFLICT_RETRIES + 1):
+        try:
+            return work()
+        except models.RatingConflict as e:
+            db.rollback()
+            conflict = e
+
+    raise HTTPException(status_code=409, detail=str(conflict))
+
+
+def insert_ignoring_conflicts(model, db: Session):
+    # INSERT that skips rows whose key already exists, on PostgreSQL and SQLite
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model).on_conflict_do_nothing()
+    return sqlite.insert(model).on_conflict_do_nothing()
+
+
+def get_processing_ledger(contest_id: int, db: Session):
+    ledger = db.get(models.ContestProcessing, contest_id)
+    if ledger is None:
+        ledger = models.ContestProcessing(contest_id=contest_id)
+        db.add(ledger)
+    return ledger
+
+
+def process_contest_chunk(
+    contest: models.Contest, after_user_id: int, chunk_size: int, db: Session
+):
+    ledger = get_processing_ledger(contest.id, db)
+
+    processed = []
+    with tracing.span("apply_results", after_user_id=after_user_id) as span:
+        # Users are applied as their rows arrive from the cursor
+        for user in pending_participants(contest.id, after_user_id, chunk_size, db):
+            apply_contest_result(user, contest, db)
+            processed.append(user)
+        span.set(rows=len(processed))
+
+    last_user_id = after_user_id
+    if processed:
+        last_user_id = processed[-1].id
+        db.execute(
+            insert(models.ContestProcessingEntry),
+            [{"contest_id": contest.id, "user_id": user.id} for user in processed],
+        )
+        for user in processed:
+            db.expunge(user)
+
+    finished = len(processed) < chunk_size
+    if finished:
+        complete_contest_processing(ledger, db)
+
+    # Buffered rating changes are written here, see EloHistoryWriter.flush
+    with tracing.span("commit"):
+        db.commit()
+    return last_user_id, finished
+
+
+def process_contest_batch(contest_id: int, db: Session):
+    ledger = get_processing_ledger(contest_id, db)
+    with tracing.span("load_participants") as span:
+        participants = contest_participant_rows(contest_id, db)
+        span.set(rows=len(participants))
+    rate_participants(contest_id, participants, db)
+    complete_contest_processing(ledger, db)
+    with tracing.span("commit"):
+        db.commit()
+
+
+def contest_participant_rows(contest_id: int, db: Session):
+    # One row per participant with everything the batch pipelines need:
+    # id, role, rating_version, signup_date, rating before this contest and
+    # whether a partial run already applied them
+    participant_ids = select(contest_participants.c.user_id).where(
+        contest_participants.c.contest_id == contest_id
+    )
+    ratings = (
+        select(
+            models.EloHistory.user_id,
+            func.sum(
+                models.EloHistory.elo_points_after - models.EloHistory.elo_points_before
+            ).label("rating"),
+        )
+        .where(
+            models.EloHistory.user_id.in_(participant_ids),
+            # Leaves out what a partial run already applied for this contest
+            or_(
+                models.EloHistory.contest_id.is_(None),
+                models.EloHistory.contest_id != contest_id,
+            ),
+        )
+        .group_by(models.EloHistory.user_id)
+        .subquery()
+    )
+    participants = db.execute(
+        select(
+            models.User.id,
+            models.User.role,
+            models.User.rating_version,
+            contest_participants.c.signup_date,
+            func.coalesce(ratings.c.rating, 0).label("rating"),
+            models.ContestProcessingEntry.user_id.is_not(None).label("applied"),
+        )
+        .select_from(contest_participants)
+        .join(models.User, models.User.id == contest_participants.c.user_id)
+        .outerjoin(ratings, ratings.c.user_id == models.User.id)
+        .outerjoin(
+            models.ContestProcessingEntry,
+            and_(
+                models.ContestProcessingEntry.contest_id == contest_id,
+                models.ContestProcessingEntry.user_id == models.User.id,
+            ),
+        )
+        .where(contest_participants.c.contest_id == contest_id)
+        .order_by(models.User.id)
+    ).all()
     if not participants:
         raise HTTPException(
             status_code=400, detail="No participants found for this contest"
         )
+    return participants
+
+
+def rate_participants(contest_id: int, participants, db: Session):
+    # Rates the whole field with the configured engine, as every participant
+    # affects the others' results (field average, pairwise scores), and
+    # buffers the results of those a partial run has not applied yet; the
+    # caller completes the ledger and commits
+    pending = [row for row in participants if not row.applied]
+    pending_ids = {row.id for row in pending}
+    writer = models.get_history_writer(db)
+    for row in pending:
+        writer.observe(row.id, row.rating_version)
+    contest_input = elo_service.load_contest_input(
+        contest_id,
+        ratings={row.id: row.rating for row in participants},
+        roles={row.id: row.role for row in participants},
+        session=db,
+        deviations=rating_engine.tracks_deviation,
+    )
+    before = dict(contest_input.deviations)
+    if rating_engine.tracks_deviation and len(pending) < len(participants):
+        # Applied participants' deviations were already updated by this contest
+        for user_id, deviation, volatility in db.execute(
+            select(
+                models.ContestProcessingEntry.user_id,
+                models.ContestProcessingEntry.deviation_before,
+                models.ContestProcessingEntry.volatility_before,
+            ).where(models.ContestProcessingEntry.contest_id == contest_id)
+        ):
+            if deviation is None:
+                contest_input.deviations.pop(user_id, None)
+            else:
+                contest_input.deviations[user_id] = (deviation, volatility)
+    with tracing.span("rate_contest", engine=rating_engine.name) as span:
+        changes = rating_engine.rate_contest(contest_input)
+        span.set(rows=len(changes))
+    changes = [change for change in changes if change.user_id in pending_ids]
+    for change in changes:
+        models.add_elo_history(
+            db,
+            change.user_id,
+            contest_id,
+            change.elo_points_before,
+            change.elo_points_after,
+            change.change_reason,
+        )
+    if rating_engine.tracks_deviation:
+        with tracing.span("save_rating_deviations", rows=len(changes)):
+            save_rating_deviations(changes, db)
+
+    if pending:
+        db.execute(
+            insert(models.ContestProcessingEntry),
+            [
+                {
+                    "contest_id": contest_id,
+                    "user_id": row.id,
+                    "deviation_before": before.get(row.id, (None, None))[0],
+                    "volatility_before": before.get(row.id, (None, None))[1],
+                }
+                for row in pending
+            ],
+        )
 
-    processed_participants = []
 
-    for user in participants:
-        reported_bugs = (
-            db.query(models.BugReport)
-            .filter(
-                models.BugReport.user_id == user.id,
-                models.BugReport.contest_id == contest_id,
+def save_rating_deviations(changes, db: Session):
+    user_ids = [change.user_id for change in changes]
+    for start in range(0, len(user_ids), models.RATING_CAS_CHUNK_SIZE):
+        db.execute(
+            delete(models.RatingDeviation).where(
+                models.RatingDeviation.user_id.in_(
+                    user_ids[start : start + models.RATING_CAS_CHUNK_SIZE]
+                )
             )
-            .all()
         )
+    if changes:
+        db.execute(
+            insert(models.RatingDeviation),
+            [
+                {
+                    "user_id": change.user_id,
+                    "deviation": change.deviation,
+                    "volatility": change.volatility,
+                }
+                for change in changes
+            ],
+        )
+
+
+def complete_contest_processing(ledger: models.ContestProcessing, db: Session):
+    ledger.status = models.PROCESSING_COMPLETED
+    ledger.completed_at = datetime.now(timezone.utc)
+    with tracing.span("leaderboard_snapshot"):
+        save_leaderboard_snapshot(ledger.contest_id, db)
+    with tracing.span("contest_stats"):
+        save_contest_stats(ledger.contest_id, db)
+    # Readers keep the cached leaderboard until this commit lands
+    leaderboard_cache.mark_dirty(db)
 
-        if reported_bugs:
-            elo_change = elo_service.calculate_elo_change(
-                user, contest, reported_bugs, db
+
+def claim_rating_versions(contest_id: int, db: Session):
+    # SQL mode reads and writes ratings in one statement, so it takes the
+    # participants' rating rows up front instead of comparing-and-swapping:
+    # concurrent runs touching the same users wait for each other here.
+    # Participants already applied are not re-rated and are left alone.
+    db.execute(
+        update(models.User)
+        .where(
+            models.User.id.in_(
+                select(contest_participants.c.user_id).where(
+                    contest_participants.c.contest_id == contest_id,
+                    ~exists().where(
+                        models.ContestProcessingEntry.contest_id == contest_id,
+                        models.ContestProcessingEntry.user_id
+                        == contest_participants.c.user_id,
+                    ),
+                )
             )
-            update_elo_points(db, user, contest, elo_change)
-        else:
-            elo_service.apply_participation_penalty(user, contest, db)
+        )
+        .values(rating_version=models.User.rating_version + 1)
+        .execution_options(synchronize_session=False)
+    )
 
-        processed_participants.append(user)
 
-    db.commit()
+def apply_contest_results_sql(contest_id: int, db: Session):
+    not_applied = ~exists().where(
+        models.ContestProcessingEntry.contest_id == contest_id,
+        models.ContestProcessingEntry.user_id == models.EloHistory.user_id,
+    )
 
-    return processed_participants
+    result = db.execute(
+        insert(models.EloHistory).from_select(
+            [
+                "user_id",
+                "contest_id",
+                "elo_points_before",
+                "elo_points_after",
+                "change_reason",
+            ],
+            elo_service.contest_elo_changes_query(contest_id),
+        )
+    )
+    rows = result.rowcount
+    if rows < 0:
+        # SQLite cannot report it for an INSERT starting with WITH
+        rows = db.scalar(
+            select(func.count())
+            .select_from(models.EloHistory)
+            .where(models.EloHistory.contest_id == contest_id, not_applied)
+        )
+    models.count_history_rows(db, rows)
+    db.execute(
+        insert(models.RatingPoint).from_select(
+            ["user_id", "contest_id", "rating", "delta"],
+            select(
+                models.EloHistory.user_id,
+                models.EloHistory.contest_id,
+                models.EloHistory.elo_points_after,
+                models.EloHistory.elo_points_after
+                - models.EloHistory.elo_points_before,
+            ).where(models.EloHistory.contest_id == contest_id, not_applied),
+        )
+    )
+    db.execute(
+        insert(models.ContestProcessingEntry).from_select(
+            ["contest_id", "user_id"],
+            select(
+                contest_participants.c.contest_id, contest_participants.c.user_id
+            ).where(
+                contest_participants.c.contest_id == contest_id,
+                ~exists().where(
+                    models.ContestProcessingEntry.contest_id == contest_id,
+                    models.ContestProcessingEntry.user_id
+                    == contest_participants.c.user_id,
+                ),
+            ),
+        )
+    )
 
 
-def update_user_roles(users_to_update: list[models.User], db: Session):
-    leaderboard = (
+def pending_participants(
+    contest_id: int, after_user_id: int, chunk_size: int, db: Session
+):
+    # Keyset page of participants not yet in the ledger, streamed from the
+    # cursor PARTICIPANT_FETCH_SIZE users at a time; paging (rather than one
+    # long cursor) allows commits in between
+    return (
         db.query(models.User)
+        .join(contest_participants, contest_participants.c.user_id == models.User.id)
+        .outerjoin(
+            models.ContestProcessingEntry,
+            and_(
+                models.ContestProcessingEntry.contest_id == contest_id,
+                models.ContestProcessingEntry.user_id == models.User.id,
+            ),
+        )
+        .filter(
+            contest_participants.c.contest_id == contest_id,
+            models.User.id > after_user_id,
+            models.ContestProcessingEntry.user_id.is_(None),
+        )
+        .order_by(models.User.id)
+        .limit(chunk_size)
+        # Each fetched batch's reports for this contest, with their bugs, in
+        # one more query; populate_existing replaces collections loaded
+        # without the contest filter
+        .options(
+            selectinload(
+                models.User.reported_bugs.and_(
+                    models.BugReport.contest_id == contest_id
+                )
+            ).joinedload(models.BugReport.bug)
+        )
+        .populate_existing()
+        .yield_per(PARTICIPANT_FETCH_SIZE)
+    )
+
+
+def apply_contest_result(user: models.User, contest: models.Contest, db: Session):
+    # Loaded for this contest only, by pending_participants
+    reported_bugs = user.reported_bugs
+
+    if reported_bugs:
+        elo_change = elo_service.calculate_elo_change(user, contest, reported_bugs, db)
+        update_elo_points(db, user, contest, elo_change)
+    else:
+        elo_service.apply_participation_penalty(user, contest, db)
+
+
+def get_leaderboard(db: Session, limit: int | None = LEADERBOARD_SNAPSHOT_SIZE):
+    rating = func.sum(
+        models.EloHistory.elo_points_after - models.EloHistory.elo_points_before
+    )
+    return (
+        db.query(models.EloHistory.user_id, rating.label("rating"))
+        .group_by(models.EloHistory.user_id)
+        .order_by(desc(rating), models.EloHistory.user_id)
+        .limit(limit)
+        .all()
+    )
+
+
+leaderboard_cache = LeaderboardCache(
+    SessionLocal,
+    loader=lambda db: get_leaderboard(db, limit=None),
+    snapshot_path=config.LEADERBOARD_SNAPSHOT_PATH,
+    # Other workers' commits show up as a new rating snapshot generation
+    generation_source=(
+        (lambda: rating_snapshot.generation) if config.RATING_SNAPSHOT_PATH else None
+    ),
+)
+leaderboard_feed = LeaderboardFeed(
+    leaderboard_cache,
+    tick=config.LEADERBOARD_FEED_TICK,
+    size=LEADERBOARD_SNAPSHOT_SIZE,
+)
+
+
+rating_snapshot = (
+    RatingSnapshotReader(config.RATING_SNAPSHOT_PATH)
+    if config.RATING_SNAPSHOT_PATH
+    else None
+)
+
+
+def publish_rating_snapshot(db: Session):
+    # Called by the worker that committed new ratings or roles; the other
+    # workers pick the new file up on their next lookup
+    if not config.RATING_SNAPSHOT_PATH:
+        return None
+    generation = write_rating_snapshot(
+        config.RATING_SNAPSHOT_PATH,
+        db.query(models.User.id, models.User.role),
+        get_leaderboard(db, limit=None),
+    )
+    leaderboard_cache.published(generation)
+    return generation
+
+
+@metrics.registry.collected(
+    "leaderboard_cache_lookups_total",
+    "Leaderboard cache lookups served from the current standings or rebuilt",
+    "counter",
+    ("result",),
+)
+def _leaderboard_cache_lookups():
+    stats = leaderboard_cache.stats()
+    yield ("hit",), stats["hits"]
+    yield ("miss",), stats["misses"]
+
+
+@metrics.registry.collected(
+    "leaderboard_cache_hit_ratio", "Share of leaderboard cache lookups hit", "gauge"
+)
+def _leaderboard_cache_hit_ratio():
+    yield (), leaderboard_cache.stats()["hit_rate"]
+
+
+def get_user_rating(db: Session, user_id: int):
+    if rating_snapshot is not None:
+        record = rating_snapshot.get(user_id)
+        metrics.RATING_SNAPSHOT_LOOKUPS.inc(1, "miss" if record is None else "hit")
+        if record is not None:
+            return schemas.UserRating(user_id=user_id, **record._asdict())
+
+    # Not published yet (or no snapshot configured): ask the database
+    user = get_user(db, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    standing = leaderboard_cache.get().get(user_id)
+    return schemas.UserRating(
+        user_id=user_id,
+        rating=models.calculate_current_elo(user_id, db),
+        rank=standing.rank if standing else None,
+        role=user.role,
+        generation=0,
+    )
+
+
+def get_rating_stats(bins: int):
+    # Served from the cached standings' sorted ratings, never from elo_history
+    standings = leaderboard_cache.get()
+    distribution = standings.distribution
+    return schemas.RatingStats(
+        rated_users=len(distribution),
+        generation=standings.generation,
+        quantiles=(
+            [
+                schemas.RatingQuantile(quantile=q, rating=distribution.quantile(q))
+                for q in QUANTILES
+            ]
+            if distribution
+            else []
+        ),
+        histogram=[entry._asdict() for entry in distribution.histogram(bins)],
+    )
+
+
+def get_user_percentile(db: Session, user_id: int):
+    standings = leaderboard_cache.get()
+    distribution = standings.distribution
+    standing = standings.get(user_id)
+    if standing is None:
+        if get_user(db, user_id) is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        rating = percentile = top_percent = None
+    else:
+        rating = standing.rating
+        percentile = distribution.percentile(rating)
+        top_percent = distribution.top_percent(rating)
+    return schemas.UserPercentile(
+        user_id=user_id,
+        rating=rating,
+        percentile=percentile,
+        top_percent=top_percent,
+        rated_users=len(distribution),
+        generation=standings.generation,
+    )
+
+
+def save_leaderboard_snapshot(contest_id: int, db: Session):
+    # The snapshot has to include rating changes still buffered in this
+    # transaction
+    models.flush_elo_history(db)
+    leaderboard = get_leaderboard(db, LEADERBOARD_SNAPSHOT_SIZE)
+
+    # Reprocessing a contest replaces its snapshot
+    db.query(models.LeaderboardSnapshot).filter(
+        models.LeaderboardSnapshot.contest_id == contest_id
+    ).delete(synchronize_session=False)
+
+    if leaderboard:
+        db.execute(
+            insert(models.LeaderboardSnapshot),
+            [
+                {
+                    "contest_id": contest_id,
+                    "rank": rank,
+                    "user_id": user_id,
+                    "rating": rating,
+                }
+                for rank, (user_id, rating) in enumerate(leaderboard, start=1)
+            ],
+        )
+
+
+def get_leaderboard_snapshot(
+    db: Session, contest_id: int, limit: int = LEADERBOARD_SNAPSHOT_SIZE
+):
+    snapshot = (
+        db.query(models.LeaderboardSnapshot)
+        .filter(models.LeaderboardSnapshot.contest_id == contest_id)
+        .order_by(models.LeaderboardSnapshot.rank)
+        .limit(limit)
+        .all()
+    )
+    if snapshot:
+        return snapshot
+
+    contest = db.query(models.Contest).filter(models.Contest.id == contest_id).first()
+    if not contest:
+        raise HTTPException(status_code=404, detail="Contest not found")
+    raise HTTPException(
+        status_code=404, detail="No leaderboard snapshot found for this contest"
+    )
+
+
+def save_contest_stats(contest_id: int, db: Session):
+    # Two grouped queries, one over the contest's bugs and one over its
+    # participants, instead of one aggregate per figure on every page view.
+    # Rating changes must have been flushed (save_leaderboard_snapshot does).
+    reports_per_bug = (
+        select(models.Bug.severity, func.count(models.BugReport.id).label("reports"))
+        .outerjoin(models.BugReport, models.BugReport.bug_id == models.Bug.id)
+        .where(models.Bug.contest_id == contest_id)
+        .group_by(models.Bug.id)
+        .subquery()
+    )
+    bugs = {
+        severity: (count, reports or 0, duplicates or 0)
+        for severity, count, reports, duplicates in db.execute(
+            select(
+                reports_per_bug.c.severity,
+                func.count(),
+                func.sum(reports_per_bug.c.reports),
+                func.sum(
+                    case(
+                        (reports_per_bug.c.reports > 1, reports_per_bug.c.reports - 1),
+                        else_=0,
+                    )
+                ),
+            ).group_by(reports_per_bug.c.severity)
+        )
+    }
+
+    reports_per_user = (
+        select(models.BugReport.user_id)
+        .where(models.BugReport.contest_id == contest_id)
+        .group_by(models.BugReport.user_id)
+        .subquery()
+    )
+    delta_per_user = (
+        select(
+            models.EloHistory.user_id,
+            func.sum(
+                models.EloHistory.elo_points_after - models.EloHistory.elo_points_before
+            ).label("delta"),
+        )
+        .where(models.EloHistory.contest_id == contest_id)
+        .group_by(models.EloHistory.user_id)
+        .subquery()
+    )
+    participants, without_findings, average_delta = db.execute(
+        select(
+            func.count(),
+            func.count() - func.count(reports_per_user.c.user_id),
+            func.avg(func.coalesce(delta_per_user.c.delta, 0)),
+        )
+        .select_from(contest_participants)
+        .outerjoin(
+            reports_per_user,
+            reports_per_user.c.user_id == contest_participants.c.user_id,
+        )
+        .outerjoin(
+            delta_per_user, delta_per_user.c.user_id == contest_participants.c.user_id
+        )
+        .where(contest_participants.c.contest_id == contest_id)
+    ).one()
+
+    db.query(models.ContestStats).filter(
+        models.ContestStats.contest_id == contest_id
+    ).delete(synchronize_session=False)
+    no_bugs = (0, 0, 0)
+    db.add(
+        models.ContestStats(
+            contest_id=contest_id,
+            participants=participants,
+            participants_without_findings=without_findings,
+            medium_bugs=bugs.get(models.BugSeverity.MEDIUM, no_bugs)[0],
+            high_bugs=bugs.get(models.BugSeverity.HIGH, no_bugs)[0],
+            critical_bugs=bugs.get(models.BugSeverity.CRITICAL, no_bugs)[0],
+            reports=sum(reports for _, reports, _ in bugs.values()),
+            duplicate_reports=sum(duplicates for _, _, duplicates in bugs.values()),
+            average_rating_delta=float(average_delta or 0),
+        )
+    )
+
+
+def get_contest_stats(db: Session, contest_id: int):
+    stats = db.get(models.ContestStats, contest_id)
+    if stats is None:
+        if db.get(models.Contest, contest_id) is None:
+            raise HTTPException(status_code=404, detail="Contest not found")
+        raise HTTPException(status_code=404, detail="No stats found for this contest")
+    return schemas.ContestStats(
+        contest_id=contest_id,
+        participants=stats.participants,
+        participants_without_findings=stats.participants_without_findings,
+        bugs={
+            models.BugSeverity.MEDIUM.value: stats.medium_bugs,
+            models.BugSeverity.HIGH.value: stats.high_bugs,
+            models.BugSeverity.CRITICAL.value: stats.critical_bugs,
+        },
+        reports=stats.reports,
+        duplicate_reports=stats.duplicate_reports,
+        duplicate_ratio=(
+            stats.duplicate_reports / stats.reports if stats.reports else 0.0
+        ),
+        average_rating_delta=stats.average_rating_delta,
+        computed_at=stats.computed_at,
+    )
+
+
+SENIOR_WATSON_RANKS = 30  # Top 1-30
+RESERVE_WATSON_RANKS = 100  # Top 31-100
+
+
+def get_role_tiers(db: Session):
+    leaderboard = (
+        db.query(models.User.id)
         .join(models.EloHistory)
         .group_by(models.User.id)
         .order_by(desc(func.sum(models.EloHistory.elo_points_after)))
-        .limit(100)
+        .limit(RESERVE_WATSON_RANKS)
         .all()
     )
 
-    senior_watsons = set([user.id for user in leaderboard[:30]])  # Top 1-30
-    reserve_watsons = set([user.id for user in leaderboard[30:100]])  # Top 31-100
+    senior_watsons = set([user_id for (user_id,) in leaderboard[:SENIOR_WATSON_RANKS]])
+    reserve_watsons = set(
+        [
+            user_id
+            for (user_id,) in leaderboard[SENIOR_WATSON_RANKS:RESERVE_WATSON_RANKS]
+        ]
+    )
+    return senior_watsons, reserve_watsons
 
-    users_to_update_roles = []
 
-    for user in users_to_update:
-        current_role = user.role
-        if user.id in senior_watsons:
-            new_role = "senior_watson"
-        elif user.id in reserve_watsons:
-            new_role = "reserve_watson"
-        else:
-            new_role = "watson"
+def role_for(user_id: int, tiers) -> str:
+    senior_watsons, reserve_watsons = tiers
+    if user_id in senior_watsons:
+        return "senior_watson"
+    if user_id in reserve_watsons:
+        return "reserve_watson"
+    return "watson"
 
-        if current_role != new_role:
-            user.role = new_role
-            users_to_update_roles.append(user)
 
-    if users_to_update_roles:
-        db.bulk_save_objects(users_to_update_roles)
-        db.commit()
+def update_user_roles(
+    user_ids: list[int], db: Session, chunk_size: int = PROCESSING_CHUNK_SIZE
+):
+    with tracing.trace("update_user_roles", rows=len(user_ids)) as span:
+        with tracing.span("role_tiers"):
+            tiers = get_role_tiers(db)
+
+        role_changes = []
+
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start : start + chunk_size]
+            for user_id, current_role in db.query(
+                models.User.id, models.User.role
+            ).filter(models.User.id.in_(chunk)):
+                new_role = role_for(user_id, tiers)
+                if current_role != new_role:
+                    role_changes.append({"id": user_id, "role": new_role})
+
+        span.set(changed=len(role_changes))
+        if role_changes:
+            db.execute(update(models.User), role_changes)
+            db.commit()
 
-    return users_to_update_roles
+        return [change["id"] for change in role_changes]
 
 
 def signup_for_contest(user_id: int, contest_id: int, db: Session):
@@ -156,7 +941,7 @@ def signup_for_contest(user_id: int, contest_id: int, db: Session):
     db.commit()
 
 
-def process_participation_days(contest_id: int, db: Session):
+def get_ended_contest(contest_id: int, db: Session):
     contest = db.query(models.Contest).filter(models.Contest.id == contest_id).first()
     if not contest:
         raise HTTPException(status_code=404, detail="Contest not found")
@@ -169,30 +954,180 @@ def process_participation_days(contest_id: int, db: Session):
     if end_date > now:
         raise HTTPException(status_code=400, detail="Contest is still running")
 
-    for user in contest.participants:
-        signup_record = (
-            db.query(contest_participants)
-            .filter(
-                contest_participants.c.user_id == user.id,
-                contest_participants.c.contest_id == contest_id,
-            )
-            .first()
+    return contest, end_date
+
+
+def count_participation_days(user_id: int, end_date: datetime, signup_date):
+    if signup_date is None:
+        raise HTTPException(
+            status_code=400, detail=f"Signup date not found for user {user_id}"
         )
 
-        if signup_record is None or signup_record.signup_date is None:
-            raise HTTPException(
-                status_code=400, detail=f"Signup date not found for user {user.id}"
+    if signup_date.tzinfo is None:
+        signup_date = signup_date.replace(tzinfo=timezone.utc)
+
+    participation_days = (end_date - signup_date).days + 1
+    if participation_days < 0:
+        participation_days = 0
+    return participation_days
+
+
+def process_participation_days(contest_id: int, db: Session) -> bool:
+    # Adds each participant's days once per contest; False when they were
+    # already added here or by close
+    _, end_date = get_ended_contest(contest_id, db)
+
+    # Claimed with a conditional UPDATE, so of two concurrent calls only one
+    # adds the days; the other waits on the row and then matches nothing
+    now = datetime.now(timezone.utc)
+    claimed = db.execute(
+        update(models.ContestProcessing)
+        .where(
+            models.ContestProcessing.contest_id == contest_id,
+            models.ContestProcessing.participation_days_applied_at.is_(None),
+            models.ContestProcessing.closed_at.is_(None),
+        )
+        .values(participation_days_applied_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        # No ledger yet: creating it claims the contest, unless a concurrent
+        # call created it first
+        claimed = db.execute(
+            insert_ignoring_conflicts(models.ContestProcessing, db).values(
+                contest_id=contest_id, participation_days_applied_at=now
             )
+        ).rowcount
+    if not claimed:
+        db.rollback()
+        return False
 
-        signup_date = signup_record.signup_date
-        if signup_date.tzinfo is None:
-            signup_date = signup_date.replace(tzinfo=timezone.utc)
+    participants = db.execute(
+        select(
+            contest_participants.c.user_id, contest_participants.c.signup_date
+        ).where(contest_participants.c.contest_id == contest_id)
+    ).all()
+    if participants:
+        # Added in the database, as close does, so concurrent updates of the
+        # same users are not lost
+        db.execute(
+            update(models.User.__table__)
+            .where(models.User.id == bindparam("user_id"))
+            .values(
+                participation_days=func.coalesce(models.User.participation_days, 0)
+                + bindparam("days")
+            ),
+            [
+                {
+                    "user_id": user_id,
+                    "days": count_participation_days(user_id, end_date, signup_date),
+                }
+                for user_id, signup_date in participants
+            ],
+        )
+
+    db.commit()
+    return True
 
-        participation_days = (end_date - signup_date).days + 1
-        if participation_days < 0:
-            participation_days = 0
 
-        user.participation_days += participation_days
-        db.add(user)
+def finish_contest_processing(
+    contest_id: int, db: Session, participant_ids: list[int] | None = None
+) -> bool:
+    # Role update and rating snapshot after a contest's ratings completed.
+    # Each step is recorded in the ledger, so a run that stopped after the
+    # last rating commit finishes them on retry. False when nothing was left.
+    ledger = db.get(models.ContestProcessing, contest_id)
+    if ledger is None or ledger.status != models.PROCESSING_COMPLETED:
+        return False
 
+    finished = False
+    if ledger.roles_applied_at is None:
+        if not participant_ids:
+            participant_ids = [
+                user_id
+                for (user_id,) in db.query(contest_participants.c.user_id)
+                .filter(contest_participants.c.contest_id == contest_id)
+                .order_by(contest_participants.c.user_id)
+            ]
+        ledger.roles_applied_at = datetime.now(timezone.utc)
+        update_user_roles(participant_ids, db)
+        db.commit()
+        finished = True
+
+    if ledger.snapshot_published_at is None:
+        with tracing.span("publish_rating_snapshot"):
+            publish_rating_snapshot(db)
+        ledger.snapshot_published_at = datetime.now(timezone.utc)
+        db.commit()
+        finished = True
+
+    return finished
+
+
+def close_contest(contest_id: int, db: Session):
+    with tracing.trace("close_contest", contest_id=contest_id):
+        closed = retry_on_rating_conflict(
+            lambda: apply_contest_close(contest_id, db), db
+        )
+        # Publishes the snapshot, also when an earlier close stopped before it
+        finish_contest_processing(contest_id, db)
+        return closed
+
+
+def apply_contest_close(contest_id: int, db: Session):
+    # Fused end-of-contest pipeline: one scan of the participants feeds the
+    # rating changes, new roles and participation days, and everything lands
+    # in a single commit. The number of statements does not grow with the
+    # number of participants.
+    contest, end_date = get_ended_contest(contest_id, db)
+
+    ledger = db.get(models.ContestProcessing, contest_id)
+    if ledger is not None and ledger.closed_at is not None:
+        return False
+
+    participants = contest_participant_rows(contest_id, db)
+
+    participation_days = {
+        row.id: count_participation_days(row.id, end_date, row.signup_date)
+        for row in participants
+    }
+
+    ledger = get_processing_ledger(contest_id, db)
+
+    if ledger.status != models.PROCESSING_COMPLETED:
+        # Participants a partial process_elo run already applied keep their rows
+        rate_participants(contest_id, participants, db)
+        complete_contest_processing(ledger, db)
+
+    # Roles are ranked on ratings including this contest's buffered changes
+    models.flush_elo_history(db)
+    tiers = get_role_tiers(db)
+    if ledger.participation_days_applied_at is not None:
+        # Already added by process_participation_days
+        participation_days = dict.fromkeys(participation_days, 0)
+    # Days are added in the database so a concurrent close of another contest
+    # cannot overwrite them
+    db.execute(
+        update(models.User.__table__)
+        .where(models.User.id == bindparam("user_id"))
+        .values(
+            role=bindparam("role"),
+            participation_days=func.coalesce(models.User.participation_days, 0)
+            + bindparam("days"),
+        ),
+        [
+            {
+                "user_id": row.id,
+                "role": role_for(row.id, tiers),
+                "days": participation_days[row.id],
+            }
+            for row in participants
+        ],
+    )
+
+    now = datetime.now(timezone.utc)
+    ledger.closed_at = ledger.roles_applied_at = now
+    if ledger.participation_days_applied_at is None:
+        ledger.participation_days_applied_at = now
     db.commit()
+    return True
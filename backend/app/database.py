@@ -1,13 +1,136 @@
-import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, declarative_base, raiseload, sessionmaker
 
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from . import config, metrics
 
-load_dotenv()
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
 
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+_engine = None
+_read_engine = None
+_batch_engine = None
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_size=10, max_overflow=20)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def get_engine():
+    # Built on first use, so importing the app does not open a pool
+    global _engine
+    if _engine is None:
+        _engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_size=10, max_overflow=20)
+    return _engine
+
+
+def get_read_engine():
+    # Replica for read-only traffic, with its own pool; the primary when no
+    # READ_DATABASE_URL is configured
+    global _read_engine
+    if config.READ_DATABASE_URL is None:
+        return get_engine()
+    if _read_engine is None:
+        _read_engine = create_engine(
+            config.READ_DATABASE_URL, pool_size=10, max_overflow=20
+        )
+    return _read_engine
+
+
+def get_batch_engine():
+    # Primary database, own small pool: admin jobs queue for these
+    # connections instead of draining the ones interactive requests use
+    global _batch_engine
+    if _batch_engine is None:
+        _batch_engine = create_engine(
+            SQLALCHEMY_DATABASE_URL, pool_size=config.BATCH_POOL_SIZE, max_overflow=0
+        )
+    return _batch_engine
+
+
+def has_read_replica() -> bool:
+    return config.READ_DATABASE_URL is not None
+
+
+def dispose_engines():
+    for built in (_engine, _read_engine, _batch_engine):
+        if built is not None:
+            built.dispose()
+
+
+@metrics.registry.collected(
+    "db_pool_connections",
+    "Connections per pool: checked out, idle in the pool, and the pool size",
+    "gauge",
+    ("pool", "state"),
+)
+def _pool_connections():
+    # Only pools that have been built; read without taking the pool's lock
+    for name, built in (
+        ("primary", _engine),
+        ("replica", _read_engine),
+        ("batch", _batch_engine),
+    ):
+        pool = built.pool if built is not None else None
+        if not hasattr(pool, "checkedout"):
+            continue
+        yield (name, "checked_out"), pool.checkedout()
+        yield (name, "idle"), pool.checkedin()
+        yield (name, "size"), pool.size()
+
+
+def __getattr__(name):
+    # Keeps `from .database import engine` working without building it at import
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class LazySession(Session):
+    def get_bind(self, mapper=None, **kw):
+        if self.bind is None:
+            return get_engine()
+        return super().get_bind(mapper, **kw)
+
+
+class ReadOnlySessionError(Exception):
+    pass
+
+
+class ReadSession(Session):
+    # Bound to the replica; anything it would write is refused at flush
+    # rather than silently sent to a database that is not the primary
+    def get_bind(self, mapper=None, **kw):
+        if self.bind is None:
+            return get_read_engine()
+        return super().get_bind(mapper, **kw)
+
+    def flush(self, objects=None):
+        if self.new or self.dirty or self.deleted:
+            raise ReadOnlySessionError("Read session cannot write")
+        super().flush(objects)
+
+
+def _raise_on_lazy_load(execute_state):
+    # Applied to every ORM query; the eager loads those queries request run
+    # with the strategies given to them
+    if execute_state.is_relationship_load:
+        # With a do_orm_execute hook installed, selectin loads are executed
+        # with their parent's options, and an inherited yield_per clashes with
+        # the unique() they apply
+        execute_state.update_execution_options(yield_per=None)
+    elif execute_state.is_select and not execute_state.is_column_load:
+        # sql_only: many-to-one targets already in the session still resolve
+        execute_state.statement = execute_state.statement.options(
+            raiseload("*", sql_only=True)
+        )
+
+
+def set_raiseload(enabled: bool):
+    # Debug/test mode: relationships not loaded explicitly with
+    # selectinload/joinedload raise on access instead of issuing a query each
+    if enabled and not event.contains(Session, "do_orm_execute", _raise_on_lazy_load):
+        event.listen(Session, "do_orm_execute", _raise_on_lazy_load)
+    elif not enabled and event.contains(Session, "do_orm_execute", _raise_on_lazy_load):
+        event.remove(Session, "do_orm_execute", _raise_on_lazy_load)
+
+
+set_raiseload(config.ORM_RAISELOAD)
+
+SessionLocal = sessionmaker(class_=LazySession, autocommit=False, autoflush=False)
+ReadSessionLocal = sessionmaker(class_=ReadSession, autocommit=False, autoflush=False)
 Base = declarative_base()
@@ -1,14 +1,71 @@
 import math
+from dataclasses import dataclass, field
+
+from sqlalchemy import Float, Integer, and_, case, cast, exists, func, literal, select
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Session
-from ..app.models import calculate_current_elo, BugReport, EloHistory
+from sqlalchemy.sql.functions import FunctionElement
+
+from ..app.models import (
+    calculate_current_elo,
+    add_elo_history,
+    contest_participants,
+    Bug,
+    BugReport,
+    ContestProcessingEntry,
+    EloHistory,
+    RatingDeviation,
+    User,
+)
+from .rating_engine import RatingChange
+from .tracing import traced
 
 # Constants
 DUPLICATE_PENALTY_MULTIPLIER = 0.1  # All Watsons
 INVALID_REPORT_PENALTY = 10  # All Watsons
 NO_BUGS_FOUND_PENALTY = 20  # Senior / Reserve Watson
+DEFAULT_OPPONENT_ELO = 100
+SEVERITY_WEIGHTS = {"medium": 1.0, "high": 1.5, "critical": 2.0}
+LEAGUE_K_MULTIPLIERS = {"senior_watson": 0.75, "reserve_watson": 0.9}
+
+
+# int() in Python truncates towards zero; so does CAST in SQLite, while
+# PostgreSQL rounds and needs an explicit TRUNC
+class trunc_int(FunctionElement):
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(trunc_int)
+def _compile_trunc_int(element, compiler, **kw):
+    return f"CAST({compiler.process(element.clauses, **kw)} AS INTEGER)"
+
+
+@compiles(trunc_int, "postgresql")
+def _compile_trunc_int_postgresql(element, compiler, **kw):
+    return f"CAST(TRUNC({compiler.process(element.clauses, **kw)}) AS INTEGER)"
+
+
+@dataclass
+class ContestInput:
+    # Everything needed to rate one contest, loaded with a fixed number of
+    # queries however many participants it has
+    contest_id: int
+    ratings: dict[int, int]  # participant -> pre-contest rating
+    roles: dict[int, str]  # participant -> role
+    # reporter -> [(severity, reports of the same bug by other users)]
+    reports: dict[int, list[tuple[str, int]]] = field(default_factory=dict)
+    # reporter -> (sum, count) of pre-contest elo_points_after values
+    reporter_history: dict[int, tuple[int, int]] = field(default_factory=dict)
+    report_count: int = 0
+    # participant -> (deviation, volatility), for engines that track them
+    deviations: dict[int, tuple[float, float]] = field(default_factory=dict)
 
 
 class ELOService:
+    name = "elo"
+    tracks_deviation = False
+
     def __init__(self, k_factor=32):
         self.k_factor = k_factor  # Determines the impact of each game on ELO rating
 
@@ -17,12 +74,19 @@ class ELOService:
         return 1 / (1 + math.pow(10, (opponent_elo - user_elo) / 400))
 
     @staticmethod
+    @traced("elo.opponent_ratings")
     def get_opponent_elos(contest, user_id, session: Session):
+        # Opponents are rated as they stood before this contest, so results do
+        # not depend on processing order and a resumed run matches a clean one
         opponent_elos = (
             session.query(EloHistory.elo_points_after)
             .select_from(BugReport)
             .join(EloHistory, BugReport.user_id == EloHistory.user_id)
-            .filter(BugReport.contest_id == contest.id, BugReport.user_id != user_id)
+            .filter(
+                BugReport.contest_id == contest.id,
+                BugReport.user_id != user_id,
+                EloHistory.contest_id.is_distinct_from(contest.id),
+            )
             .all()
         )
 
@@ -32,14 +96,20 @@ class ELOService:
     def calculate_opponent_elo(opponent_elos):
         if opponent_elos:
             return sum(opponent_elos) / len(opponent_elos)
-        return 100  # Default ELO value
+        return DEFAULT_OPPONENT_ELO
 
     @staticmethod
     def get_severity_weight(severity):
-        severity_weights = {"medium": 1.0, "high": 1.5, "critical": 2.0}
-        return severity_weights.get(severity.lower(), 1.0)
+        return SEVERITY_WEIGHTS.get(severity.lower(), 1.0)
+
+    def get_adjusted_k_factor(self, role):
+        # Adjust ELO based on the league: Higher ELO users should gain less
+        if role in LEAGUE_K_MULTIPLIERS:
+            return self.k_factor * LEAGUE_K_MULTIPLIERS[role]
+        return self.k_factor
 
     @staticmethod
+    @traced("elo.duplicate_count")
     def get_duplicate_penalty(bug_report, session: Session):
         duplicate_count = (
             session.query(BugReport)
@@ -53,6 +123,20 @@ class ELOService:
         penalty = DUPLICATE_PENALTY_MULTIPLIER * duplicate_count
         return penalty
 
+    def calculate_report_change(
+        self, user_elo, opponent_elo, role, severity, duplicate_penalty
+    ):
+        severity_weight = self.get_severity_weight(severity)
+        win_probability = self.calculate_win_probability(user_elo, opponent_elo)
+
+        adjusted_k_factor = self.get_adjusted_k_factor(role)
+
+        bug_value = severity_weight * (1 - win_probability)
+        bug_value -= duplicate_penalty
+
+        return int(adjusted_k_factor * bug_value)
+
+    @traced("elo.calculate_elo_change")
     def calculate_elo_change(self, user, contest, reported_bugs, session: Session):
         user_elo = calculate_current_elo(user.id, session)
         opponent_elos = self.get_opponent_elos(contest, user.id, session)
@@ -61,24 +145,131 @@ class ELOService:
         total_elo_change = 0
 
         for bug_report in reported_bugs:
-            severity_weight = self.get_severity_weight(bug_report.bug.severity)
-            win_probability = self.calculate_win_probability(user_elo, opponent_elo)
+            total_elo_change += self.calculate_report_change(
+                user_elo,
+                opponent_elo,
+                user.role,
+                bug_report.bug.severity,
+                self.get_duplicate_penalty(bug_report, session),
+            )
 
-            # Adjust ELO based on the league: Higher ELO users should gain less
-            if user.role == "senior_watson":
-                adjusted_k_factor = self.k_factor * 0.75
-            elif user.role == "reserve_watson":
-                adjusted_k_factor = self.k_factor * 0.9
-            else:
-                adjusted_k_factor = self.k_factor
+        return total_elo_change
 
-            bug_value = severity_weight * (1 - win_probability)
-            duplicate_penalty = self.get_duplicate_penalty(bug_report, session)
-            bug_value -= duplicate_penalty
+    @staticmethod
+    @traced("elo.load_contest_reports")
+    def load_contest_reports(contest_input: ContestInput, session: Session):
+        # Every report of the contest with its severity and duplicate count
+        contest_bugs = select(BugReport.bug_id).where(
+            BugReport.contest_id == contest_input.contest_id
+        )
+        bug_reports = {}  # bug_id -> {user_id: reports}
+        for bug_id, user_id, reports in session.execute(
+            select(BugReport.bug_id, BugReport.user_id, func.count())
+            .where(BugReport.bug_id.in_(contest_bugs))
+            .group_by(BugReport.bug_id, BugReport.user_id)
+        ):
+            bug_reports.setdefault(bug_id, {})[user_id] = reports
 
-            total_elo_change += int(adjusted_k_factor * bug_value)
+        for user_id, bug_id, severity in session.execute(
+            select(BugReport.user_id, BugReport.bug_id, Bug.severity)
+            .join(Bug, Bug.id == BugReport.bug_id)
+            .where(BugReport.contest_id == contest_input.contest_id)
+        ):
+            reporters = bug_reports[bug_id]
+            duplicates = sum(reporters.values()) - reporters[user_id]
+            contest_input.reports.setdefault(user_id, []).append((severity, duplicates))
+            contest_input.report_count += 1
 
-        return total_elo_change
+    @staticmethod
+    @traced("elo.load_contest_input")
+    def load_contest_input(
+        contest_id: int,
+        ratings: dict,
+        roles: dict,
+        session: Session,
+        deviations: bool = False,
+    ) -> ContestInput:
+        contest_input = ContestInput(contest_id, ratings, roles)
+        ELOService.load_contest_reports(contest_input, session)
+
+        # Same rows as get_opponent_elos, aggregated per reporter
+        for user_id, elo_sum, elo_count in session.execute(
+            select(
+                BugReport.user_id,
+                func.sum(EloHistory.elo_points_after),
+                func.count(EloHistory.elo_points_after),
+            )
+            .join(EloHistory, BugReport.user_id == EloHistory.user_id)
+            .where(
+                BugReport.contest_id == contest_id,
+                EloHistory.contest_id.is_distinct_from(contest_id),
+            )
+            .group_by(BugReport.user_id)
+        ):
+            contest_input.reporter_history[user_id] = (elo_sum, elo_count)
+
+        if deviations:
+            contest_input.deviations = {
+                user_id: (deviation, volatility)
+                for user_id, deviation, volatility in session.execute(
+                    select(
+                        RatingDeviation.user_id,
+                        RatingDeviation.deviation,
+                        RatingDeviation.volatility,
+                    ).where(RatingDeviation.user_id.in_(ratings))
+                )
+            }
+
+        return contest_input
+
+    def rate_contest(self, contest: ContestInput) -> list[RatingChange]:
+        # Batch equivalent of calculate_elo_change and
+        # apply_participation_penalty for every participant in contest.ratings
+        field_sum = sum(elo_sum for elo_sum, _ in contest.reporter_history.values())
+        field_count = sum(count for _, count in contest.reporter_history.values())
+
+        results = []
+        for user_id, user_elo in contest.ratings.items():
+            role = contest.roles[user_id]
+            reports = contest.reports.get(user_id)
+
+            if reports:
+                own_sum, own_count = contest.reporter_history.get(user_id, (0, 0))
+                opponent_count = field_count - own_count
+                if opponent_count:
+                    opponent_elo = (field_sum - own_sum) / opponent_count
+                else:
+                    opponent_elo = DEFAULT_OPPONENT_ELO
+
+                elo_change = sum(
+                    self.calculate_report_change(
+                        user_elo,
+                        opponent_elo,
+                        role,
+                        severity,
+                        DUPLICATE_PENALTY_MULTIPLIER * duplicates,
+                    )
+                    for severity, duplicates in reports
+                )
+                results.append(
+                    RatingChange(
+                        user_id,
+                        user_elo,
+                        user_elo + elo_change,
+                        "Contest participation",
+                    )
+                )
+            elif role in LEAGUE_K_MULTIPLIERS and contest.report_count > 0:
+                results.append(
+                    RatingChange(
+                        user_id,
+                        user_elo,
+                        max(user_elo - NO_BUGS_FOUND_PENALTY, 0),
+                        f"Penalty for {role} not finding bugs",
+                    )
+                )
+
+        return results
 
     @staticmethod
     def apply_invalid_submission_penalty(
@@ -88,20 +279,19 @@ class ELOService:
         current_elo = calculate_current_elo(user.id, session)
         new_elo = max(current_elo - penalty, 0)
 
-        elo_history_entry = EloHistory(
-            user_id=user.id,
-            contest_id=contest.id,
-            elo_points_before=current_elo,
-            elo_points_after=new_elo,
-            change_reason="Penalty for invalid submissions",
+        add_elo_history(
+            session,
+            user.id,
+            contest.id,
+            current_elo,
+            new_elo,
+            "Penalty for invalid submissions",
         )
 
-        session.add(elo_history_entry)
-        session.commit()
-
     @staticmethod
+    @traced("elo.participation_penalty")
     def apply_participation_penalty(user, contest, session: Session):
-        if user.role in ["senior_watson", "reserve_watson"]:
+        if user.role in LEAGUE_K_MULTIPLIERS:
             others_found_bugs = (
                 session.query(BugReport)
                 .filter(
@@ -123,13 +313,183 @@ class ELOService:
                 current_elo = calculate_current_elo(user.id, session)
                 new_elo = max(current_elo - penalty, 0)
 
-                elo_history_entry = EloHistory(
-                    user_id=user.id,
-                    contest_id=contest.id,
-                    elo_points_before=current_elo,
-                    elo_points_after=new_elo,
-                    change_reason=f"Penalty for {user.role} not finding bugs",
+                add_elo_history(
+                    session,
+                    user.id,
+                    contest.id,
+                    current_elo,
+                    new_elo,
+                    f"Penalty for {user.role} not finding bugs",
                 )
 
-                session.add(elo_history_entry)
-                session.commit()
+    def contest_elo_changes_query(self, contest_id: int):
+        # Set-based equivalent of calculate_elo_change and
+        # apply_participation_penalty for every participant of the contest that
+        # is not in the processing ledger yet. Yields one
+        # (user_id, contest_id, elo_points_before, elo_points_after,
+        # change_reason) row per EloHistory entry to write.
+        pending = (
+            select(contest_participants.c.user_id)
+            .where(
+                contest_participants.c.contest_id == contest_id,
+                ~exists().where(
+                    ContestProcessingEntry.contest_id == contest_id,
+                    ContestProcessingEntry.user_id == contest_participants.c.user_id,
+                ),
+            )
+            .cte("pending")
+        )
+
+        ratings = (
+            select(
+                EloHistory.user_id,
+                func.sum(
+                    EloHistory.elo_points_after - EloHistory.elo_points_before
+                ).label("rating"),
+            )
+            .where(EloHistory.user_id.in_(select(pending.c.user_id)))
+            .group_by(EloHistory.user_id)
+            .cte("ratings")
+        )
+
+        # Pre-contest history of every reporter, once per report, as in
+        # get_opponent_elos
+        reporter_elos = (
+            select(
+                BugReport.user_id,
+                func.sum(EloHistory.elo_points_after).label("elo_sum"),
+                func.count(EloHistory.elo_points_after).label("elo_count"),
+            )
+            .join(EloHistory, BugReport.user_id == EloHistory.user_id)
+            .where(
+                BugReport.contest_id == contest_id,
+                EloHistory.contest_id.is_distinct_from(contest_id),
+            )
+            .group_by(BugReport.user_id)
+            .cte("reporter_elos")
+        )
+        field = select(
+            func.coalesce(func.sum(reporter_elos.c.elo_sum), 0).label("elo_sum"),
+            func.coalesce(func.sum(reporter_elos.c.elo_count), 0).label("elo_count"),
+        ).cte("field")
+
+        contest_bugs = select(BugReport.bug_id).where(
+            BugReport.contest_id == contest_id
+        )
+        bug_reports = (
+            select(BugReport.bug_id, func.count().label("reports"))
+            .where(BugReport.bug_id.in_(contest_bugs))
+            .group_by(BugReport.bug_id)
+            .cte("bug_reports")
+        )
+        own_reports = (
+            select(BugReport.bug_id, BugReport.user_id, func.count().label("reports"))
+            .where(BugReport.bug_id.in_(contest_bugs))
+            .group_by(BugReport.bug_id, BugReport.user_id)
+            .cte("own_reports")
+        )
+        contest_reports = (
+            select(func.count().label("reports"))
+            .where(BugReport.contest_id == contest_id)
+            .cte("contest_reports")
+        )
+
+        user_elo = func.coalesce(ratings.c.rating, 0)
+        opponent_count = field.c.elo_count - func.coalesce(reporter_elos.c.elo_count, 0)
+        opponent_elo = case(
+            (
+                opponent_count > 0,
+                cast(field.c.elo_sum - func.coalesce(reporter_elos.c.elo_sum, 0), Float)
+                / opponent_count,
+            ),
+            else_=float(DEFAULT_OPPONENT_ELO),
+        )
+        win_probability = 1.0 / (
+            1.0 + func.power(10.0, (opponent_elo - user_elo) / 400.0)
+        )
+        severity_weight = case(
+            *[
+                (Bug.severity == severity, SEVERITY_WEIGHTS[severity.value])
+                for severity in Bug.severity.type.enum_class
+            ],
+            else_=1.0,
+        )
+        adjusted_k_factor = case(
+            *[
+                (User.role == role, self.get_adjusted_k_factor(role))
+                for role in LEAGUE_K_MULTIPLIERS
+            ],
+            else_=float(self.k_factor),
+        )
+        duplicate_penalty = DUPLICATE_PENALTY_MULTIPLIER * (
+            bug_reports.c.reports - own_reports.c.reports
+        )
+        report_change = trunc_int(
+            adjusted_k_factor
+            * (severity_weight * (1.0 - win_probability) - duplicate_penalty)
+        )
+
+        changes = (
+            select(
+                BugReport.user_id,
+                func.sum(report_change).label("elo_change"),
+            )
+            .join(pending, pending.c.user_id == BugReport.user_id)
+            .join(User, User.id == BugReport.user_id)
+            .join(Bug, Bug.id == BugReport.bug_id)
+            .join(bug_reports, bug_reports.c.bug_id == BugReport.bug_id)
+            .join(
+                own_reports,
+                and_(
+                    own_reports.c.bug_id == BugReport.bug_id,
+                    own_reports.c.user_id == BugReport.user_id,
+                ),
+            )
+            .join(field, literal(True))
+            .outerjoin(ratings, ratings.c.user_id == BugReport.user_id)
+            .outerjoin(reporter_elos, reporter_elos.c.user_id == BugReport.user_id)
+            .where(BugReport.contest_id == contest_id)
+            .group_by(BugReport.user_id)
+            .cte("changes")
+        )
+
+        participation = (
+            select(
+                changes.c.user_id,
+                literal(contest_id).label("contest_id"),
+                user_elo.label("elo_points_before"),
+                (user_elo + changes.c.elo_change).label("elo_points_after"),
+                literal("Contest participation").label("change_reason"),
+            )
+            .select_from(changes)
+            .outerjoin(ratings, ratings.c.user_id == changes.c.user_id)
+        )
+
+        penalized_elo = user_elo - NO_BUGS_FOUND_PENALTY
+        penalties = (
+            select(
+                pending.c.user_id,
+                literal(contest_id).label("contest_id"),
+                user_elo.label("elo_points_before"),
+                case((penalized_elo > 0, penalized_elo), else_=0).label(
+                    "elo_points_after"
+                ),
+                (
+                    literal("Penalty for ") + User.role + literal(" not finding bugs")
+                ).label("change_reason"),
+            )
+            .select_from(pending)
+            .join(User, User.id == pending.c.user_id)
+            .join(contest_reports, literal(True))
+            .outerjoin(ratings, ratings.c.user_id == pending.c.user_id)
+            .where(
+                User.role.in_(list(LEAGUE_K_MULTIPLIERS)),
+                contest_reports.c.reports > 0,
+                ~exists().where(
+                    BugReport.contest_id == contest_id,
+                    BugReport.user_id == pending.c.user_id,
+                ),
+            )
+        )
+
+        return participation.union_all(penalties)
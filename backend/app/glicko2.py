@@ -0,0 +1,156 @@
+import numpy as np
+
+from .elo_service import DUPLICATE_PENALTY_MULTIPLIER, ContestInput, ELOService
+from .rating_engine import RatingChange
+
+# Glicko-2 (Glickman, "Example of the Glicko-2 system") applied per contest:
+# every participant plays one game against the rest of the field, scored by
+# the share of the field they out-performed. Ratings keep this system's scale
+# (new users start at 0); only differences enter the formulas, so ratings are
+# not floored at 0 either: a floor would keep the wins and drop the losses.
+GLICKO2_SCALE = 173.7178
+DEFAULT_DEVIATION = 350.0
+DEFAULT_VOLATILITY = 0.06
+TAU = 0.5  # Limits how fast volatility moves
+CONVERGENCE_TOLERANCE = 1e-6
+MAX_ITERATIONS = 100
+
+
+def contest_points(contest: ContestInput, user_ids) -> np.ndarray:
+    # Severity weight less the duplicate penalty, summed per participant: the
+    # reports are flattened once and summed with bincount
+    positions = {user_id: position for position, user_id in enumerate(user_ids)}
+    reports = [
+        (positions[user_id], severity, duplicates)
+        for user_id, user_reports in contest.reports.items()
+        if user_id in positions
+        for severity, duplicates in user_reports
+    ]
+    if not reports:
+        return np.zeros(len(user_ids))
+
+    owners, severities, duplicates = zip(*reports)
+    weights = {
+        severity: ELOService.get_severity_weight(severity)
+        for severity in set(severities)
+    }
+    points = np.fromiter(
+        map(weights.__getitem__, severities), np.float64, len(severities)
+    )
+    points -= DUPLICATE_PENALTY_MULTIPLIER * np.array(duplicates, np.float64)
+    return np.bincount(np.array(owners), weights=points, minlength=len(user_ids))
+
+
+def performance_scores(points: np.ndarray) -> np.ndarray:
+    # Share of the other participants each one beat, ties counting half
+    ordered = np.sort(points)
+    below = np.searchsorted(ordered, points, side="left")
+    tied = np.searchsorted(ordered, points, side="right") - below - 1
+    return (below + 0.5 * tied) / (len(points) - 1)
+
+
+def field_opponent(mu: np.ndarray, phi: np.ndarray):
+    # Everyone else in the contest as one opponent: mean rating, RMS deviation
+    others = len(mu) - 1
+    mu_field = (mu.sum() - mu) / others
+    phi_field = np.sqrt(((phi**2).sum() - phi**2) / others)
+    return mu_field, phi_field
+
+
+def g(phi: np.ndarray) -> np.ndarray:
+    return 1 / np.sqrt(1 + 3 * phi**2 / np.pi**2)
+
+
+def new_volatility(phi, sigma, delta, v, tau=TAU):
+    # Step 5 of the paper (Illinois algorithm), iterated for all participants
+    # at once; lanes that have converged stop moving
+    a = np.log(sigma**2)
+
+    def f(x):
+        ex = np.exp(x)
+        return (
+            ex * (delta**2 - phi**2 - v - ex) / (2 * (phi**2 + v + ex) ** 2)
+            - (x - a) / tau**2
+        )
+
+    A = a
+    large = delta**2 > phi**2 + v
+    B = np.where(large, np.log(np.abs(delta**2 - phi**2 - v)), a - tau)
+    searching = ~large
+    for _ in range(MAX_ITERATIONS):
+        searching &= f(B) < 0
+        if not searching.any():
+            break
+        B = np.where(searching, B - tau, B)
+
+    f_A, f_B = f(A), f(B)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for _ in range(MAX_ITERATIONS):
+            active = np.abs(B - A) > CONVERGENCE_TOLERANCE
+            if not active.any():
+                break
+            C = A + (A - B) * f_A / (f_B - f_A)
+            f_C = f(C)
+            bracketed = f_C * f_B <= 0
+            A = np.where(active & bracketed, B, A)
+            f_A = np.where(active, np.where(bracketed, f_B, f_A / 2), f_A)
+            B = np.where(active, C, B)
+            f_B = np.where(active, f_C, f_B)
+
+    return np.exp(A / 2)
+
+
+def glicko2_update(mu, phi, sigma, v, score_gap, tau=TAU):
+    # Steps 5-7 on the Glicko-2 scale, given the estimated variance v and
+    # score_gap = sum of g(phi_j) * (s_j - E_j) over the period's games
+    sigma = new_volatility(phi, sigma, v * score_gap, v, tau)
+    phi_star = np.sqrt(phi**2 + sigma**2)
+    phi = 1 / np.sqrt(1 / phi_star**2 + 1 / v)
+    mu = mu + phi**2 * score_gap
+    return mu, phi, sigma
+
+
+class Glicko2Engine:
+    name = "glicko2"
+    tracks_deviation = True
+
+    def __init__(self, tau=TAU):
+        self.tau = tau
+
+    def rate_contest(self, contest: ContestInput) -> list[RatingChange]:
+        user_ids = list(contest.ratings)
+        if len(user_ids) < 2:
+            return []
+
+        ratings = np.fromiter(contest.ratings.values(), np.float64, len(user_ids))
+        state = [
+            contest.deviations.get(user_id, (DEFAULT_DEVIATION, DEFAULT_VOLATILITY))
+            for user_id in user_ids
+        ]
+        deviation, sigma = np.array(state, dtype=np.float64).reshape(-1, 2).T
+
+        mu = ratings / GLICKO2_SCALE
+        phi = deviation / GLICKO2_SCALE
+        scores = performance_scores(contest_points(contest, user_ids))
+
+        mu_field, phi_field = field_opponent(mu, phi)
+        g_field = g(phi_field)
+        expected = 1 / (1 + np.exp(-g_field * (mu - mu_field)))
+        v = 1 / (g_field**2 * expected * (1 - expected))
+
+        mu, phi, sigma = glicko2_update(
+            mu, phi, sigma, v, g_field * (scores - expected), self.tau
+        )
+
+        after = np.rint(mu * GLICKO2_SCALE).astype(np.int64)
+        deviation = np.minimum(phi * GLICKO2_SCALE, DEFAULT_DEVIATION)
+        return [
+            RatingChange(user_id, before, rating, "Contest participation", rd, vol)
+            for user_id, before, rating, rd, vol in zip(
+                user_ids,
+                contest.ratings.values(),
+                after.tolist(),
+                deviation.tolist(),
+                sigma.tolist(),
+            )
+        ]
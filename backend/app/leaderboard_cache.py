@@ -0,0 +1,336 @@
+import logging
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Callable, NamedTuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, sessionmaker
+
+from .rating_distribution import RatingDistribution
+
+logger = logging.getLogger(__name__)
+
+DIRTY_FLAG = "leaderboard_dirty"
+
+# Snapshot file: header, then the user ids and ratings in rank order as two
+# packed little-endian int32 columns
+SNAPSHOT_MAGIC = b"LBS1"
+SNAPSHOT_HEADER = struct.Struct("<4sQdI")  # magic, generation, built_at, size
+
+
+class Standing(NamedTuple):
+    rank: int
+    user_id: int
+    rating: int
+
+
+@dataclass(frozen=True)
+class Standings:
+    entries: tuple[Standing, ...] = ()
+    positions: dict[int, int] = field(default_factory=dict)  # user_id -> rank
+    generation: int = 0
+    built_at: float = 0.0
+
+    def top(self, limit: int) -> tuple[Standing, ...]:
+        return self.entries[:limit]
+
+    def get(self, user_id: int) -> Standing | None:
+        rank = self.positions.get(user_id)
+        return self.entries[rank - 1] if rank is not None else None
+
+    @cached_property
+    def distribution(self) -> RatingDistribution:
+        return RatingDistribution(
+            (entry.rating for entry in self.entries), descending=True
+        )
+
+
+def write_snapshot(standings: Standings, path: str):
+    user_ids = array("i", (entry.user_id for entry in standings.entries))
+    ratings = array("i", (entry.rating for entry in standings.entries))
+    if sys.byteorder == "big":
+        user_ids.byteswap()
+        ratings.byteswap()
+
+    # Written aside and renamed, so readers never see a partial file. The
+    # temporary name is unique: every worker rebuilds (and writes) on startup.
+    fd, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}."
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(
+                SNAPSHOT_HEADER.pack(
+                    SNAPSHOT_MAGIC,
+                    standings.generation,
+                    standings.built_at,
+                    len(standings.entries),
+                )
+            )
+            user_ids.tofile(f)
+            ratings.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def read_snapshot(path: str) -> Standings | None:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    if len(data) < SNAPSHOT_HEADER.size:
+        return None
+    magic, generation, built_at, size = SNAPSHOT_HEADER.unpack_from(data)
+    columns = data[SNAPSHOT_HEADER.size :]
+    if magic != SNAPSHOT_MAGIC or len(columns) != size * 8:
+        return None
+
+    user_ids = array("i", columns[: size * 4])
+    ratings = array("i", columns[size * 4 :])
+    if sys.byteorder == "big":
+        user_ids.byteswap()
+        ratings.byteswap()
+
+    entries = tuple(
+        Standing(rank, user_id, rating)
+        for rank, (user_id, rating) in enumerate(zip(user_ids, ratings), start=1)
+    )
+    return Standings(
+        entries=entries,
+        positions={entry.user_id: entry.rank for entry in entries},
+        generation=generation,
+        built_at=built_at,
+    )
+
+
+class LeaderboardCache:
+    # Double-buffered: readers always get the published (front) Standings while
+    # a replacement is built in the background and swapped in by reference.
+    # Rebuilds are triggered by commits of sessions flagged with mark_dirty, so
+    # a contest that is still being processed keeps serving the last snapshot.
+    #
+    # Concurrent cache misses share one synchronous rebuild, and a rebuild is
+    # only published when it read the database after the one being served, so
+    # a slow rebuild can never replace newer standings.
+    #
+    # Commits in other worker processes are seen through generation_source,
+    # the generation of the shared rating snapshot they publish: when it has
+    # moved past the one the standings were read under, a rebuild is queued.
+    # The committing process reports its own generations with published(), as
+    # its commit has already queued the rebuild.
+    #
+    # With a snapshot_path, every rebuild is also written to disk so a
+    # restarted worker can serve the last standings straight away (warm) while
+    # the database copy is rebuilt in the background.
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        loader: Callable[[Session], list[tuple[int, int]]],
+        snapshot_path: str | None = None,
+        generation_source: Callable[[], int] | None = None,
+    ):
+        self.session_factory = session_factory
+        self.loader = loader
+        self.snapshot_path = snapshot_path
+        self.generation_source = generation_source
+        self._source_generation = 0  # Seen when the current standings were read
+        self._requested_generation = 0  # Seen when a rebuild was last queued
+        self._warm_start = False
+        self._current: Standings | None = None
+        self._lock = threading.Lock()
+        self._miss_lock = threading.Lock()  # One rebuild for concurrent misses
+        self._write_lock = threading.Lock()
+        self._reads = 0  # Rebuilds started; orders their database reads
+        self._published_read = 0  # The read the current standings came from
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="leaderboard-cache"
+        )
+        self._pending: Future | None = None
+        self._hits = 0
+        self._misses = 0
+        self._rebuilds = 0
+        self._rebuild_errors = 0
+        self._last_rebuild_seconds = 0.0
+        self._total_rebuild_seconds = 0.0
+
+        event.listen(session_factory, "after_commit", self._after_commit)
+        event.listen(session_factory, "after_soft_rollback", self._after_rollback)
+
+    @staticmethod
+    def mark_dirty(session: Session):
+        session.info[DIRTY_FLAG] = True
+
+    def get(self) -> Standings:
+        current = self._current
+        if current is not None:
+            self._hits += 1
+            self.refresh()
+            return current
+
+        self._misses += 1
+        with self._miss_lock:
+            # Built by the reader that held the lock while this one waited
+            current = self._current
+            if current is not None:
+                return current
+            return self.rebuild()
+
+    def refresh(self) -> bool:
+        # Queues a rebuild when another process published newer ratings; the
+        # current standings are served until it lands
+        if self.generation_source is None:
+            return False
+        seen = self.generation_source()
+        if seen in (self._source_generation, self._requested_generation):
+            return False
+        self._requested_generation = seen
+        self.invalidate()
+        return True
+
+    def published(self, generation: int):
+        # Called by the process that published this generation right after
+        # committing the ratings in it: its own commit already queued a
+        # rebuild, so refresh() need not queue another. A generation that
+        # skipped one this cache never saw is left to refresh().
+        with self._lock:
+            if generation - 1 in (self._source_generation, self._requested_generation):
+                self._requested_generation = generation
+
+    def peek(self) -> Standings | None:
+        # The published standings, without counting a lookup or rebuilding
+        return self._current
+
+    def rebuild(self) -> Standings:
+        started = time.perf_counter()
+        with self._lock:
+            self._reads += 1
+            read = self._reads
+        source = self.generation_source() if self.generation_source else 0
+        with self.session_factory() as session:
+            rows = self.loader(session)
+
+        entries = tuple(
+            Standing(rank, user_id, rating)
+            for rank, (user_id, rating) in enumerate(rows, start=1)
+        )
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            if self._current is not None and read < self._published_read:
+                # A rebuild that started later has already been published
+                return self._current
+            generation = self._current.generation + 1 if self._current else 1
+            standings = Standings(
+                entries=entries,
+                positions={entry.user_id: entry.rank for entry in entries},
+                generation=generation,
+                built_at=time.time(),
+            )
+            standings.distribution  # Built here rather than by the first reader
+            self._current = standings
+            self._published_read = read
+            self._source_generation = source
+            self._rebuilds += 1
+            self._last_rebuild_seconds = elapsed
+            self._total_rebuild_seconds += elapsed
+
+        if self.snapshot_path:
+            with self._write_lock:
+                # Skipped when a newer rebuild was published meanwhile; it
+                # writes its own standings once this lock is free
+                if self._current is standings:
+                    try:
+                        write_snapshot(standings, self.snapshot_path)
+                    except OSError:
+                        logger.exception("Could not write leaderboard snapshot")
+
+        return standings
+
+    def warm(self) -> bool:
+        # Serve the standings persisted by the last rebuild, then reconcile
+        # with the database in the background
+        if not self.snapshot_path:
+            return False
+
+        standings = read_snapshot(self.snapshot_path)
+        if standings is None:
+            return False
+
+        with self._lock:
+            if self._current is not None:
+                return False
+            self._current = standings
+            self._warm_start = True
+        self.invalidate()
+        return True
+
+    def invalidate(self) -> Future:
+        with self._lock:
+            pending = self._pending
+            # A queued rebuild has not read anything yet and will see this commit
+            if pending is not None and not pending.running() and not pending.done():
+                return pending
+            self._pending = self._executor.submit(self._rebuild_in_background)
+            return self._pending
+
+    def wait(self, timeout: float | None = None):
+        pending = self._pending
+        if pending is not None:
+            pending.result(timeout)
+
+    def clear(self):
+        self.wait()
+        with self._lock:
+            self._current = None
+
+    def close(self):
+        event.remove(self.session_factory, "after_commit", self._after_commit)
+        event.remove(self.session_factory, "after_soft_rollback", self._after_rollback)
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        current = self._current
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "rebuilds": self._rebuilds,
+            "rebuild_errors": self._rebuild_errors,
+            "last_rebuild_seconds": self._last_rebuild_seconds,
+            "total_rebuild_seconds": self._total_rebuild_seconds,
+            "generation": current.generation if current else 0,
+            "size": len(current.entries) if current else 0,
+            "warm_start": self._warm_start,
+        }
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            # Keep serving the previous snapshot; the next refresh retries
+            self._rebuild_errors += 1
+            self._requested_generation = 0
+            logger.exception("Leaderboard cache rebuild failed")
+
+    def _after_commit(self, session: Session):
+        if session.info.pop(DIRTY_FLAG, False):
+            self.invalidate()
+
+    def _after_rollback(self, session: Session, previous_transaction):
+        session.info.pop(DIRTY_FLAG, None)
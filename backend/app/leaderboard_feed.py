@@ -0,0 +1,215 @@
+import asyncio
+import json
+import logging
+import threading
+
+from starlette.concurrency import run_in_threadpool
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from .leaderboard_cache import LeaderboardCache, Standing, Standings
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 8  # Messages a slow client may fall behind by
+
+
+def entry(standing: Standing) -> dict:
+    return {
+        "rank": standing.rank,
+        "user_id": standing.user_id,
+        "rating": standing.rating,
+    }
+
+
+def snapshot_message(standings: Standings, size: int) -> str:
+    return json.dumps(
+        {
+            "type": "snapshot",
+            "generation": standings.generation,
+            "entries": [entry(standing) for standing in standings.top(size)],
+        }
+    )
+
+
+def delta_message(previous: Standings, current: Standings, size: int) -> str | None:
+    # Rank and rating changes within the top `size`, as absolute values so a
+    # client can apply a delta its snapshot already includes
+    changes = []
+    for standing in current.top(size):
+        before = previous.get(standing.user_id)
+        if before == standing:
+            continue
+        changes.append(
+            {
+                **entry(standing),
+                "previous_rank": before.rank if before else None,
+                "previous_rating": before.rating if before else None,
+            }
+        )
+
+    removed = []
+    for standing in previous.top(size):
+        rank = current.positions.get(standing.user_id)
+        if rank is None or rank > size:
+            removed.append(standing.user_id)
+    if not changes and not removed:
+        return None
+
+    return json.dumps(
+        {
+            "type": "delta",
+            "generation": current.generation,
+            "changes": changes,
+            "removed": removed,
+        }
+    )
+
+
+class Subscription:
+    __slots__ = ("queue",)
+
+    def __init__(self):
+        self.queue: asyncio.Queue[str] = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+
+    def offer(self, message: str, resync: str):
+        if self.queue.full():
+            # Too far behind to catch up on deltas: start over from a snapshot
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            message = resync
+        self.queue.put_nowait(message)
+
+
+class LeaderboardFeed:
+    # Pushes leaderboard changes to websocket subscribers. A single ticker
+    # thread compares the cache's published standings with the last broadcast
+    # ones, so any number of rebuilds within a tick go out as one message.
+    # Each message is serialized once and handed to every event loop with
+    # subscribers in one call; nothing is read from the database per client.
+
+    def __init__(self, cache: LeaderboardCache, tick: float = 1.0, size: int = 100):
+        self.cache = cache
+        self.tick_seconds = tick
+        self.size = size
+        self._subscribers: dict[asyncio.AbstractEventLoop, set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._sent: Standings | None = None
+        self._messages = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers.setdefault(loop, set()).add(subscription)
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="leaderboard-feed", daemon=True
+                )
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            subscribers = self._subscribers.get(loop)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[loop]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def tick(self) -> bool:
+        # Also picks up ratings published by other workers
+        self.cache.refresh()
+        current = self.cache.peek()
+        with self._lock:
+            previous = self._sent
+            if current is None or current is previous:
+                return False
+            self._sent = current
+
+        if previous is None:
+            return False
+
+        message = delta_message(previous, current, self.size)
+        if message is None:
+            return False
+
+        self.broadcast(message, snapshot_message(current, self.size))
+        return True
+
+    def broadcast(self, message: str, resync: str):
+        with self._lock:
+            targets = [
+                (loop, tuple(subscribers))
+                for loop, subscribers in self._subscribers.items()
+            ]
+        for loop, subscribers in targets:
+            try:
+                loop.call_soon_threadsafe(self._deliver, subscribers, message, resync)
+            except RuntimeError:
+                # The loop was closed under its subscribers
+                with self._lock:
+                    self._subscribers.pop(loop, None)
+        self._messages += 1
+
+    def close(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self.subscriber_count(),
+            "messages": self._messages,
+            "generation": self._sent.generation if self._sent else 0,
+        }
+
+    async def serve(self, websocket: WebSocket):
+        await websocket.accept()
+        subscription = self.subscribe()
+        try:
+            standings = await run_in_threadpool(self.cache.get)
+            with self._lock:
+                # Deltas are computed against this if nothing was broadcast yet
+                if self._sent is None:
+                    self._sent = standings
+            await websocket.send_text(snapshot_message(standings, self.size))
+            sender = asyncio.create_task(self._send(websocket, subscription))
+            try:
+                # Clients only listen; reading is how a disconnect is noticed
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        break
+            finally:
+                sender.cancel()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.unsubscribe(subscription)
+
+    @staticmethod
+    async def _send(websocket: WebSocket, subscription: Subscription):
+        while True:
+            await websocket.send_text(await subscription.queue.get())
+
+    @staticmethod
+    def _deliver(subscribers, message: str, resync: str):
+        for subscription in subscribers:
+            subscription.offer(message, resync)
+
+    def _run(self):
+        while not self._stop.wait(self.tick_seconds):
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Leaderboard feed tick failed")
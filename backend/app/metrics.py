@@ -0,0 +1,270 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+# Prometheus text-format metrics without a client library. Counters and
+# histograms are sharded per thread: each thread only ever updates its own
+# cells, so recording takes no lock (a lock is taken once per thread, to
+# register its shard) and costs a dict lookup and an addition. A scrape sums
+# the shards. Gauges are read from their source when scraped.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROCESSING_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+ROW_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+
+def format_labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"),
+        )
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class ShardedMetric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _merged(self) -> dict:
+        with self._lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            # Copied first: the owning thread may add a label set meanwhile
+            for labels, cells in list(shard.items()):
+                total = merged.get(labels)
+                if total is None:
+                    merged[labels] = list(cells)
+                else:
+                    for i, cell in enumerate(cells):
+                        total[i] += cell
+        return merged
+
+    def reset(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+class Counter(ShardedMetric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, *labels):
+        shard = self._shard()
+        cells = shard.get(labels)
+        if cells is None:
+            cells = shard[labels] = [0]
+        cells[0] += amount
+
+    def value(self, *labels) -> float:
+        return self._merged().get(labels, [0])[0]
+
+    def samples(self) -> Iterable[str]:
+        for labels, (value,) in sorted(self._merged().items()):
+            yield f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}"
+
+
+class Histogram(ShardedMetric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        shard = self._shard()
+        cells = shard.get(labels)
+        if cells is None:
+            # One count per bucket, then +Inf, sum and count
+            cells = shard[labels] = [0] * (len(self.buckets) + 3)
+        cells[bisect_left(self.buckets, value)] += 1
+        cells[-2] += value
+        cells[-1] += 1
+
+    def count(self, *labels) -> int:
+        return self._merged().get(labels, [0])[-1]
+
+    def total(self, *labels) -> float:
+        return self._merged().get(labels, [0, 0])[-2]
+
+    def samples(self) -> Iterable[str]:
+        names = self.labels + ("le",)
+        for labels, cells in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), cells):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket{format_labels(names, labels + (format_value(bound),))} "
+                    f"{cumulative}"
+                )
+            label_text = format_labels(self.labels, labels)
+            yield f"{self.name}_sum{label_text} {format_value(cells[-2])}"
+            yield f"{self.name}_count{label_text} {cells[-1]}"
+
+
+class Collected:
+    # Metric read from another component when scraped; `collect` returns
+    # (label values, value) pairs
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        kind: str,
+        collect: Callable[[], Iterable[tuple[tuple, float]]],
+        labels: tuple[str, ...] = (),
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labels = labels
+        self.collect = collect
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self.collect():
+            yield f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def collected(self, name, documentation, kind, labels=()):
+        # Decorator registering the function as the metric's collector
+        def register(collect):
+            self.register(Collected(name, documentation, kind, collect, labels))
+            return collect
+
+        return register
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds",
+    "Time to serve a request, by route template",
+    ("method", "route"),
+)
+REQUESTS = registry.counter(
+    "http_requests_total", "Requests served", ("method", "route", "status")
+)
+BCRYPT_SECONDS = registry.histogram(
+    "auth_bcrypt_duration_seconds",
+    "Time spent hashing or checking a password",
+    ("operation",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0),
+)
+ELO_PROCESSING_SECONDS = registry.histogram(
+    "elo_processing_duration_seconds",
+    "Duration of process_contest_elo runs",
+    ("mode",),
+    buckets=PROCESSING_BUCKETS,
+)
+ELO_PROCESSING_ROWS = registry.histogram(
+    "elo_processing_rows_written",
+    "elo_history rows written per process_contest_elo run",
+    ("mode",),
+    buckets=ROW_BUCKETS,
+)
+ELO_PROCESSING_RUNS = registry.counter(
+    "elo_processing_runs_total",
+    "process_contest_elo runs by outcome",
+    ("mode", "outcome"),
+)
+RATING_SNAPSHOT_LOOKUPS = registry.counter(
+    "rating_snapshot_lookups_total",
+    "User rating lookups by whether the shared snapshot answered them",
+    ("result",),
+)
+
+
+@contextmanager
+def timed(histogram: Histogram, *labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, *labels)
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware (no per-request task or body buffering). The route
+    # label is the matched path template, so it stays low-cardinality.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started, scope["method"], path
+            )
+            REQUESTS.inc(1, scope["method"], path, status)
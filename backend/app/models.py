@@ -8,13 +8,20 @@ from sqlalchemy import (
     Boolean,
     ForeignKey,
     DateTime,
+    Float,
     Table,
     func,
     Index,
     Enum,
+    event,
+    insert,
+    select,
+    tuple_,
+    update,
 )
 from sqlalchemy.orm import relationship, Session
 
+from . import tracing
 from .database import Base
 
 
@@ -35,8 +42,14 @@ class User(Base):
     role = Column(String, default="watson")
     is_active = Column(Boolean, default=True)
     is_admin = Column(Boolean, default=False)
+    # Bumped whenever rating changes computed from a read of this user's
+    # rating are written; see EloHistoryWriter
+    rating_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     elo_history = relationship("EloHistory", back_populates="user")
+    rating_timeline = relationship(
+        "RatingPoint", back_populates="user", order_by="RatingPoint.id"
+    )
     reported_bugs = relationship("BugReport", back_populates="reporter")
 
 
@@ -68,6 +81,7 @@ contest_participants = Table(
     Column("contest_id", Integer, ForeignKey("contest.id")),
     Column("user_id", Integer, ForeignKey("user.id")),
     Column("signup_date", DateTime, default=datetime.now(timezone.utc)),
+    Index("uq_contest_participants_contest_user", "contest_id", "user_id", unique=True),
 )
 
 
@@ -97,6 +111,10 @@ class BugReport(Base):
     reporter = relationship("User", back_populates="reported_bugs")
     bug = relationship("Bug", back_populates="reports")
     contest = relationship("Contest", back_populates="bug_reports")
+    __table_args__ = (
+        Index("idx_bug_report_contest_user", "contest_id", "user_id"),
+        Index("idx_bug_report_bug", "bug_id"),
+    )
 
 
 class EloHistory(Base):
@@ -111,33 +129,351 @@ class EloHistory(Base):
 
     user = relationship("User", back_populates="elo_history")
     contest = relationship("Contest")
-    __table_args__ = (Index("idx_user_contest", "user_id", "contest_id"),)
+    __table_args__ = (
+        Index("idx_user_contest", "user_id", "contest_id"),
+        # Covers calculate_current_elo so the delta sum never touches the table
+        Index(
+            "idx_elo_history_user_delta",
+            "user_id",
+            "elo_points_before",
+            "elo_points_after",
+        ),
+    )
+
+
+# One point of a user's rating curve: the running total after a contest.
+# Maintained next to EloHistory so any point is an indexed read, not a SUM.
+class RatingPoint(Base):
+    __tablename__ = "rating_timeline"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    contest_id = Column(Integer, ForeignKey("contest.id"), nullable=False)
+    rating = Column(Integer, nullable=False)
+    delta = Column(Integer, nullable=False)
+
+    user = relationship("User", back_populates="rating_timeline")
+    contest = relationship("Contest")
+    __table_args__ = (
+        Index("uq_rating_timeline_user_contest", "user_id", "contest_id", unique=True),
+        Index("idx_rating_timeline_user_id", "user_id", "id"),
+        Index("idx_rating_timeline_contest", "contest_id"),
+    )
+
+
+# Top of the leaderboard as it stood right after a contest was processed
+class LeaderboardSnapshot(Base):
+    __tablename__ = "leaderboard_snapshot"
+
+    contest_id = Column(Integer, ForeignKey("contest.id"), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    rating = Column(Integer, nullable=False)
+
+
+PROCESSING_RUNNING = "running"
+PROCESSING_COMPLETED = "completed"
+
+
+# Per-contest processing ledger: a contest is "running" until every
+# participant has an entry, after which processing it again is a no-op
+class ContestProcessing(Base):
+    __tablename__ = "contest_processing"
+
+    contest_id = Column(Integer, ForeignKey("contest.id"), primary_key=True)
+    status = Column(String, nullable=False, default=PROCESSING_RUNNING)
+    started_at = Column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+    completed_at = Column(DateTime(timezone=True))
+    # Steps after the ratings, each set in the commit that finished it, so a
+    # retry picks up where a crashed run stopped
+    roles_applied_at = Column(DateTime(timezone=True))
+    snapshot_published_at = Column(DateTime(timezone=True))
+    # Set in the commit that added the contest's participation days, by either
+    # process_participation_days or close
+    participation_days_applied_at = Column(DateTime(timezone=True))
+    # Set once ELO, roles and participation days were applied in one close
+    closed_at = Column(DateTime(timezone=True))
+
+
+class ContestProcessingEntry(Base):
+    __tablename__ = "contest_processing_entry"
+
+    contest_id = Column(Integer, ForeignKey("contest.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+    # The user's rating deviation before the contest, for engines that track
+    # it; a resumed run rates the field with these
+    deviation_before = Column(Float)
+    volatility_before = Column(Float)
+
+
+# Rating confidence for engines that track it (Glicko-2); users without a row
+# have the engine's defaults
+class RatingDeviation(Base):
+    __tablename__ = "rating_deviation"
+
+    user_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+    deviation = Column(Float, nullable=False)
+    volatility = Column(Float, nullable=False)
+
+
+# Read model for contest pages, computed once when the contest's processing
+# completes
+class ContestStats(Base):
+    __tablename__ = "contest_stats"
+
+    contest_id = Column(Integer, ForeignKey("contest.id"), primary_key=True)
+    participants = Column(Integer, nullable=False)
+    participants_without_findings = Column(Integer, nullable=False)
+    medium_bugs = Column(Integer, nullable=False)
+    high_bugs = Column(Integer, nullable=False)
+    critical_bugs = Column(Integer, nullable=False)
+    reports = Column(Integer, nullable=False)
+    # Reports of a bug beyond its first one
+    duplicate_reports = Column(Integer, nullable=False)
+    average_rating_delta = Column(Float, nullable=False)
+    computed_at = Column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+
+
+HISTORY_WRITER = "elo_history_writer"
+# elo_history rows inserted by the open transaction, and by the committed ones
+# since take_history_rows_written() last read them
+HISTORY_ROWS_PENDING = "elo_history_rows_pending"
+HISTORY_ROWS_WRITTEN = "elo_history_rows_written"
+
+
+RATING_CAS_CHUNK_SIZE = 500
+
+
+class RatingConflict(Exception):
+    def __init__(self, user_ids):
+        super().__init__(f"Ratings changed concurrently for users {sorted(user_ids)}")
+        self.user_ids = user_ids
+
+
+# Write-behind buffer for the rating changes of one transaction. Rows are kept
+# in memory and written with one executemany per table when the session
+# commits, instead of an INSERT (and flush) per change.
+#
+# Writes are optimistic: the rating version seen when a user's rating was read
+# is compared-and-swapped on flush, so a change computed from a rating another
+# transaction has since replaced raises RatingConflict instead of landing.
+class EloHistoryWriter:
+    def __init__(self):
+        self.rows = []
+        self.points = {}  # (user_id, contest_id) -> {"rating": ..., "delta": ...}
+        self.pending = {}  # user_id -> buffered rating change
+        self.versions = {}  # user_id -> rating_version the changes are based on
+
+    def observe(self, user_id: int, version: int):
+        # The first read in the transaction is the one the changes build on
+        self.versions.setdefault(user_id, version)
+
+    def add(
+        self,
+        user_id: int,
+        contest_id: int,
+        elo_before: int,
+        elo_after: int,
+        change_reason: str,
+    ):
+        change = elo_after - elo_before
+        self.rows.append(
+            {
+                "user_id": user_id,
+                "contest_id": contest_id,
+                "elo_points_before": elo_before,
+                "elo_points_after": elo_after,
+                "change_reason": change_reason,
+            }
+        )
+        self.pending[user_id] = self.pending.get(user_id, 0) + change
+
+        point = self.points.get((user_id, contest_id))
+        if point is None:
+            self.points[(user_id, contest_id)] = {"rating": elo_after, "delta": change}
+        else:
+            # Several changes in one contest (e.g. result and penalty) share a point
+            point["rating"] = elo_after
+            point["delta"] += change
+
+    def pending_delta(self, user_id: int) -> int:
+        return self.pending.get(user_id, 0)
+
+    def flush(self, session: Session):
+        if not self.rows:
+            return
+        with tracing.span(
+            "write_history", rows=len(self.rows), points=len(self.points)
+        ):
+            self.write(session)
+
+    def write(self, session: Session):
+        session.flush()
+        self.swap_versions(session)
+        session.execute(insert(EloHistory), self.rows)
+        count_history_rows(session, len(self.rows))
+
+        existing = {}
+        by_contest = {}
+        for user_id, contest_id in self.points:
+            by_contest.setdefault(contest_id, []).append(user_id)
+        for contest_id, user_ids in by_contest.items():
+            for point in session.query(
+                RatingPoint.id, RatingPoint.user_id, RatingPoint.delta
+            ).filter(
+                RatingPoint.contest_id == contest_id, RatingPoint.user_id.in_(user_ids)
+            ):
+                existing[(point.user_id, contest_id)] = point
+
+        new_points = []
+        updated_points = []
+        for (user_id, contest_id), point in self.points.items():
+            stored = existing.get((user_id, contest_id))
+            if stored is None:
+                new_points.append(
+                    {"user_id": user_id, "contest_id": contest_id, **point}
+                )
+            else:
+                updated_points.append(
+                    {
+                        "id": stored.id,
+                        "rating": point["rating"],
+                        "delta": stored.delta + point["delta"],
+                    }
+                )
+
+        if new_points:
+            session.execute(insert(RatingPoint), new_points)
+        if updated_points:
+            session.execute(update(RatingPoint), updated_points)
+
+        self.rows = []
+        self.points = {}
+        self.pending = {}
+
+    def swap_versions(self, session: Session):
+        expected = [
+            (user_id, self.versions[user_id])
+            for user_id in self.pending
+            if user_id in self.versions
+        ]
+        for start in range(0, len(expected), RATING_CAS_CHUNK_SIZE):
+            chunk = expected[start : start + RATING_CAS_CHUNK_SIZE]
+            result = session.execute(
+                update(User)
+                .where(tuple_(User.id, User.rating_version).in_(chunk))
+                .values(rating_version=User.rating_version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != len(chunk):
+                # The whole transaction is rolled back, so report every user
+                # whose changes are rejected
+                raise RatingConflict([user_id for user_id, _ in chunk])
+
+        # Later changes in this transaction build on the versions written here
+        for user_id, version in expected:
+            self.versions[user_id] = version + 1
+
+
+def get_history_writer(session: Session) -> EloHistoryWriter:
+    writer = session.info.get(HISTORY_WRITER)
+    if writer is None:
+        writer = session.info[HISTORY_WRITER] = EloHistoryWriter()
+    return writer
+
+
+def flush_elo_history(session: Session):
+    writer = session.info.get(HISTORY_WRITER)
+    if writer is not None:
+        writer.flush(session)
+
+
+@event.listens_for(Session, "before_commit")
+def _flush_history_writer(session: Session):
+    writer = session.info.pop(HISTORY_WRITER, None)
+    if writer is not None:
+        writer.flush(session)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_history_writer(session: Session, transaction):
+    # Buffered rows and observed rating versions belong to one transaction
+    if transaction.parent is None:
+        session.info.pop(HISTORY_WRITER, None)
+
+
+def count_history_rows(session: Session, rows: int):
+    session.info[HISTORY_ROWS_PENDING] = (
+        session.info.get(HISTORY_ROWS_PENDING, 0) + rows
+    )
+
+
+def take_history_rows_written(session: Session) -> int:
+    return session.info.pop(HISTORY_ROWS_WRITTEN, 0)
+
+
+@event.listens_for(Session, "after_commit")
+def _commit_history_rows(session: Session):
+    rows = session.info.pop(HISTORY_ROWS_PENDING, 0)
+    if rows:
+        session.info[HISTORY_ROWS_WRITTEN] = (
+            session.info.get(HISTORY_ROWS_WRITTEN, 0) + rows
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_history_rows(session: Session):
+    session.info.pop(HISTORY_ROWS_PENDING, None)
+
+
+def add_elo_history(
+    session: Session,
+    user_id: int,
+    contest_id: int,
+    elo_before: int,
+    elo_after: int,
+    change_reason: str,
+):
+    get_history_writer(session).add(
+        user_id, contest_id, elo_before, elo_after, change_reason
+    )
 
 
 def update_elo_points(user: User, contest: Contest, elo_change: int, session: Session):
     elo_before = calculate_current_elo(user.id, session)
     elo_after = elo_before + elo_change
 
-    # Create a new EloHistory record
-    elo_history_entry = EloHistory(
-        user_id=user.id,
-        contest_id=contest.id,
-        elo_points_before=elo_before,
-        elo_points_after=elo_after,
-        change_reason="Contest participation",
+    add_elo_history(
+        session,
+        user.id,
+        contest.id,
+        elo_before,
+        elo_after,
+        "Contest participation",
     )
 
-    session.add(elo_history_entry)
-    session.commit()
-
 
+@tracing.traced("current_rating")
 def calculate_current_elo(user_id: int, session: Session) -> int:
-    elo_points = (
+    elo_points, version = (
         session.query(
-            func.sum(EloHistory.elo_points_after - EloHistory.elo_points_before)
+            func.sum(EloHistory.elo_points_after - EloHistory.elo_points_before),
+            select(User.rating_version).where(User.id == user_id).scalar_subquery(),
         )
         .filter(EloHistory.user_id == user_id)
-        .scalar()
+        .one()
     )  # type: ignore
 
-    return elo_points if elo_points is not None else 0
+    elo_points = elo_points if elo_points is not None else 0
+
+    writer = get_history_writer(session)
+    if version is not None:
+        writer.observe(user_id, version)
+    # Changes buffered in this transaction but not written yet
+    elo_points += writer.pending_delta(user_id)
+
+    return elo_points
@@ -0,0 +1,65 @@
+import math
+
+import numpy as np
+
+from .elo_service import ContestInput, ELOService
+from .glicko2 import contest_points, performance_scores
+from .rating_engine import RatingChange
+
+# Elements per block of the expected-score matrix (8 bytes each), which bounds
+# memory at ~32 MB however large the contest is
+BLOCK_ELEMENTS = 4_000_000
+# 10 ** (d / 400) == exp(d * ELO_EXPONENT)
+ELO_EXPONENT = math.log(10) / 400
+
+
+def expected_scores(ratings: np.ndarray, block_elements=BLOCK_ELEMENTS) -> np.ndarray:
+    # Mean ELO win probability of every participant against each of the
+    # others. The n x n matrix is built and summed one block of rows at a time.
+    n = len(ratings)
+    rows = max(1, block_elements // n)
+    scaled = ratings * ELO_EXPONENT
+    totals = np.empty(n)
+    block = np.empty((min(rows, n), n))
+    for start in range(0, n, rows):
+        stop = min(start + rows, n)
+        out = block[: stop - start]
+        np.subtract(scaled[None, :], scaled[start:stop, None], out=out)
+        np.exp(out, out=out)
+        out += 1
+        np.reciprocal(out, out=out)
+        totals[start:stop] = out.sum(axis=1)
+    # Less each participant's game against themselves, worth 0.5
+    return (totals - 0.5) / (n - 1)
+
+
+class PairwiseELOEngine(ELOService):
+    # ELO against every other participant instead of the field's average:
+    # the actual score is the share of the field out-performed on bugs found,
+    # the expected score the mean head-to-head win probability
+    name = "elo_pairwise"
+
+    def rate_contest(self, contest: ContestInput) -> list[RatingChange]:
+        user_ids = list(contest.ratings)
+        if len(user_ids) < 2:
+            return []
+
+        ratings = np.fromiter(contest.ratings.values(), np.float64, len(user_ids))
+        k_factors = np.array(
+            [self.get_adjusted_k_factor(contest.roles[user_id]) for user_id in user_ids]
+        )
+
+        expected = expected_scores(ratings)
+        actual = performance_scores(contest_points(contest, user_ids))
+        # Truncated like the per-report changes of the field model
+        changes = np.trunc(k_factors * (actual - expected))
+        # Not floored at 0: the points a floor drops would be lost to the
+        # field, and total rating would drift up with every contest
+        after = (ratings + changes).astype(np.int64)
+
+        return [
+            RatingChange(user_id, before, rating, "Contest participation")
+            for user_id, before, rating in zip(
+                user_ids, contest.ratings.values(), after.tolist()
+            )
+        ]
@@ -0,0 +1,139 @@
+import math
+import threading
+import time
+from typing import Callable, NamedTuple
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+
+from . import config
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600}
+
+# "<scope>:<key>" -> "<requests>/<period>"; override with
+# RATE_LIMIT_<SCOPE>_<KEY>, e.g. RATE_LIMIT_TOKEN_IP=100/minute, or "off"
+DEFAULT_LIMITS = {
+    "token:ip": "20/minute",
+    "token:username": "5/minute",
+    "create_user:ip": "10/minute",
+    "signup:ip": "30/minute",
+}
+
+
+class RateLimit(NamedTuple):
+    capacity: int  # Burst size
+    rate: float  # Tokens refilled per second
+
+
+def parse_limit(value: str) -> RateLimit | None:
+    if value.lower() == "off":
+        return None
+    count, period = value.split("/")
+    return RateLimit(int(count), int(count) / PERIODS[period])
+
+
+def configured_limits() -> dict[str, RateLimit]:
+    limits = {}
+    for name, default in DEFAULT_LIMITS.items():
+        env = "RATE_LIMIT_" + name.replace(":", "_").upper()
+        limit = parse_limit(config.RATE_LIMITS.get(env, default))
+        if limit is not None:
+            limits[name] = limit
+    return limits
+
+
+class RateLimiter:
+    # Token buckets kept as (tokens, last_update) tuples in one dict. A bucket
+    # that has been idle long enough to refill completely is the same as no
+    # bucket, so those are swept out periodically and memory only holds
+    # clients seen recently.
+
+    def __init__(
+        self,
+        limits: dict[str, RateLimit],
+        clock: Callable[[], float] = time.monotonic,
+        sweep_interval: float = 60.0,
+    ):
+        self.limits = limits
+        self.clock = clock
+        self.sweep_interval = sweep_interval
+        self._buckets: dict[tuple[str, str], tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = clock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def hit(self, scope: str, key: str) -> float:
+        # Takes a token; returns 0 if allowed, else seconds until one is free
+        limit = self.limits.get(scope)
+        if limit is None:
+            return 0.0
+
+        name = (scope, key)
+        with self._lock:
+            now = self.clock()
+            tokens, updated = self._buckets.get(name, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+
+            if tokens >= 1:
+                self._buckets[name] = (tokens - 1, now)
+                retry_after = 0.0
+            else:
+                self._buckets[name] = (tokens, now)
+                retry_after = (1 - tokens) / limit.rate
+
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now)
+
+        return retry_after
+
+    def enforce(self, scope: str, key: str):
+        retry_after = self.hit(scope, key)
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def _sweep(self, now: float):
+        active = {}
+        for name, (tokens, updated) in self._buckets.items():
+            limit = self.limits[name[0]]
+            if tokens + (now - updated) * limit.rate < limit.capacity:
+                active[name] = (tokens, updated)
+        self._buckets = active
+        self._last_sweep = now
+
+
+limiter = RateLimiter(configured_limits())
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+# The checks are async so they run inline on the event loop instead of
+# costing a threadpool hop per request
+
+
+def limit(scope: str):
+    # Dependency applying the per-IP limit of a route
+    async def check(request: Request):
+        limiter.enforce(f"{scope}:ip", client_ip(request))
+
+    return check
+
+
+async def limit_login(
+    request: Request, form_data: OAuth2PasswordRequestForm = Depends()
+):
+    # Per IP and per username, before the password is checked: guessing one
+    # account's password from many addresses is limited too
+    limiter.enforce("token:ip", client_ip(request))
+    limiter.enforce("token:username", form_data.username)
@@ -0,0 +1,62 @@
+import math
+from array import array
+from bisect import bisect_left
+from typing import Iterable, NamedTuple
+
+# Rating distribution of every user with rating history, kept as one sorted
+# array. Built with each leaderboard cache generation, so all answers are
+# exact for that generation: a percentile is one binary search (O(log n)),
+# quantiles an index and the histogram one binary search per bin edge.
+
+QUANTILES = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+
+
+class HistogramBin(NamedTuple):
+    low: int  # Inclusive
+    high: int  # Exclusive
+    count: int
+
+
+class RatingDistribution:
+    def __init__(self, ratings: Iterable[int], descending: bool = False):
+        # Ratings in leaderboard order are already sorted, just reversed
+        if descending:
+            self.ratings = array("q", ratings)
+            self.ratings.reverse()
+        else:
+            self.ratings = array("q", sorted(ratings))
+
+    def __len__(self) -> int:
+        return len(self.ratings)
+
+    def percentile(self, rating: int) -> float:
+        # Share of rated users with a lower rating, in percent
+        return 100 * bisect_left(self.ratings, rating) / len(self.ratings)
+
+    def top_percent(self, rating: int) -> float:
+        # Share of rated users rated at least as high ("top 7%"), in percent
+        return (
+            100
+            * (len(self.ratings) - bisect_left(self.ratings, rating))
+            / len(self.ratings)
+        )
+
+    def quantile(self, q: float) -> int:
+        # Nearest-rank: the smallest rating with at least q of the users at or
+        # below it
+        rank = max(1, math.ceil(q * len(self.ratings)))
+        return self.ratings[min(rank, len(self.ratings)) - 1]
+
+    def histogram(self, bins: int) -> list[HistogramBin]:
+        # Equal-width integer bins covering the lowest to the highest rating;
+        # fewer bins when the range is narrower than `bins`
+        if not self.ratings:
+            return []
+        low, high = self.ratings[0], self.ratings[-1] + 1
+        width = math.ceil((high - low) / bins)
+        edges = list(range(low, high, width)) + [high]
+        below = [bisect_left(self.ratings, edge) for edge in edges]
+        return [
+            HistogramBin(start, stop, after - before)
+            for start, stop, before, after in zip(edges, edges[1:], below, below[1:])
+        ]
@@ -0,0 +1,44 @@
+from typing import TYPE_CHECKING, NamedTuple, Protocol
+
+if TYPE_CHECKING:
+    from .elo_service import ContestInput
+
+
+class RatingChange(NamedTuple):
+    user_id: int
+    elo_points_before: int
+    elo_points_after: int
+    change_reason: str
+    # New rating deviation and volatility, for engines that track them
+    deviation: float | None = None
+    volatility: float | None = None
+
+
+class RatingEngine(Protocol):
+    # Rates a whole contest at once: everything the engine needs is in the
+    # ContestInput, and it returns one RatingChange per participant whose
+    # rating (or confidence) changed. Engines do no database access.
+    name: str
+    tracks_deviation: bool
+
+    def rate_contest(self, contest: "ContestInput") -> list[RatingChange]: ...
+
+
+RATING_ENGINES = ("elo", "elo_pairwise", "glicko2")
+
+
+def get_rating_engine(name: str) -> RatingEngine:
+    # Imported here so the NumPy-based engines cost nothing unless selected
+    if name == "elo":
+        from .elo_service import ELOService
+
+        return ELOService()
+    if name == "elo_pairwise":
+        from .pairwise_elo import PairwiseELOEngine
+
+        return PairwiseELOEngine()
+    if name == "glicko2":
+        from .glicko2 import Glicko2Engine
+
+        return Glicko2Engine()
+    raise ValueError(f"Unknown rating engine: {name}")
@@ -0,0 +1,376 @@
+import os
+import tempfile
+
+import numpy as np
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .crud import (
+    LEADERBOARD_SNAPSHOT_SIZE,
+    RESERVE_WATSON_RANKS,
+    SENIOR_WATSON_RANKS,
+    leaderboard_cache,
+    publish_rating_snapshot,
+    save_contest_stats,
+)
+from .elo_service import ContestInput, ELOService
+from .models import contest_participants
+from .rating_engine import RatingEngine
+from .rating_snapshot import ROLE_CODES, ROLES
+
+# Recomputes every rating from the first processed contest on, e.g. after a
+# change to the penalties or a scoring fix. Contests are replayed in end_date
+# order against ratings held in memory, one flat array per attribute indexed
+# by user id, so nothing is read back per user: each contest costs its
+# participant and report queries plus bulk inserts of the rows it produces.
+# Roles start from the default and are updated after every contest, as when
+# the contest is closed.
+#
+# Every `checkpoint_every` contests the rows are committed and the arrays are
+# saved to the checkpoint file; a rebuild started again with the same file
+# drops whatever was written after the checkpoint and resumes from there.
+
+CHECKPOINT_EVERY = 50  # Contests between commits and checkpoints
+WATSON = ROLE_CODES["watson"]
+RESERVE_WATSON = ROLE_CODES["reserve_watson"]
+SENIOR_WATSON = ROLE_CODES["senior_watson"]
+
+DERIVED_TABLES = (models.EloHistory, models.RatingPoint, models.LeaderboardSnapshot)
+
+
+class RatingState:
+    FIELDS = ("ratings", "after_sums", "after_counts", "roles", "deviations")
+
+    def __init__(self, capacity: int):
+        self.ratings = np.zeros(capacity, np.int64)
+        # Sum and count of elo_points_after over the history rows so far; the
+        # sum ranks the role tiers, both feed the opponent ratings
+        self.after_sums = np.zeros(capacity, np.int64)
+        self.after_counts = np.zeros(capacity, np.int64)
+        self.roles = np.full(capacity, WATSON, np.uint8)
+        # (deviation, volatility); NaN until an engine that tracks them rated
+        # the user
+        self.deviations = np.full((capacity, 2), np.nan)
+
+    def grow(self, capacity: int):
+        if capacity <= len(self.ratings):
+            return
+        grown = RatingState(capacity)
+        for name in self.FIELDS:
+            current = getattr(self, name)
+            getattr(grown, name)[: len(current)] = current
+            setattr(self, name, getattr(grown, name))
+
+    def save(self, path: str, engine: str, done: int):
+        # Written aside and renamed, so a crash leaves the previous checkpoint;
+        # the temporary name is unique so concurrent rebuilds do not share it
+        fd, temporary = tempfile.mkstemp(
+            dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}."
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    engine=np.array(engine),
+                    done=np.array(done),
+                    **{name: getattr(self, name) for name in self.FIELDS},
+                )
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    @classmethod
+    def load(cls, path: str, engine: str):
+        with np.load(path) as checkpoint:
+            if str(checkpoint["engine"]) != engine:
+                raise ValueError(
+                    f"Checkpoint {path} was written by the "
+                    f"{checkpoint['engine']} engine, not {engine}"
+                )
+            state = cls(0)
+            for name in cls.FIELDS:
+                setattr(state, name, checkpoint[name])
+            return state, int(checkpoint["done"])
+
+
+def contests_to_replay(db: Session) -> list[int]:
+    return list(
+        db.scalars(
+            select(models.Contest.id)
+            .join(
+                models.ContestProcessing,
+                models.ContestProcessing.contest_id == models.Contest.id,
+            )
+            .where(models.ContestProcessing.status == models.PROCESSING_COMPLETED)
+            .order_by(models.Contest.end_date, models.Contest.id)
+        )
+    )
+
+
+def delete_contest_rows(contest_ids: list[int], db: Session):
+    for start in range(0, len(contest_ids), models.RATING_CAS_CHUNK_SIZE):
+        chunk = contest_ids[start : start + models.RATING_CAS_CHUNK_SIZE]
+        for table in DERIVED_TABLES:
+            db.execute(delete(table).where(table.contest_id.in_(chunk)))
+
+
+class RatingRebuild:
+    def __init__(
+        self,
+        db: Session,
+        engine: RatingEngine,
+        checkpoint_path: str | None = None,
+        checkpoint_every: int = CHECKPOINT_EVERY,
+    ):
+        self.db = db
+        self.engine = engine
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.history = []
+        self.points = []
+        self.snapshots = []
+
+    def run(self, progress=None) -> int:
+        # Returns the number of contests replayed by this run
+        contests = contests_to_replay(self.db)
+        state, done = self.start(contests)
+
+        for position in range(done, len(contests)):
+            self.replay_contest(contests[position], state)
+            replayed = position + 1
+            if replayed % self.checkpoint_every == 0 or replayed == len(contests):
+                self.write_rows()
+                self.db.commit()
+                if self.checkpoint_path:
+                    state.save(self.checkpoint_path, self.engine.name, replayed)
+                if progress:
+                    progress(replayed, len(contests))
+
+        self.finish(state, contests)
+        return len(contests) - done
+
+    def start(self, contests: list[int]):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            state, done = RatingState.load(self.checkpoint_path, self.engine.name)
+            # Rows of contests past the checkpoint may have been committed
+            # before the run stopped
+            delete_contest_rows(contests[done:], self.db)
+        else:
+            delete_contest_rows(contests, self.db)
+            self.db.execute(delete(models.RatingDeviation))
+            state, done = self.seed_state(), 0
+        self.db.commit()
+        return state, done
+
+    def seed_state(self) -> RatingState:
+        # History of contests that are not replayed (initial ratings, manual
+        # adjustments) is kept and counts as the starting point
+        capacity = (self.db.scalar(select(func.max(models.User.id))) or 0) + 1
+        state = RatingState(capacity)
+        for user_id, rating, after_sum, after_count in self.db.execute(
+            select(
+                models.EloHistory.user_id,
+                func.sum(
+                    models.EloHistory.elo_points_after
+                    - models.EloHistory.elo_points_before
+                ),
+                func.sum(models.EloHistory.elo_points_after),
+                func.count(),
+            ).group_by(models.EloHistory.user_id)
+        ):
+            state.grow(user_id + 1)
+            state.ratings[user_id] = rating
+            state.after_sums[user_id] = after_sum
+            state.after_counts[user_id] = after_count
+        return state
+
+    def replay_contest(self, contest_id: int, state: RatingState):
+        participants = np.fromiter(
+            self.db.scalars(
+                select(contest_participants.c.user_id)
+                .where(contest_participants.c.contest_id == contest_id)
+                .order_by(contest_participants.c.user_id)
+            ),
+            np.int64,
+        )
+        if not len(participants):
+            return
+        state.grow(int(participants.max()) + 1)
+
+        contest = ContestInput(
+            contest_id,
+            ratings=dict(
+                zip(participants.tolist(), state.ratings[participants].tolist())
+            ),
+            roles={
+                user_id: ROLES[code - 1]
+                for user_id, code in zip(
+                    participants.tolist(), state.roles[participants].tolist()
+                )
+            },
+        )
+        ELOService.load_contest_reports(contest, self.db)
+        state.grow(max(contest.reports, default=0) + 1)
+        for user_id, reports in contest.reports.items():
+            # load_contest_input joins the history once per report, so the
+            # opponent average weighs reporters by their number of reports
+            if state.after_counts[user_id]:
+                contest.reporter_history[user_id] = (
+                    int(state.after_sums[user_id]) * len(reports),
+                    int(state.after_counts[user_id]) * len(reports),
+                )
+        if self.engine.tracks_deviation:
+            known = participants[~np.isnan(state.deviations[participants, 0])]
+            contest.deviations = {
+                user_id: tuple(deviation)
+                for user_id, deviation in zip(
+                    known.tolist(), state.deviations[known].tolist()
+                )
+            }
+
+        changes = self.engine.rate_contest(contest)
+        self.apply(contest_id, changes, state)
+        self.snapshot(contest_id, state)
+        self.update_roles(participants, state)
+
+    def apply(self, contest_id: int, changes, state: RatingState):
+        points = {}
+        for change in changes:
+            self.history.append(
+                {
+                    "user_id": change.user_id,
+                    "contest_id": contest_id,
+                    "elo_points_before": change.elo_points_before,
+                    "elo_points_after": change.elo_points_after,
+                    "change_reason": change.change_reason,
+                }
+            )
+            delta = change.elo_points_after - change.elo_points_before
+            point = points.setdefault(change.user_id, [0, 0])
+            point[0] = change.elo_points_after
+            point[1] += delta
+            if change.deviation is not None:
+                state.deviations[change.user_id] = (change.deviation, change.volatility)
+
+        if not changes:
+            return
+        user_ids = np.array([change.user_id for change in changes])
+        np.add.at(
+            state.ratings,
+            user_ids,
+            [change.elo_points_after - change.elo_points_before for change in changes],
+        )
+        np.add.at(
+            state.after_sums, user_ids, [change.elo_points_after for change in changes]
+        )
+        np.add.at(state.after_counts, user_ids, 1)
+
+        self.points.extend(
+            {
+                "user_id": user_id,
+                "contest_id": contest_id,
+                "rating": rating,
+                "delta": delta,
+            }
+            for user_id, (rating, delta) in points.items()
+        )
+
+    def snapshot(self, contest_id: int, state: RatingState):
+        # Same order as get_leaderboard: rating, then user id
+        rated = np.flatnonzero(state.after_counts)
+        top = rated[np.lexsort((rated, -state.ratings[rated]))][
+            :LEADERBOARD_SNAPSHOT_SIZE
+        ]
+        self.snapshots.extend(
+            {
+                "contest_id": contest_id,
+                "rank": rank,
+                "user_id": user_id,
+                "rating": rating,
+            }
+            for rank, (user_id, rating) in enumerate(
+                zip(top.tolist(), state.ratings[top].tolist()), start=1
+            )
+        )
+
+    @staticmethod
+    def update_roles(participants: np.ndarray, state: RatingState):
+        # get_role_tiers on the arrays: users with history ranked by the sum of
+        # elo_points_after; only the contest's participants change role
+        rated = np.flatnonzero(state.after_counts)
+        ranked = rated[np.lexsort((rated, -state.after_sums[rated]))]
+        tiers = np.full(len(state.roles), WATSON, np.uint8)
+        tiers[ranked[:SENIOR_WATSON_RANKS]] = SENIOR_WATSON
+        tiers[ranked[SENIOR_WATSON_RANKS:RESERVE_WATSON_RANKS]] = RESERVE_WATSON
+        state.roles[participants] = tiers[participants]
+
+    def write_rows(self):
+        for model, rows in zip(
+            DERIVED_TABLES, (self.history, self.points, self.snapshots)
+        ):
+            if rows:
+                self.db.execute(insert(model), rows)
+        self.history, self.points, self.snapshots = [], [], []
+
+    def finish(self, state: RatingState, contests: list[int]):
+        # The contests' average rating deltas changed with the history
+        for contest_id in contests:
+            save_contest_stats(contest_id, self.db)
+
+        # Replaced in this transaction, so finishing again after a failure
+        # past the commit does not insert the same users twice
+        self.db.execute(delete(models.RatingDeviation))
+        known = np.flatnonzero(~np.isnan(state.deviations[:, 0]))
+        if len(known):
+            self.db.execute(
+                insert(models.RatingDeviation),
+                [
+                    {
+                        "user_id": user_id,
+                        "deviation": deviation,
+                        "volatility": volatility,
+                    }
+                    for user_id, (deviation, volatility) in zip(
+                        known.tolist(), state.deviations[known].tolist()
+                    )
+                ],
+            )
+
+        user_ids = self.db.scalars(select(models.User.id)).all()
+        if user_ids:
+            self.db.execute(
+                update(models.User.__table__)
+                .where(models.User.id == bindparam("user_id"))
+                .values(role=bindparam("role")),
+                [
+                    {
+                        "user_id": user_id,
+                        "role": (
+                            ROLES[state.roles[user_id] - 1]
+                            if user_id < len(state.roles)
+                            else "watson"
+                        ),
+                    }
+                    for user_id in user_ids
+                ],
+            )
+        # Ratings computed elsewhere from the old history must not land
+        self.db.execute(
+            update(models.User).values(rating_version=models.User.rating_version + 1)
+        )
+        self.db.commit()
+
+        # The rebuild is complete once committed; a failure publishing it
+        # below must not leave a checkpoint to resume from
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+        # Every worker serves the rebuilt ratings: the new rating snapshot
+        # generation makes the others rebuild their leaderboard caches, and
+        # this rebuild rewrites the leaderboard snapshot file for restarts
+        publish_rating_snapshot(self.db)
+        leaderboard_cache.rebuild()
@@ -0,0 +1,156 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from typing import NamedTuple
+
+# Ratings, ranks and roles of every user in one file that all worker processes
+# map into memory. The columns are indexed by user id, so a lookup is three
+# array reads with no parsing or copying.
+#
+# A new version is written aside and renamed over the path. Before the rename
+# the writer opens the old file, and afterwards stamps the new generation into
+# its header; readers still mapping the old file see that stamp in shared
+# memory and remap, without a syscall or any IPC per lookup.
+#
+# Columns are in native byte order: the file is shared between processes on
+# one host, not exchanged between machines.
+
+MAGIC = b"RSN1"
+# magic, generation, latest generation, built_at, capacity (max user id + 1)
+HEADER = struct.Struct("=4sQQdI")
+LATEST_OFFSET = 12
+HEADER_SIZE = 64  # Keeps the int32 columns aligned
+
+ROLES = ("watson", "reserve_watson", "senior_watson")
+ROLE_CODES = {role: code for code, role in enumerate(ROLES, start=1)}  # 0: no user
+
+
+class RatingRecord(NamedTuple):
+    rating: int
+    rank: int | None
+    role: str
+    generation: int
+
+
+def read_generation(path: str) -> int:
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return 0
+    if len(header) < HEADER.size or header[:4] != MAGIC:
+        return 0
+    return HEADER.unpack(header)[1]
+
+
+def write_rating_snapshot(path: str, users, ranking) -> int:
+    # users: (user_id, role) of every user; ranking: (user_id, rating) in
+    # rank order, users without rating history omitted
+    roles = dict(users)
+    capacity = max(roles, default=-1) + 1
+    ratings = array("i", bytes(4 * capacity))
+    ranks = array("i", bytes(4 * capacity))
+    codes = bytearray(capacity)
+
+    for user_id, role in roles.items():
+        codes[user_id] = ROLE_CODES.get(role, ROLE_CODES["watson"])
+    for rank, (user_id, rating) in enumerate(ranking, start=1):
+        if user_id < capacity:
+            ratings[user_id] = rating
+            ranks[user_id] = rank
+
+    # Writers in different processes take turns, so generations stay unique
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        generation = read_generation(path) + 1
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as f:
+            header = HEADER.pack(MAGIC, generation, generation, time.time(), capacity)
+            f.write(header.ljust(HEADER_SIZE, b"\0"))
+            ratings.tofile(f)
+            ranks.tofile(f)
+            f.write(codes)
+            f.flush()
+            os.fsync(f.fileno())
+
+        try:
+            previous = open(path, "r+b")
+        except FileNotFoundError:
+            previous = None
+
+        os.replace(temporary, path)
+
+        if previous is not None:
+            with previous:
+                previous.seek(LATEST_OFFSET)
+                previous.write(struct.pack("=Q", generation))
+
+    return generation
+
+
+class _Mapping:
+    __slots__ = ("mm", "generation", "capacity", "ratings", "ranks", "roles")
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.generation, _, _, self.capacity = HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a rating snapshot")
+
+        view = memoryview(self.mm)
+        columns = HEADER_SIZE + 4 * self.capacity
+        self.ratings = view[HEADER_SIZE:columns].cast("i")
+        self.ranks = view[columns : columns + 4 * self.capacity].cast("i")
+        self.roles = view[columns + 4 * self.capacity :]
+
+    def superseded(self) -> bool:
+        return struct.unpack_from("=Q", self.mm, LATEST_OFFSET)[0] != self.generation
+
+
+class RatingSnapshotReader:
+    def __init__(self, path: str):
+        self.path = path
+        self._mapping: _Mapping | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        mapping = self._current()
+        return mapping.generation if mapping else 0
+
+    def get(self, user_id: int) -> RatingRecord | None:
+        mapping = self._current()
+        if mapping is None or not 0 <= user_id < mapping.capacity:
+            return None
+
+        role = mapping.roles[user_id]
+        if not role:
+            return None
+        rank = mapping.ranks[user_id]
+        return RatingRecord(
+            mapping.ratings[user_id],
+            rank or None,
+            ROLES[role - 1],
+            mapping.generation,
+        )
+
+    def _current(self) -> _Mapping | None:
+        mapping = self._mapping
+        if mapping is not None and not mapping.superseded():
+            return mapping
+
+        with self._lock:
+            if self._mapping is mapping:
+                try:
+                    # The old mapping is unmapped once no lookup uses it
+                    self._mapping = _Mapping(self.path)
+                except (FileNotFoundError, ValueError):
+                    self._mapping = None
+            return self._mapping
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from pydantic import BaseModel, ConfigDict
 
 
@@ -47,3 +49,98 @@ class EloHistoryCreate(BaseModel):
     change_reason: str
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class RatingPoint(BaseModel):
+    contest_id: int
+    rating: int
+    delta: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    rating: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class UserRating(BaseModel):
+    user_id: int
+    rating: int
+    rank: int | None
+    role: str
+    generation: int  # Rating snapshot generation; 0 when read from the database
+
+
+class ContestStats(BaseModel):
+    contest_id: int
+    participants: int
+    participants_without_findings: int
+    bugs: dict[str, int]  # Bugs found per severity
+    reports: int
+    duplicate_reports: int  # Reports of a bug beyond its first one
+    duplicate_ratio: float  # duplicate_reports / reports
+    average_rating_delta: float
+    computed_at: datetime
+
+
+class RatingQuantile(BaseModel):
+    quantile: float
+    rating: int
+
+
+class RatingHistogramBin(BaseModel):
+    low: int  # Inclusive
+    high: int  # Exclusive
+    count: int
+
+
+class RatingStats(BaseModel):
+    rated_users: int
+    generation: int  # Leaderboard cache generation the stats were computed from
+    quantiles: list[RatingQuantile]
+    histogram: list[RatingHistogramBin]
+
+
+class UserPercentile(BaseModel):
+    user_id: int
+    rating: int | None  # None without rating history
+    percentile: float | None  # Share of rated users rated lower
+    top_percent: float | None  # Share of rated users rated at least as high
+    rated_users: int
+    generation: int
+
+
+class LeaderboardCacheStats(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float
+    rebuilds: int
+    rebuild_errors: int
+    last_rebuild_seconds: float
+    total_rebuild_seconds: float
+    generation: int
+    size: int
+    warm_start: bool
+
+
+class AdmissionClassStats(BaseModel):
+    limit: int | None  # Concurrent requests of the class; None when uncapped
+    in_flight: int
+    waiting: int
+    admitted: int
+    queued: int  # Admitted after waiting for a slot
+    timed_out: int
+    queue_seconds: float
+    average_queue_seconds: float
+    max_queue_seconds: float
+    queue_time_buckets: dict[str, int]  # Upper bound in seconds -> requests
+
+
+class AdmissionStats(BaseModel):
+    max_concurrency: int
+    in_flight: int
+    classes: dict[str, AdmissionClassStats]
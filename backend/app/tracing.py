@@ -0,0 +1,222 @@
+import functools
+import json
+import os
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from . import config
+
+# Minimal in-process tracing for the rating pipeline. A trace is started
+# (and sampled) by the outermost trace() call, e.g. one contest run; span()
+# and @traced only record inside a sampled trace and are a context variable
+# lookup otherwise. Finished traces go to an exporter: a JSON-lines file or a
+# bounded in-memory collector.
+
+MAX_SPANS_PER_TRACE = 10_000
+# Tags of the root span copied onto every span of its trace
+INHERITED_TAGS = ("contest_id",)
+
+
+class NoopSpan:
+    def set(self, **tags):
+        pass
+
+
+NOOP = NoopSpan()
+
+
+class Trace:
+    def __init__(self):
+        self.trace_id = secrets.token_hex(8)
+        self.inherited = {}
+        self.spans = []
+        self.span_ids = 0
+        self.dropped = 0
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "tags")
+
+    def __init__(self, trace: Trace, parent_id: int | None, name: str, tags: dict):
+        trace.span_ids += 1
+        self.trace = trace
+        self.span_id = trace.span_ids
+        self.parent_id = parent_id
+        self.name = name
+        self.tags = {**trace.inherited, **tags}
+
+    def set(self, **tags):
+        self.tags.update(tags)
+
+
+# The innermost open span; NOOP inside a trace that was not sampled
+_current: ContextVar[Span | NoopSpan | None] = ContextVar("trace_span", default=None)
+
+
+TAIL_BLOCK_SIZE = 64 * 1024  # Bytes read at a time from the end of a span file
+
+
+class MemoryCollector:
+    def __init__(self, capacity: int):
+        self._spans = deque(maxlen=capacity)
+
+    def export(self, spans: list[dict]):
+        self._spans.extend(spans)
+
+    def spans(self, limit: int | None = None) -> list[dict]:
+        spans = list(self._spans)
+        return spans[-limit:] if limit else spans
+
+    def clear(self):
+        self._spans.clear()
+
+
+class JsonLinesExporter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[dict]):
+        lines = "".join(json.dumps(span) + "\n" for span in spans)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+
+    def spans(self, limit: int | None = None) -> list[dict]:
+        try:
+            with open(self.path, "rb") as f:
+                lines = f.read().splitlines() if limit is None else tail(f, limit)
+        except FileNotFoundError:
+            return []
+        return [json.loads(line) for line in lines]
+
+
+def tail(f, count: int, block_size: int = TAIL_BLOCK_SIZE) -> list[bytes]:
+    # The last `count` lines, read in blocks back from the end of the file so
+    # the cost does not grow with the file
+    position = f.seek(0, os.SEEK_END)
+    data = b""
+    while position > 0 and data.count(b"\n") <= count:
+        step = min(block_size, position)
+        position -= step
+        f.seek(position)
+        data = f.read(step) + data
+    return data.splitlines()[-count:]
+
+
+class Tracer:
+    def __init__(self, sample_rate: float, exporter, sampler=random.random):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.sampler = sampler
+
+    @contextmanager
+    def trace(self, name: str, **tags):
+        # Starts a trace, or is a child span when one is already open
+        if _current.get() is not None:
+            with self.span(name, **tags) as span:
+                yield span
+            return
+
+        if not self.sample_rate or self.sampler() >= self.sample_rate:
+            token = _current.set(NOOP)
+            try:
+                yield NOOP
+            finally:
+                _current.reset(token)
+            return
+
+        trace = Trace()
+        trace.inherited = {tag: tags[tag] for tag in INHERITED_TAGS if tag in tags}
+        try:
+            with self._record(trace, None, name, tags) as span:
+                yield span
+        finally:
+            if trace.dropped:
+                trace.spans[-1]["tags"]["dropped_spans"] = trace.dropped
+            self.exporter.export(trace.spans)
+
+    @contextmanager
+    def span(self, name: str, **tags):
+        parent = _current.get()
+        if not isinstance(parent, Span):
+            yield NOOP
+            return
+        with self._record(parent.trace, parent.span_id, name, tags) as span:
+            yield span
+
+    @contextmanager
+    def _record(self, trace: Trace, parent_id: int | None, name: str, tags: dict):
+        if len(trace.spans) >= MAX_SPANS_PER_TRACE:
+            # Counted on the root span; the subtree is not recorded either
+            trace.dropped += 1
+            token = _current.set(NOOP)
+            try:
+                yield NOOP
+            finally:
+                _current.reset(token)
+            return
+
+        span = Span(trace, parent_id, name, tags)
+        token = _current.set(span)
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.tags["error"] = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            _current.reset(token)
+            trace.spans.append(
+                {
+                    "trace_id": trace.trace_id,
+                    "span_id": span.span_id,
+                    "parent_id": parent_id,
+                    "name": name,
+                    "start": started_at,
+                    "duration_ms": duration * 1000,
+                    "tags": span.tags,
+                }
+            )
+
+
+tracer = Tracer(
+    config.TRACE_SAMPLE_RATE,
+    (
+        JsonLinesExporter(config.TRACE_EXPORT_PATH)
+        if config.TRACE_EXPORT_PATH
+        else MemoryCollector(config.TRACE_BUFFER_SPANS)
+    ),
+)
+
+
+def trace(name: str, **tags):
+    return tracer.trace(name, **tags)
+
+
+def span(name: str, **tags):
+    return tracer.span(name, **tags)
+
+
+def traced(name: str):
+    # Records a call as a span (with `rows` when the result has a length)
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not isinstance(_current.get(), Span):
+                return function(*args, **kwargs)
+            with tracer.span(name) as span:
+                result = function(*args, **kwargs)
+                if hasattr(result, "__len__"):
+                    span.set(rows=len(result))
+                return result
+
+        return wrapper
+
+    return decorate
@@ -1,30 +1,130 @@
-import os
+import math
+import time
+from contextlib import asynccontextmanager
 from datetime import timedelta
 
 import jwt
-from fastapi import FastAPI, Depends, HTTPException, status, Header
+from fastapi import (
+    APIRouter,
+    FastAPI,
+    Depends,
+    HTTPException,
+    Query,
+    status,
+    Header,
+    Request,
+    Response,
+    WebSocket,
+)
+from fastapi.responses import PlainTextResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
-from .app import crud, models, schemas, auth
-from .app.database import SessionLocal, engine
+from .app import (
+    config,
+    crud,
+    models,
+    schemas,
+    auth,
+    rate_limit,
+    admission,
+    metrics,
+    tracing,
+)
+from .app.database import (
+    ReadSessionLocal,
+    SessionLocal,
+    dispose_engines,
+    get_batch_engine,
+    get_engine,
+    has_read_replica,
+)
 
-models.Base.metadata.create_all(bind=engine)
-app = FastAPI()
+# Every route holds an admission slot while it runs; admin jobs are queued
+# behind interactive requests and capped so they cannot take all the slots
+router = APIRouter(dependencies=[Depends(admission.admit(admission.INTERACTIVE))])
+admin_router = APIRouter(dependencies=[Depends(admission.admit(admission.BATCH))])
 
 # OAuth2 scheme for bearer token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# Default admin token - should be changed in production
-ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your-secure-admin-token")
+ADMIN_TOKEN = config.ADMIN_TOKEN
 
-def get_db():
-    db = SessionLocal()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing touches the database at import; the engine is built here or on
+    # the first request, whichever comes first
+    if config.CREATE_SCHEMA_ON_STARTUP:
+        models.Base.metadata.create_all(bind=get_engine())
+    # Serve the persisted leaderboard until the database copy is rebuilt
+    crud.leaderboard_cache.warm()
+    yield
+    crud.leaderboard_feed.close()
+    dispose_engines()
+
+
+def read_metrics():
+    # Prometheus text format; outside admission control so a scrape never queues
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.include_router(router)
+    app.include_router(admin_router)
+    app.add_api_route(
+        "/metrics", read_metrics, methods=["GET"], include_in_schema=False
+    )
+    return app
+
+
+# Set on responses to writes; until it expires the client reads from the primary
+PRIMARY_COOKIE = "read_primary_until"
+
+
+def pinned_to_primary(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def get_db(request: Request, response: Response):
+    # GET requests read from the replica, unless this client wrote recently
+    if not has_read_replica():
+        db = SessionLocal()
+    elif request.method != "GET":
+        until = time.time() + config.READ_YOUR_WRITES_SECONDS
+        response.set_cookie(
+            PRIMARY_COOKIE,
+            f"{until:.3f}",
+            max_age=math.ceil(config.READ_YOUR_WRITES_SECONDS),
+            httponly=True,
+        )
+        db = SessionLocal()
+    elif pinned_to_primary(request):
+        db = SessionLocal()
+    else:
+        db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_batch_db():
+    # Admin jobs run on the primary through their own connection pool
+    db = SessionLocal(bind=get_batch_engine())
     try:
         yield db
     finally:
         db.close()
 
+
 def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=401,
@@ -53,18 +153,30 @@ def verify_admin_token(admin_token: str = Header(...)):
             detail="Invalid admin token.",
         )
     return True
-@app.get("/")
+
+
+@router.get("/")
 def read_root():
     return {"message": "Hello World"}
 
-@app.post("/users/", response_model=schemas.User)
+
+@router.post(
+    "/users/",
+    response_model=schemas.User,
+    dependencies=[Depends(rate_limit.limit("create_user"))],
+)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_user = crud.get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     return crud.create_user(db=db, user=user)
 
-@app.post("/token", response_model=schemas.Token)
+
+@router.post(
+    "/token",
+    response_model=schemas.Token,
+    dependencies=[Depends(rate_limit.limit_login)],
+)
 def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
     user = auth.authenticate_user(db, form_data.username, form_data.password)
     if not user:
@@ -77,32 +189,108 @@ def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2Passw
     access_token = auth.create_access_token(data={"sub": user.username}, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.post("/contests/{contest_id}/process_elo")
+
+@admin_router.post("/contests/{contest_id}/process_elo")
 def process_elo(
     contest_id: int,
-    db: Session = Depends(get_db),
-    _: bool = Depends(verify_admin_token)  # Admin token check
+    mode: str | None = None,
+    db: Session = Depends(get_batch_db),
+    _: bool = Depends(verify_admin_token),  # Admin token check
 ):
     try:
-        # TODO: review how to do this in one transaction
-        # 1: Process ELO for all participants
-        participants = crud.process_contest_elo(contest_id, db)
-        # 2: Update user roles based on their new ELO rankings
-        crud.update_user_roles(participants, db)
+        # One trace (when sampled) covers all three steps
+        with tracing.trace("process_elo", contest_id=contest_id):
+            # 1: Process ELO for all participants, committing in resumable chunks
+            participants = crud.process_contest_elo(contest_id, db, mode=mode)
+            # 2: Update user roles based on their new ELO rankings, then 3: share
+            # the new ratings and roles with the other workers. Both are
+            # checkpointed, so a retry after a crash between them still runs them.
+            if not crud.finish_contest_processing(contest_id, db, participants):
+                return {"message": "ELO already processed for this contest"}
         return {"message": "ELO points and roles updated for contest participants"}
+    except HTTPException as e:
+        if e.status_code == status.HTTP_409_CONFLICT:
+            # Ratings kept changing concurrently; the request can be retried
+            raise e
+        raise HTTPException(
+            status_code=400, detail="Error during processing: " + str(e)
+        )
     except Exception as e:
         raise HTTPException(status_code=400, detail="Error during processing: " + str(e))
 
-@app.post("/contests/{contest_id}/process_participation_days")
+
+@admin_router.post("/contests/{contest_id}/process_participation_days")
 def process_participation_days(
     contest_id: int,
-    db: Session = Depends(get_db),
-    _: bool = Depends(verify_admin_token)  # Admin token check
+    db: Session = Depends(get_batch_db),
+    _: bool = Depends(verify_admin_token),  # Admin token check
 ):
-    crud.process_participation_days(contest_id, db)
+    if not crud.process_participation_days(contest_id, db):
+        return {"message": "Participation days already added for this contest"}
     return {"message": "Participation days updated for contest participants"}
 
-@app.post("/contests/{contest_id}/signup/{user_id}")
+
+@admin_router.post("/contests/{contest_id}/close")
+def close_contest(
+    contest_id: int,
+    db: Session = Depends(get_batch_db),
+    _: bool = Depends(verify_admin_token),  # Admin token check
+):
+    # ELO, roles and participation days in one pass and one transaction
+    if not crud.close_contest(contest_id, db):
+        return {"message": "Contest already closed"}
+    return {
+        "message": "Contest closed: ELO points, roles and participation days updated"
+    }
+
+
+@router.get("/leaderboard", response_model=list[schemas.LeaderboardEntry])
+def read_leaderboard(limit: int = Query(100, ge=1, le=1000)):
+    return crud.leaderboard_cache.get().top(limit)
+
+
+@router.get("/leaderboard/cache_stats", response_model=schemas.LeaderboardCacheStats)
+def read_leaderboard_cache_stats():
+    return crud.leaderboard_cache.stats()
+
+
+@router.get("/admission/stats", response_model=schemas.AdmissionStats)
+def read_admission_stats():
+    return admission.controller.stats()
+
+
+@admin_router.get("/traces")
+def read_traces(
+    limit: int = Query(1000, ge=1, le=10000), _: bool = Depends(verify_admin_token)
+):
+    # Most recent spans of the sampled pipeline traces (TRACE_SAMPLE_RATE)
+    return tracing.tracer.exporter.spans(limit)
+
+
+@router.websocket("/ws/leaderboard")
+async def leaderboard_feed(websocket: WebSocket):
+    # Snapshot of the top 100 on connect, then one delta message per tick
+    await crud.leaderboard_feed.serve(websocket)
+
+
+@router.get(
+    "/contests/{contest_id}/leaderboard", response_model=list[schemas.LeaderboardEntry]
+)
+def read_contest_leaderboard(
+    contest_id: int, limit: int = 100, db: Session = Depends(get_db)
+):
+    return crud.get_leaderboard_snapshot(db, contest_id, limit=limit)
+
+
+@router.get("/contests/{contest_id}/stats", response_model=schemas.ContestStats)
+def read_contest_stats(contest_id: int, db: Session = Depends(get_db)):
+    return crud.get_contest_stats(db, contest_id)
+
+
+@router.post(
+    "/contests/{contest_id}/signup/{user_id}",
+    dependencies=[Depends(rate_limit.limit("signup"))],
+)
 def signup_for_contest(
     contest_id: int,
     user_id: int,
@@ -117,11 +305,48 @@ def signup_for_contest(
         raise HTTPException(status_code=400, detail="Error during signup: " + str(e))
 
 
-@app.get("/users/", response_model=list[schemas.User])
+@router.get("/users/", response_model=list[schemas.User])
 def read_users(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
     auditors = crud.get_users(db, skip=skip, limit=limit)
     return auditors
 
-@app.get("/users/me", response_model=schemas.User)
+
+@router.get("/users/{user_id}/elo_history", response_model=list[schemas.RatingPoint])
+def read_user_elo_history(user_id: int, db: Session = Depends(get_db)):
+    if crud.get_user(db, user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return crud.get_rating_timeline(db, user_id)
+
+
+@router.get(
+    "/users/{user_id}/elo_history/{contest_id}", response_model=schemas.RatingPoint
+)
+def read_user_rating_at_contest(
+    user_id: int, contest_id: int, db: Session = Depends(get_db)
+):
+    if crud.get_user(db, user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return crud.get_rating_at_contest(db, user_id, contest_id)
+
+
+@router.get("/users/{user_id}/rating", response_model=schemas.UserRating)
+def read_user_rating(user_id: int, db: Session = Depends(get_db)):
+    return crud.get_user_rating(db, user_id)
+
+
+@router.get("/users/{user_id}/percentile", response_model=schemas.UserPercentile)
+def read_user_percentile(user_id: int, db: Session = Depends(get_db)):
+    return crud.get_user_percentile(db, user_id)
+
+
+@router.get("/stats/ratings", response_model=schemas.RatingStats)
+def read_rating_stats(bins: int = Query(20, ge=1, le=200)):
+    return crud.get_rating_stats(bins)
+
+
+@router.get("/users/me", response_model=schemas.User)
 def read_users_me(current_user: schemas.User = Depends(get_current_user)):
-    return current_user
\ No newline at end of file
+    return current_user
+
+
+app = create_app()
@@ -0,0 +1,165 @@
+"""initial schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-19 11:43:38.569991
+
+Tables as created by models.Base.metadata.create_all before migrations were
+introduced. Existing databases can be adopted with `alembic stamp 0001`.
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "contest",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("start_date", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("end_date", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("date", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("contest", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_contest_id"), ["id"], unique=False)
+
+    op.create_table(
+        "user",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(), nullable=True),
+        sa.Column("email", sa.String(), nullable=True),
+        sa.Column("hashed_password", sa.String(), nullable=True),
+        sa.Column("participation_days", sa.Integer(), nullable=True),
+        sa.Column("role", sa.String(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("is_admin", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_user_email"), ["email"], unique=True)
+        batch_op.create_index(batch_op.f("ix_user_id"), ["id"], unique=False)
+        batch_op.create_index(batch_op.f("ix_user_username"), ["username"], unique=True)
+
+    op.create_table(
+        "bug",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column(
+            "severity",
+            sa.Enum("MEDIUM", "HIGH", "CRITICAL", name="bugseverity"),
+            nullable=False,
+        ),
+        sa.Column("reported_by_id", sa.Integer(), nullable=True),
+        sa.Column("contest_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["contest_id"],
+            ["contest.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["reported_by_id"],
+            ["user.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("bug", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_bug_id"), ["id"], unique=False)
+
+    op.create_table(
+        "contest_participants",
+        sa.Column("contest_id", sa.Integer(), nullable=True),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("signup_date", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["contest_id"],
+            ["contest.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["user.id"],
+        ),
+    )
+    op.create_table(
+        "elo_history",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("contest_id", sa.Integer(), nullable=True),
+        sa.Column("elo_points_before", sa.Integer(), nullable=True),
+        sa.Column("elo_points_after", sa.Integer(), nullable=True),
+        sa.Column("change_reason", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["contest_id"],
+            ["contest.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["user.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("elo_history", schema=None) as batch_op:
+        batch_op.create_index(
+            "idx_user_contest", ["user_id", "contest_id"], unique=False
+        )
+        batch_op.create_index(batch_op.f("ix_elo_history_id"), ["id"], unique=False)
+
+    op.create_table(
+        "bug_report",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("bug_id", sa.Integer(), nullable=True),
+        sa.Column("contest_id", sa.Integer(), nullable=True),
+        sa.Column("report_time", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["bug_id"],
+            ["bug.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["contest_id"],
+            ["contest.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["user.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("bug_report", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_bug_report_id"), ["id"], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("bug_report", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_bug_report_id"))
+
+    op.drop_table("bug_report")
+    with op.batch_alter_table("elo_history", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_elo_history_id"))
+        batch_op.drop_index("idx_user_contest")
+
+    op.drop_table("elo_history")
+    op.drop_table("contest_participants")
+    with op.batch_alter_table("bug", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_bug_id"))
+
+    op.drop_table("bug")
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_user_username"))
+        batch_op.drop_index(batch_op.f("ix_user_id"))
+        batch_op.drop_index(batch_op.f("ix_user_email"))
+
+    op.drop_table("user")
+    with op.batch_alter_table("contest", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_contest_id"))
+
+    op.drop_table("contest")
@@ -0,0 +1,85 @@
+"""hot path indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 11:43:39.798055
+
+Supporting indexes for the queries issued while processing a contest:
+
+* bug_report(contest_id, user_id) - reports of a participant in a contest
+* bug_report(bug_id) - duplicate counting in ELOService.get_duplicate_penalty
+* contest_participants(contest_id, user_id) - unique, signup existence check
+* elo_history(user_id, elo_points_before, elo_points_after) - covering index
+  for calculate_current_elo
+
+Duplicate signups, which were possible before the unique index, are merged
+first into one row per participant with the earliest signup_date. The table
+has no id column, so the duplicates are set aside, deleted and inserted once.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "idx_bug_report_contest_user", "bug_report", ["contest_id", "user_id"]
+    )
+    op.create_index("idx_bug_report_bug", "bug_report", ["bug_id"])
+
+    op.execute(
+        """
+        CREATE TEMPORARY TABLE contest_participants_duplicates AS
+        SELECT contest_id, user_id, MIN(signup_date) AS signup_date
+        FROM contest_participants
+        WHERE contest_id IS NOT NULL AND user_id IS NOT NULL
+        GROUP BY contest_id, user_id
+        HAVING COUNT(*) > 1
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM contest_participants
+        WHERE EXISTS (
+            SELECT 1 FROM contest_participants_duplicates duplicates
+            WHERE duplicates.contest_id = contest_participants.contest_id
+            AND duplicates.user_id = contest_participants.user_id
+        )
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO contest_participants (contest_id, user_id, signup_date)
+        SELECT contest_id, user_id, signup_date
+        FROM contest_participants_duplicates
+        """
+    )
+    op.execute("DROP TABLE contest_participants_duplicates")
+
+    op.create_index(
+        "uq_contest_participants_contest_user",
+        "contest_participants",
+        ["contest_id", "user_id"],
+        unique=True,
+    )
+    op.create_index(
+        "idx_elo_history_user_delta",
+        "elo_history",
+        ["user_id", "elo_points_before", "elo_points_after"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_elo_history_user_delta", table_name="elo_history")
+    op.drop_index(
+        "uq_contest_participants_contest_user", table_name="contest_participants"
+    )
+    op.drop_index("idx_bug_report_bug", table_name="bug_report")
+    op.drop_index("idx_bug_report_contest_user", table_name="bug_report")
@@ -0,0 +1,74 @@
+"""rating timeline
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 11:45:22.625987
+
+Adds rating_timeline, one rating point per (user, contest), and backfills it
+from elo_history in processing order.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "rating_timeline",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("contest_id", sa.Integer(), nullable=False),
+        sa.Column("rating", sa.Integer(), nullable=False),
+        sa.Column("delta", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["contest_id"], ["contest.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_rating_timeline_id", "rating_timeline", ["id"])
+    op.create_index(
+        "uq_rating_timeline_user_contest",
+        "rating_timeline",
+        ["user_id", "contest_id"],
+        unique=True,
+    )
+    op.create_index("idx_rating_timeline_user_id", "rating_timeline", ["user_id", "id"])
+    op.create_index("idx_rating_timeline_contest", "rating_timeline", ["contest_id"])
+
+    # A point's rating is the elo_points_after of the contest's last change,
+    # as written live; a running sum of the contest rows would leave out
+    # changes without a contest (manual adjustments)
+    op.execute(
+        """
+        INSERT INTO rating_timeline (user_id, contest_id, rating, delta)
+        SELECT points.user_id, points.contest_id, last.elo_points_after, points.delta
+        FROM (
+            SELECT
+                user_id,
+                contest_id,
+                MIN(id) AS first_id,
+                MAX(id) AS last_id,
+                SUM(elo_points_after - elo_points_before) AS delta
+            FROM elo_history
+            WHERE user_id IS NOT NULL AND contest_id IS NOT NULL
+            GROUP BY user_id, contest_id
+        ) AS points
+        JOIN elo_history AS last ON last.id = points.last_id
+        ORDER BY points.first_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_rating_timeline_contest", table_name="rating_timeline")
+    op.drop_index("idx_rating_timeline_user_id", table_name="rating_timeline")
+    op.drop_index("uq_rating_timeline_user_contest", table_name="rating_timeline")
+    op.drop_index("ix_rating_timeline_id", table_name="rating_timeline")
+    op.drop_table("rating_timeline")
@@ -0,0 +1,43 @@
+"""leaderboard snapshots
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 11:46:20.378552
+
+Adds leaderboard_snapshot, the top ranks stored after each processed contest.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "leaderboard_snapshot",
+        sa.Column("contest_id", sa.Integer(), nullable=False),
+        sa.Column("rank", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("rating", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["contest_id"],
+            ["contest.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["user.id"],
+        ),
+        sa.PrimaryKeyConstraint("contest_id", "rank"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("leaderboard_snapshot")
@@ -0,0 +1,56 @@
+"""contest processing ledger
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 11:48:59.438101
+
+Adds the per-contest processing ledger used to checkpoint and resume
+process_contest_elo. Contests that already have rating history were processed
+before this revision and are recorded as completed.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "contest_processing",
+        sa.Column("contest_id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["contest_id"], ["contest.id"]),
+        sa.PrimaryKeyConstraint("contest_id"),
+    )
+    op.create_table(
+        "contest_processing_entry",
+        sa.Column("contest_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["contest_id"], ["contest.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("contest_id", "user_id"),
+    )
+
+    op.execute(
+        """
+        INSERT INTO contest_processing (contest_id, status)
+        SELECT DISTINCT contest_id, 'completed'
+        FROM elo_history
+        WHERE contest_id IS NOT NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("contest_processing_entry")
+    op.drop_table("contest_processing")
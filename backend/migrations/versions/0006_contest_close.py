@@ -0,0 +1,32 @@
+"""contest close
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 11:57:37.804505
+
+Records when a contest was closed by the fused close pipeline.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("contest_processing", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("closed_at", sa.DateTime(timezone=True), nullable=True)
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("contest_processing", schema=None) as batch_op:
+        batch_op.drop_column("closed_at")
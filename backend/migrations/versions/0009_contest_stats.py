@@ -0,0 +1,42 @@
+"""contest stats
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 12:34:45.570464
+
+Per-contest statistics filled in when a contest's processing completes.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009"
+down_revision: Union[str, None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "contest_stats",
+        sa.Column("contest_id", sa.Integer(), nullable=False),
+        sa.Column("participants", sa.Integer(), nullable=False),
+        sa.Column("participants_without_findings", sa.Integer(), nullable=False),
+        sa.Column("medium_bugs", sa.Integer(), nullable=False),
+        sa.Column("high_bugs", sa.Integer(), nullable=False),
+        sa.Column("critical_bugs", sa.Integer(), nullable=False),
+        sa.Column("reports", sa.Integer(), nullable=False),
+        sa.Column("duplicate_reports", sa.Integer(), nullable=False),
+        sa.Column("average_rating_delta", sa.Float(), nullable=False),
+        sa.Column("computed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["contest_id"], ["contest.id"]),
+        sa.PrimaryKeyConstraint("contest_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("contest_stats")
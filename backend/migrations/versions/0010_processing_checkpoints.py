@@ -0,0 +1,47 @@
+"""processing checkpoints
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 13:02:11.418230
+
+Records when a contest's role update and rating snapshot publish finished.
+Contests already completed are taken as finished.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0010"
+down_revision: Union[str, None] = "0009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("contest_processing", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("roles_applied_at", sa.DateTime(timezone=True), nullable=True)
+        )
+        batch_op.add_column(
+            sa.Column(
+                "snapshot_published_at", sa.DateTime(timezone=True), nullable=True
+            )
+        )
+
+    op.execute(
+        """
+        UPDATE contest_processing
+        SET roles_applied_at = completed_at, snapshot_published_at = completed_at
+        WHERE status = 'completed'
+        """
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("contest_processing", schema=None) as batch_op:
+        batch_op.drop_column("snapshot_published_at")
+        batch_op.drop_column("roles_applied_at")
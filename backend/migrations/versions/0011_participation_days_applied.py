@@ -0,0 +1,44 @@
+"""participation days applied
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19 13:10:48.271905
+
+Records when a contest's participation days were added, so they are added
+once. Contests already closed have had theirs added by the close.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0011"
+down_revision: Union[str, None] = "0010"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("contest_processing", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "participation_days_applied_at",
+                sa.DateTime(timezone=True),
+                nullable=True,
+            )
+        )
+    op.execute(
+        """
+        UPDATE contest_processing
+        SET participation_days_applied_at = closed_at
+        WHERE closed_at IS NOT NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("contest_processing", schema=None) as batch_op:
+        batch_op.drop_column("participation_days_applied_at")
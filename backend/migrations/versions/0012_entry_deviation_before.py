@@ -0,0 +1,33 @@
+"""entry deviation before
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19 14:21:37.904152
+
+Keeps each applied participant's rating deviation and volatility from before
+the contest, so a resumed run can rate the whole field as it stood.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0012"
+down_revision: Union[str, None] = "0011"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("contest_processing_entry", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("deviation_before", sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column("volatility_before", sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("contest_processing_entry", schema=None) as batch_op:
+        batch_op.drop_column("volatility_before")
+        batch_op.drop_column("deviation_before")
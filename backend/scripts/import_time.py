@@ -0,0 +1,48 @@
+# Measures how long `import backend.main` takes in a fresh interpreter, using
+# python -X importtime, and lists the slowest modules.
+#
+#   python scripts/import_time.py [--top N] [--module backend.main]
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+def measure(module: str):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    timings = []  # (self_us, cumulative_us, name)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        timings.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    timings = measure(args.module)
+    total = next(
+        cumulative for _, cumulative, name in timings if name.strip() == args.module
+    )
+    print(f"import {args.module}: {total / 1000:.1f} ms")
+    print(f"{'self ms':>9} {'cumul. ms':>10}  module")
+    for self_us, cumulative_us, name in sorted(timings, reverse=True)[: args.top]:
+        print(f"{self_us / 1000:9.1f} {cumulative_us / 1000:10.1f}  {name.strip()}")
+
+
+if __name__ == "__main__":
+    main()
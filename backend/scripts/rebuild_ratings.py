@@ -0,0 +1,51 @@
+# Recomputes elo_history, the rating timeline, the leaderboard snapshots and
+# the roles by replaying every processed contest in end_date order. Progress
+# is checkpointed; running the command again with the same checkpoint resumes
+# an interrupted rebuild.
+#
+#   python scripts/rebuild_ratings.py [--engine elo] [--checkpoint PATH]
+#                                     [--checkpoint-every N] [--fresh]
+import argparse
+import os
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+def main():
+    sys.path.insert(0, REPO_ROOT)
+    from backend.app import config
+    from backend.app.database import SessionLocal
+    from backend.app.rating_engine import RATING_ENGINES, get_rating_engine
+    from backend.app.rating_rebuild import CHECKPOINT_EVERY, RatingRebuild
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--engine", choices=RATING_ENGINES, default=config.RATING_ENGINE
+    )
+    parser.add_argument("--checkpoint", default="rating_rebuild.npz")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY)
+    parser.add_argument(
+        "--fresh", action="store_true", help="ignore an existing checkpoint"
+    )
+    args = parser.parse_args()
+
+    if args.fresh and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    def progress(done, total):
+        print(f"{done}/{total} contests replayed")
+
+    with SessionLocal() as db:
+        rebuild = RatingRebuild(
+            db,
+            get_rating_engine(args.engine),
+            checkpoint_path=args.checkpoint,
+            checkpoint_every=args.checkpoint_every,
+        )
+        replayed = rebuild.run(progress)
+    print(f"Rebuilt ratings with the {args.engine} engine ({replayed} contests)")
+
+
+if __name__ == "__main__":
+    main()
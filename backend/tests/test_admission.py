@@ -0,0 +1,136 @@
+import asyncio
+import os
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from ..app import admission, models
+from ..app.admission import BATCH, INTERACTIVE, AdmissionController
+from ..app.database import SessionLocal, engine, get_batch_engine
+from ..main import app
+
+client = TestClient(app)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your-secure-admin-token")
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_interactive_waiters_go_first():
+    controller = AdmissionController(1, {}, queue_timeout=5)
+    order = []
+
+    async def request(priority_class):
+        await controller.acquire(priority_class)
+        order.append(priority_class)
+        controller.release(priority_class)
+
+    async def scenario():
+        await controller.acquire(INTERACTIVE)
+        # The batch request queued first, but the interactive one is admitted
+        # ahead of it
+        batch = asyncio.create_task(request(BATCH))
+        await asyncio.sleep(0.01)
+        interactive = asyncio.create_task(request(INTERACTIVE))
+        await asyncio.sleep(0.01)
+        controller.release(INTERACTIVE)
+        await asyncio.gather(batch, interactive)
+
+    run(scenario())
+
+    assert order == [INTERACTIVE, BATCH]
+    stats = controller.stats()
+    assert stats["in_flight"] == 0
+    assert stats["classes"][BATCH]["queued"] == 1
+    assert stats["classes"][BATCH]["max_queue_seconds"] > 0
+    assert stats["classes"][INTERACTIVE]["admitted"] == 2
+
+
+def test_batch_cap_leaves_room_for_interactive():
+    controller = AdmissionController(3, {BATCH: 1}, queue_timeout=5)
+
+    async def scenario():
+        await controller.acquire(BATCH)
+        second_batch = asyncio.create_task(controller.acquire(BATCH))
+        await asyncio.sleep(0.01)
+        # Capped batch work does not block interactive requests
+        assert await controller.acquire(INTERACTIVE) == 0
+        assert await controller.acquire(INTERACTIVE) == 0
+        assert not second_batch.done()
+
+        controller.release(BATCH)
+        await second_batch
+        controller.release(BATCH)
+        controller.release(INTERACTIVE)
+        controller.release(INTERACTIVE)
+
+    run(scenario())
+
+    stats = controller.stats()
+    assert stats["in_flight"] == 0
+    assert stats["classes"][BATCH]["limit"] == 1
+    assert stats["classes"][BATCH]["queued"] == 1
+
+
+def test_queue_timeout_rejects_without_leaking_a_slot():
+    controller = AdmissionController(1, {}, queue_timeout=0.05)
+
+    async def scenario():
+        await controller.acquire(INTERACTIVE)
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire(BATCH)
+        assert error.value.status_code == 503
+        assert "Retry-After" in error.value.headers
+        controller.release(INTERACTIVE)
+        assert await controller.acquire(BATCH) == 0
+        controller.release(BATCH)
+
+    run(scenario())
+
+    batch = controller.stats()["classes"][BATCH]
+    assert (batch["timed_out"], batch["waiting"], batch["in_flight"]) == (1, 0, 0)
+
+
+def test_queue_time_histogram():
+    controller = AdmissionController(1, {}, queue_timeout=5)
+
+    run(controller.acquire(INTERACTIVE))
+    controller.release(INTERACTIVE)
+
+    buckets = controller.stats()["classes"][INTERACTIVE]["queue_time_buckets"]
+    assert buckets["0.001"] == 1
+    assert sum(buckets.values()) == 1
+
+
+@pytest.fixture(scope="function")
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    contest = models.Contest()
+    session.add(contest)
+    session.commit()
+    admission.controller.reset_stats()
+    yield contest.id
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def test_admin_routes_use_batch_class_and_pool(setup_database):
+    contest_id = setup_database
+
+    response = client.post(
+        f"/contests/{contest_id}/process_participation_days",
+        headers={"admin-token": ADMIN_TOKEN},
+    )
+    assert response.status_code == 200
+    assert client.get("/leaderboard").status_code == 200
+
+    stats = client.get("/admission/stats").json()
+    assert stats["classes"][BATCH]["admitted"] == 1
+    # The stats request itself is in flight
+    assert stats["classes"][INTERACTIVE]["admitted"] == 2
+    assert stats["in_flight"] == 1
+    # The admin request's connection came from the batch pool
+    assert get_batch_engine().pool.checkedin() >= 1
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+from sqlalchemy import inspect
+
+from ..app import models
+from ..app.database import engine
+from ..main import create_app
+
+REPO_ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+
+
+def test_import_does_not_touch_database(tmp_path):
+    database = tmp_path / "import.db"
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import backend.main, backend.app.database as database; "
+            "print(database._engine)",
+        ],
+        cwd=REPO_ROOT,
+        env={**os.environ, "DATABASE_URL": f"sqlite:///{database}"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert result.stdout.strip() == "None"
+    assert not database.exists()
+
+
+def test_lifespan_creates_schema():
+    models.Base.metadata.drop_all(bind=engine)
+    assert not inspect(engine).has_table("user")
+
+    with TestClient(create_app()) as client:
+        assert inspect(engine).has_table("user")
+        assert client.get("/").status_code == 200
+
+    models.Base.metadata.drop_all(bind=engine)
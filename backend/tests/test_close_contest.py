@@ -0,0 +1,265 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from ..app import crud, models
+from ..app.database import SessionLocal, engine
+from ..app.models import contest_participants
+from ..main import app
+
+client = TestClient(app)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your-secure-admin-token")
+
+ROLES = ["senior_watson", "reserve_watson", "watson", "senior_watson", "watson"]
+PAST_ELOS = [1500, 1300, None, 1450, 900]
+# (severity, reporter indexes)
+REPORTS = [
+    (models.BugSeverity.CRITICAL, [0, 2]),
+    (models.BugSeverity.HIGH, [2]),
+    (models.BugSeverity.MEDIUM, [1, 4]),
+]
+
+
+@pytest.fixture(scope="function")
+def session():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    yield session
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def make_contest(session, size=len(ROLES), end_date=None, days=3):
+    end_date = end_date or datetime.now(timezone.utc) - timedelta(hours=1)
+    users = [
+        models.User(
+            username=f"user{i}-{end_date.timestamp()}",
+            email=f"user{i}-{end_date.timestamp()}@example.com",
+            role=ROLES[i % len(ROLES)],
+        )
+        for i in range(size)
+    ]
+    past_contest = models.Contest()
+    contest = models.Contest(start_date=end_date - timedelta(days=7), end_date=end_date)
+    session.add_all(users + [past_contest, contest])
+    session.commit()
+
+    for i, user in enumerate(users):
+        elo = PAST_ELOS[i % len(PAST_ELOS)]
+        if elo is not None:
+            models.add_elo_history(
+                session, user.id, past_contest.id, 0, elo, "Initial ELO setup"
+            )
+        session.execute(
+            contest_participants.insert().values(
+                contest_id=contest.id,
+                user_id=user.id,
+                signup_date=end_date - timedelta(days=days - 1),
+            )
+        )
+    session.commit()
+
+    for start in range(0, size, len(ROLES)):
+        for severity, reporters in REPORTS:
+            reporters = [start + r for r in reporters if start + r < size]
+            if not reporters:
+                continue
+            bug = models.Bug(
+                severity=severity,
+                reported_by_id=users[reporters[0]].id,
+                contest_id=contest.id,
+            )
+            session.add(bug)
+            session.flush()
+            for reporter in reporters:
+                session.add(
+                    models.BugReport(
+                        user_id=users[reporter].id,
+                        bug_id=bug.id,
+                        contest_id=contest.id,
+                    )
+                )
+    session.commit()
+    return users, contest
+
+
+def contest_history(session, contest_id):
+    return {
+        (row.user_id, row.elo_points_before, row.elo_points_after, row.change_reason)
+        for row in session.query(models.EloHistory).filter_by(contest_id=contest_id)
+    }
+
+
+def test_close_matches_process_elo(session):
+    users, contest = make_contest(session)
+
+    crud.process_contest_elo(contest.id, session, mode="python")
+    expected = contest_history(session, contest.id)
+    for model in [
+        models.EloHistory,
+        models.RatingPoint,
+        models.ContestProcessingEntry,
+        models.ContestProcessing,
+        models.LeaderboardSnapshot,
+    ]:
+        session.query(model).filter_by(contest_id=contest.id).delete()
+    session.commit()
+
+    assert crud.close_contest(contest.id, session) is True
+
+    assert contest_history(session, contest.id) == expected
+    ledger = session.get(models.ContestProcessing, contest.id)
+    assert ledger.status == models.PROCESSING_COMPLETED
+    assert ledger.closed_at is not None
+    assert session.query(models.LeaderboardSnapshot).filter_by(
+        contest_id=contest.id
+    ).count() == len(crud.get_leaderboard(session))
+
+
+def test_close_updates_roles_and_participation_days(session):
+    users, contest = make_contest(session)
+
+    response = client.post(
+        f"/contests/{contest.id}/close", headers={"admin-token": ADMIN_TOKEN}
+    )
+    assert response.status_code == 200
+
+    session.expire_all()
+    tiers = crud.get_role_tiers(session)
+    for user in users:
+        assert user.role == crud.role_for(user.id, tiers)
+        assert user.participation_days == 3
+    # Everyone with a rating is in the top 30
+    assert users[4].role == "senior_watson"
+
+
+def test_close_twice_is_noop(session):
+    users, contest = make_contest(session)
+
+    assert crud.close_contest(contest.id, session) is True
+    history = contest_history(session, contest.id)
+
+    response = client.post(
+        f"/contests/{contest.id}/close", headers={"admin-token": ADMIN_TOKEN}
+    )
+    assert response.json() == {"message": "Contest already closed"}
+
+    session.expire_all()
+    assert contest_history(session, contest.id) == history
+    assert all(user.participation_days == 3 for user in users)
+
+
+def test_close_after_process_elo(session):
+    users, contest = make_contest(session)
+
+    crud.process_contest_elo(contest.id, session)
+    history = contest_history(session, contest.id)
+
+    assert crud.close_contest(contest.id, session) is True
+
+    # process_contest_elo detached the participants it processed
+    session.expire_all()
+    assert contest_history(session, contest.id) == history
+    assert all(
+        session.get(models.User, user.id).participation_days == 3 for user in users
+    )
+
+
+def test_close_running_contest(session):
+    users, contest = make_contest(
+        session, end_date=datetime.now(timezone.utc) + timedelta(days=1)
+    )
+
+    response = client.post(
+        f"/contests/{contest.id}/close", headers={"admin-token": ADMIN_TOKEN}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Contest is still running"
+    assert session.get(models.ContestProcessing, contest.id) is None
+
+
+def test_close_statement_count_is_bounded(session):
+    def count_statements(contest_id):
+        statements = []
+        thread = threading.get_ident()
+
+        # Leaderboard cache rebuilds run on their own thread
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if threading.get_ident() == thread:
+                statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            crud.close_contest(contest_id, session)
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        return len(statements)
+
+    _, small = make_contest(session, size=len(ROLES))
+    _, large = make_contest(
+        session,
+        size=len(ROLES) * 8,
+        end_date=datetime.now(timezone.utc) - timedelta(days=1),
+    )
+
+    assert count_statements(large.id) == count_statements(small.id)
+
+
+def test_participation_days_are_added_once(session):
+    users, contest = make_contest(session)
+
+    assert crud.process_participation_days(contest.id, session) is True
+    response = client.post(
+        f"/contests/{contest.id}/process_participation_days",
+        headers={"admin-token": ADMIN_TOKEN},
+    )
+    assert response.json() == {
+        "message": "Participation days already added for this contest"
+    }
+
+    # Close applies ELO and roles but not the days again
+    assert crud.close_contest(contest.id, session) is True
+    session.expire_all()
+    assert all(
+        session.get(models.User, user.id).participation_days == 3 for user in users
+    )
+
+
+def test_participation_days_after_close_is_noop(session):
+    users, contest = make_contest(session)
+
+    assert crud.close_contest(contest.id, session) is True
+    assert crud.process_participation_days(contest.id, session) is False
+
+    session.expire_all()
+    assert all(
+        session.get(models.User, user.id).participation_days == 3 for user in users
+    )
+
+
+def test_concurrent_first_participation_days_calls(session):
+    users, contest = make_contest(session)
+    start = threading.Barrier(2)
+    results = []
+
+    def add_days():
+        with SessionLocal() as db:
+            start.wait(5)
+            results.append(crud.process_participation_days(contest.id, db))
+
+    workers = [threading.Thread(target=add_days) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # Both create the ledger; one claims the contest and the other is told so
+    assert sorted(results) == [False, True]
+    session.expire_all()
+    assert all(
+        session.get(models.User, user.id).participation_days == 3 for user in users
+    )
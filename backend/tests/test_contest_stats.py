@@ -0,0 +1,122 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from ..app import crud, models
+from ..app.database import SessionLocal, engine
+from ..app.models import contest_participants
+from ..main import app
+
+client = TestClient(app)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your-secure-admin-token")
+
+PAST_ELOS = [1500, 1300, None, 1450, 900, 700]
+# (severity, reporter indexes); users 3 and 5 find nothing
+REPORTS = [
+    (models.BugSeverity.CRITICAL, [0, 2]),
+    (models.BugSeverity.HIGH, [2]),
+    (models.BugSeverity.HIGH, [0, 1, 4]),
+    (models.BugSeverity.MEDIUM, [1]),
+]
+
+
+@pytest.fixture(scope="function")
+def session():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    yield session
+    crud.leaderboard_cache.clear()
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def make_contest(session):
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com")
+        for i in range(len(PAST_ELOS))
+    ]
+    past_contest, contest = models.Contest(), models.Contest()
+    session.add_all(users + [past_contest, contest])
+    session.commit()
+
+    for user, elo in zip(users, PAST_ELOS):
+        if elo is not None:
+            models.add_elo_history(
+                session, user.id, past_contest.id, 0, elo, "Initial ELO setup"
+            )
+        session.execute(
+            contest_participants.insert().values(contest_id=contest.id, user_id=user.id)
+        )
+    for severity, reporters in REPORTS:
+        bug = models.Bug(
+            severity=severity,
+            reported_by_id=users[reporters[0]].id,
+            contest_id=contest.id,
+        )
+        session.add(bug)
+        session.flush()
+        session.add_all(
+            models.BugReport(
+                user_id=users[reporter].id, bug_id=bug.id, contest_id=contest.id
+            )
+            for reporter in reporters
+        )
+    session.commit()
+    return contest.id
+
+
+def average_delta(session, contest_id):
+    deltas = [
+        row.elo_points_after - row.elo_points_before
+        for row in session.query(models.EloHistory).filter_by(contest_id=contest_id)
+    ]
+    return sum(deltas) / len(PAST_ELOS)
+
+
+@pytest.mark.parametrize("mode", ["python", "sql", "batch"])
+def test_stats_computed_when_processing_completes(session, mode):
+    contest_id = make_contest(session)
+
+    crud.process_contest_elo(contest_id, session, mode=mode)
+    stats = crud.get_contest_stats(session, contest_id)
+
+    assert stats.participants == 6
+    assert stats.participants_without_findings == 2
+    assert stats.bugs == {"medium": 1, "high": 2, "critical": 1}
+    assert stats.reports == 7
+    assert stats.duplicate_reports == 3
+    assert stats.duplicate_ratio == pytest.approx(3 / 7)
+    assert stats.average_rating_delta == pytest.approx(
+        average_delta(session, contest_id)
+    )
+
+
+def test_stats_read_is_one_query(session):
+    contest_id = make_contest(session)
+    crud.process_contest_elo(contest_id, session)
+    crud.leaderboard_cache.wait()
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.get(f"/contests/{contest_id}/stats")
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    assert response.json()["bugs"]["high"] == 2
+    assert len(statements) == 1
+
+
+def test_stats_missing(session):
+    contest_id = make_contest(session)
+
+    assert client.get(f"/contests/{contest_id}/stats").status_code == 404
+    response = client.get("/contests/999/stats")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Contest not found"
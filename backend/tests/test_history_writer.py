@@ -0,0 +1,109 @@
+import pytest
+from sqlalchemy import event
+
+from ..app import crud, models
+from ..app.database import SessionLocal, engine
+
+
+@pytest.fixture(scope="function")
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com", role="watson")
+        for i in range(1, 6)
+    ]
+    contest = models.Contest()
+    session.add_all(users + [contest])
+    session.commit()
+
+    contest.participants.extend(users)
+    session.commit()
+
+    for user in users:
+        bug = models.Bug(
+            severity=models.BugSeverity.MEDIUM,
+            reported_by_id=user.id,
+            contest_id=contest.id,
+        )
+        session.add(bug)
+        session.commit()
+        session.add(
+            models.BugReport(user_id=user.id, bug_id=bug.id, contest_id=contest.id)
+        )
+    session.commit()
+
+    yield session, users, contest
+
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture(scope="function")
+def statements():
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, executemany))
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def test_one_bulk_insert_per_run(setup_database, statements):
+    session, users, contest = setup_database
+    commits = []
+    event.listen(session, "after_commit", commits.append)
+
+    crud.process_contest_elo(contest.id, session)
+
+    history_inserts = [
+        (statement, executemany)
+        for statement, executemany in statements
+        if statement.startswith("INSERT INTO elo_history")
+    ]
+    assert len(history_inserts) == 1
+    assert history_inserts[0][1] is True
+    assert len(commits) == 1
+    assert session.query(models.EloHistory).count() == len(users)
+
+
+def test_buffered_changes_count_towards_current_elo(setup_database):
+    session, users, contest = setup_database
+
+    models.add_elo_history(session, users[0].id, contest.id, 0, 40, "Test change")
+    assert session.query(models.EloHistory).count() == 0
+    assert models.calculate_current_elo(users[0].id, session) == 40
+
+    session.commit()
+    assert session.query(models.EloHistory).count() == 1
+    assert models.calculate_current_elo(users[0].id, session) == 40
+
+
+def test_rollback_discards_buffer(setup_database):
+    session, users, contest = setup_database
+
+    models.add_elo_history(session, users[0].id, contest.id, 0, 40, "Test change")
+    session.rollback()
+    session.commit()
+
+    assert session.query(models.EloHistory).count() == 0
+    assert models.calculate_current_elo(users[0].id, session) == 0
+
+
+def test_changes_in_one_contest_share_a_rating_point(setup_database):
+    session, users, contest = setup_database
+    user_id = users[0].id
+
+    models.add_elo_history(session, user_id, contest.id, 0, 40, "Contest participation")
+    models.add_elo_history(session, user_id, contest.id, 40, 30, "Penalty")
+    session.commit()
+
+    models.add_elo_history(session, user_id, contest.id, 30, 20, "Late penalty")
+    session.commit()
+
+    points = session.query(models.RatingPoint).filter_by(user_id=user_id).all()
+    assert len(points) == 1
+    assert (points[0].rating, points[0].delta) == (20, 20)
@@ -0,0 +1,132 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ..app import models
+from ..app.database import SessionLocal, engine
+from ..main import app
+
+client = TestClient(app)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your-secure-admin-token")
+
+
+def process_elo(contest_id):
+    response = client.post(
+        f"/contests/{contest_id}/process_elo", headers={"admin-token": ADMIN_TOKEN}
+    )
+    assert response.status_code == 200
+
+
+@pytest.fixture(scope="module")
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com", role="watson")
+        for i in range(1, 5)
+    ]
+    session.add_all(users)
+    past_contest, contest, next_contest, unprocessed_contest = (
+        models.Contest(),
+        models.Contest(),
+        models.Contest(),
+        models.Contest(),
+    )
+    session.add_all([past_contest, contest, next_contest, unprocessed_contest])
+    session.commit()
+
+    for user, elo in zip(users, [100, 300, 200, 50]):
+        session.add(
+            models.EloHistory(
+                user_id=user.id,
+                contest_id=past_contest.id,
+                elo_points_before=0,
+                elo_points_after=elo,
+                change_reason="Initial ELO setup from past contest",
+            )
+        )
+
+    contest.participants.extend(users[:2])
+    next_contest.participants.append(users[3])
+    session.commit()
+
+    for target, user in [(contest, users[0]), (next_contest, users[3])]:
+        bug = models.Bug(
+            severity=models.BugSeverity.CRITICAL,
+            reported_by_id=user.id,
+            contest_id=target.id,
+        )
+        session.add(bug)
+        session.commit()
+        session.add(
+            models.BugReport(user_id=user.id, bug_id=bug.id, contest_id=target.id)
+        )
+    session.commit()
+
+    yield session, users, contest, next_contest, unprocessed_contest
+
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def test_snapshot_after_processing(setup_database):
+    session, users, contest, next_contest, _ = setup_database
+    process_elo(contest.id)
+
+    response = client.get(f"/contests/{contest.id}/leaderboard")
+    assert response.status_code == 200
+
+    leaderboard = response.json()
+    assert [entry["rank"] for entry in leaderboard] == [1, 2, 3, 4]
+    ratings = [entry["rating"] for entry in leaderboard]
+    assert ratings == sorted(ratings, reverse=True)
+    assert leaderboard[0]["user_id"] == users[1].id
+
+    for entry in leaderboard:
+        assert entry["rating"] == models.calculate_current_elo(
+            entry["user_id"], session
+        )
+
+
+def test_snapshot_is_historical(setup_database):
+    session, users, contest, next_contest, _ = setup_database
+    before = client.get(f"/contests/{contest.id}/leaderboard").json()
+
+    process_elo(next_contest.id)
+
+    assert client.get(f"/contests/{contest.id}/leaderboard").json() == before
+    after = client.get(f"/contests/{next_contest.id}/leaderboard").json()
+    rating_of = {entry["user_id"]: entry["rating"] for entry in after}
+    assert rating_of[users[3].id] > 50
+
+
+def test_reprocessing_keeps_snapshot(setup_database):
+    session, users, contest, next_contest, _ = setup_database
+    before = client.get(f"/contests/{next_contest.id}/leaderboard").json()
+
+    process_elo(next_contest.id)
+
+    leaderboard = client.get(f"/contests/{next_contest.id}/leaderboard").json()
+    assert leaderboard == before
+    assert [entry["rank"] for entry in leaderboard] == [1, 2, 3, 4]
+
+
+def test_snapshot_limit(setup_database):
+    session, users, contest, next_contest, _ = setup_database
+
+    response = client.get(f"/contests/{contest.id}/leaderboard?limit=2")
+    assert [entry["rank"] for entry in response.json()] == [1, 2]
+
+
+def test_snapshot_missing(setup_database):
+    session, users, contest, next_contest, unprocessed_contest = setup_database
+
+    response = client.get(f"/contests/{unprocessed_contest.id}/leaderboard")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "No leaderboard snapshot found for this contest"
+
+    response = client.get("/contests/999/leaderboard")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Contest not found"
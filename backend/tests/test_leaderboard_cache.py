@@ -0,0 +1,401 @@
+import os
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from ..app import crud, models
+from ..app.database import SessionLocal, engine
+from ..app.leaderboard_cache import (
+    SNAPSHOT_HEADER,
+    LeaderboardCache,
+    Standing,
+    Standings,
+    read_snapshot,
+    write_snapshot,
+)
+from ..app.rating_snapshot import RatingSnapshotReader, write_rating_snapshot
+from ..main import app
+
+client = TestClient(app)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your-secure-admin-token")
+cache = crud.leaderboard_cache
+
+
+@pytest.fixture(scope="function")
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com", role="watson")
+        for i in range(1, 4)
+    ]
+    past_contest, contest = models.Contest(), models.Contest()
+    session.add_all(users + [past_contest, contest])
+    session.commit()
+
+    for user, elo in zip(users, [100, 300, 200]):
+        session.add(
+            models.EloHistory(
+                user_id=user.id,
+                contest_id=past_contest.id,
+                elo_points_before=0,
+                elo_points_after=elo,
+                change_reason="Initial ELO setup from past contest",
+            )
+        )
+    session.commit()
+    cache.clear()
+
+    yield session, users, contest
+
+    cache.clear()
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def add_elo_change(session, user, contest, change):
+    before = models.calculate_current_elo(user.id, session)
+    models.add_elo_history(
+        session, user.id, contest.id, before, before + change, "Test change"
+    )
+
+
+def test_first_read_builds_snapshot(setup_database):
+    session, users, contest = setup_database
+
+    standings = cache.get()
+
+    assert [entry.user_id for entry in standings.entries] == [
+        users[1].id,
+        users[2].id,
+        users[0].id,
+    ]
+    assert standings.get(users[0].id).rank == 3
+    assert cache.stats()["misses"] >= 1
+
+
+def test_stale_while_processing(setup_database):
+    session, users, contest = setup_database
+    before = cache.get()
+
+    cache.mark_dirty(session)
+    add_elo_change(session, users[0], contest, 500)
+    session.flush()
+
+    # Mid-processing readers keep the last consistent snapshot
+    assert cache.get() is before
+
+    session.commit()
+    cache.wait()
+
+    after = cache.get()
+    assert after.generation == before.generation + 1
+    assert after.entries[0].user_id == users[0].id
+    assert after.entries[0].rating == 600
+
+
+def test_commit_without_flag_keeps_snapshot(setup_database):
+    session, users, contest = setup_database
+    before = cache.get()
+
+    add_elo_change(session, users[0], contest, 500)
+    session.commit()
+    cache.wait()
+
+    assert cache.get() is before
+
+
+def test_rollback_discards_flag(setup_database):
+    session, users, contest = setup_database
+    before = cache.get()
+
+    cache.mark_dirty(session)
+    add_elo_change(session, users[0], contest, 500)
+    session.rollback()
+    session.commit()
+    cache.wait()
+
+    assert cache.get() is before
+
+
+def test_failed_rebuild_keeps_previous_snapshot(setup_database):
+    calls = []
+
+    def loader(session):
+        calls.append(session)
+        if len(calls) > 1:
+            raise RuntimeError("database unavailable")
+        return [(1, 100)]
+
+    failing_cache = LeaderboardCache(SessionLocal, loader=loader)
+    try:
+        before = failing_cache.get()
+        failing_cache.invalidate().result()
+
+        assert failing_cache.get() is before
+        assert failing_cache.stats()["rebuild_errors"] == 1
+    finally:
+        failing_cache.close()
+
+
+def test_process_elo_refreshes_leaderboard(setup_database):
+    session, users, contest = setup_database
+    contest.participants.extend(users)
+    bug = models.Bug(
+        severity=models.BugSeverity.CRITICAL,
+        reported_by_id=users[0].id,
+        contest_id=contest.id,
+    )
+    session.add(bug)
+    session.commit()
+    session.add(
+        models.BugReport(user_id=users[0].id, bug_id=bug.id, contest_id=contest.id)
+    )
+    session.commit()
+
+    before = client.get("/leaderboard").json()
+
+    response = client.post(
+        f"/contests/{contest.id}/process_elo", headers={"admin-token": ADMIN_TOKEN}
+    )
+    assert response.status_code == 200
+    cache.wait()
+
+    after = client.get("/leaderboard?limit=3").json()
+    assert after != before
+    for entry in after:
+        assert entry["rating"] == models.calculate_current_elo(
+            entry["user_id"], session
+        )
+
+    stats = client.get("/leaderboard/cache_stats").json()
+    assert stats["hits"] >= 1
+    assert stats["generation"] >= 2
+    assert 0.0 <= stats["hit_rate"] <= 1.0
+
+    assert client.get("/leaderboard?limit=0").status_code == 422
+    assert client.get("/leaderboard?limit=100000").status_code == 422
+
+
+def test_concurrent_misses_share_one_rebuild():
+    loads = []
+    release = threading.Event()
+
+    def slow_loader(db):
+        loads.append(1)
+        release.wait(5)
+        return [(1, 100)]
+
+    cold = LeaderboardCache(SessionLocal, loader=slow_loader)
+    try:
+        results = []
+        readers = [
+            threading.Thread(target=lambda: results.append(cold.get()))
+            for _ in range(8)
+        ]
+        for reader in readers:
+            reader.start()
+        release.set()
+        for reader in readers:
+            reader.join()
+
+        assert len(loads) == 1
+        assert len({id(standings) for standings in results}) == 1
+        assert cold.stats()["misses"] == 8
+    finally:
+        cold.close()
+
+
+def test_slow_rebuild_does_not_replace_newer_standings():
+    first_read = threading.Event()
+    release_first = threading.Event()
+    calls = []
+
+    def loader(db):
+        calls.append(1)
+        if len(calls) == 1:
+            first_read.set()
+            release_first.wait(5)
+            return [(1, 100)]
+        return [(1, 200)]
+
+    racing = LeaderboardCache(SessionLocal, loader=loader)
+    try:
+        slow = racing.invalidate()
+        first_read.wait(5)
+        newer = racing.rebuild()
+        release_first.set()
+        slow.result(5)
+
+        assert racing.get() is newer
+        assert racing.get().entries[0].rating == 200
+    finally:
+        release_first.set()
+        racing.close()
+
+
+def test_snapshot_file_round_trip(tmp_path):
+    path = str(tmp_path / "leaderboard.snapshot")
+    snapshot_cache = LeaderboardCache(
+        SessionLocal, loader=lambda db: [(7, 300), (3, 200), (5, -10)]
+    )
+    try:
+        standings = snapshot_cache.rebuild()
+    finally:
+        snapshot_cache.close()
+
+    write_snapshot(standings, path)
+    loaded = read_snapshot(path)
+
+    assert loaded == standings
+    # Two int32 columns after the header
+    assert os.path.getsize(path) == SNAPSHOT_HEADER.size + 3 * 8
+
+    with open(path, "r+b") as f:
+        f.truncate(SNAPSHOT_HEADER.size + 4)
+    assert read_snapshot(path) is None
+    assert read_snapshot(str(tmp_path / "missing")) is None
+
+
+def test_concurrent_snapshot_writers(tmp_path):
+    path = str(tmp_path / "leaderboard.snapshot")
+    written = [
+        Standings(
+            entries=tuple(Standing(rank, rank, 100 * i) for rank in range(1, 2001)),
+            generation=i,
+        )
+        for i in range(1, 5)
+    ]
+
+    writers = [
+        threading.Thread(target=write_snapshot, args=(standings, path))
+        for standings in written * 5
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    # One complete file from one of the writers, and no temporary left behind
+    loaded = read_snapshot(path)
+    assert (loaded.generation, loaded.entries) in [
+        (standings.generation, standings.entries) for standings in written
+    ]
+    assert os.listdir(tmp_path) == ["leaderboard.snapshot"]
+
+
+def test_rebuilds_when_another_process_publishes(tmp_path):
+    path = str(tmp_path / "ratings.snapshot")
+    reader = RatingSnapshotReader(path)
+    rows = [(1, 100), (2, 50)]
+    worker = LeaderboardCache(
+        SessionLocal,
+        loader=lambda db: list(rows),
+        generation_source=lambda: reader.generation,
+    )
+    try:
+        before = worker.get()
+        assert not worker.refresh()
+
+        # Another worker commits new ratings and publishes the rating snapshot
+        rows[:] = [(2, 150), (1, 100)]
+        write_rating_snapshot(path, [(1, "watson"), (2, "watson")], rows)
+
+        assert worker.get() is before  # Served until the rebuild lands
+        worker.wait()
+        assert [entry.user_id for entry in worker.get().entries] == [2, 1]
+        assert not worker.refresh()
+        assert worker.stats()["rebuilds"] == 2
+    finally:
+        worker.close()
+
+
+def test_publishing_process_rebuilds_once(tmp_path):
+    path = str(tmp_path / "ratings.snapshot")
+    reader = RatingSnapshotReader(path)
+    rows = [(1, 100), (2, 50)]
+    # Its own session factory, so the app's cache does not take the commit
+    worker_sessions = sessionmaker(bind=engine)
+    worker = LeaderboardCache(
+        worker_sessions,
+        loader=lambda db: list(rows),
+        generation_source=lambda: reader.generation,
+    )
+    try:
+        worker.get()
+
+        # This worker commits new ratings, then publishes them
+        rows[:] = [(2, 150), (1, 100)]
+        with worker_sessions() as session:
+            session.execute(text("SELECT 1"))
+            worker.mark_dirty(session)
+            session.commit()
+        users = [(1, "watson"), (2, "watson")]
+        worker.published(write_rating_snapshot(path, users, rows))
+        worker.wait()
+
+        assert not worker.refresh()
+        assert worker.stats()["rebuilds"] == 2
+
+        # Another worker's publish in between is still picked up
+        write_rating_snapshot(path, users, rows)
+        worker.published(write_rating_snapshot(path, users, rows))
+        assert worker.refresh()
+        worker.wait()
+        assert worker.stats()["rebuilds"] == 3
+    finally:
+        worker.close()
+
+
+def test_warm_start_serves_snapshot_then_reconciles(tmp_path):
+    path = str(tmp_path / "leaderboard.snapshot")
+    rows = [(1, 100), (2, 50)]
+    first = LeaderboardCache(SessionLocal, loader=lambda db: rows, snapshot_path=path)
+    try:
+        persisted = first.rebuild()
+    finally:
+        first.close()
+
+    database_ready = threading.Event()
+
+    def slow_loader(db):
+        database_ready.wait(5)
+        return [(2, 150), (1, 100)]
+
+    restarted = LeaderboardCache(SessionLocal, loader=slow_loader, snapshot_path=path)
+    try:
+        assert restarted.warm()
+
+        # Served from the file while the database rebuild is still running
+        warm = restarted.get()
+        assert warm.entries == persisted.entries
+        assert warm.generation == persisted.generation
+        assert restarted.stats()["warm_start"] is True
+
+        database_ready.set()
+        restarted.wait()
+
+        reconciled = restarted.get()
+        assert [entry.user_id for entry in reconciled.entries] == [2, 1]
+        assert reconciled.generation == persisted.generation + 1
+        assert read_snapshot(path) == reconciled
+    finally:
+        database_ready.set()
+        restarted.close()
+
+
+def test_warm_without_snapshot(tmp_path):
+    cold = LeaderboardCache(
+        SessionLocal,
+        loader=lambda db: [],
+        snapshot_path=str(tmp_path / "missing"),
+    )
+    try:
+        assert not cold.warm()
+        assert cold.stats()["warm_start"] is False
+    finally:
+        cold.close()
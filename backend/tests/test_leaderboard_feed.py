@@ -0,0 +1,175 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ..app import crud, models
+from ..app.database import SessionLocal, engine
+from ..app.leaderboard_cache import Standing, Standings
+from ..app.leaderboard_feed import Subscription, delta_message
+from ..main import app
+
+client = TestClient(app)
+cache = crud.leaderboard_cache
+feed = crud.leaderboard_feed
+
+
+def standings(rows, generation):
+    entries = tuple(
+        Standing(rank, user_id, rating)
+        for rank, (user_id, rating) in enumerate(rows, start=1)
+    )
+    return Standings(
+        entries=entries,
+        positions={entry.user_id: entry.rank for entry in entries},
+        generation=generation,
+    )
+
+
+@pytest.fixture(scope="function")
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com", role="watson")
+        for i in range(1, 4)
+    ]
+    contest = models.Contest()
+    session.add_all(users + [contest])
+    session.commit()
+
+    for user, elo in zip(users, [100, 300, 200]):
+        models.add_elo_history(session, user.id, contest.id, 0, elo, "Initial ELO")
+    session.commit()
+    cache.clear()
+
+    yield session, users, contest
+
+    cache.clear()
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def test_delta_message_changes_and_removals():
+    previous = standings([(1, 300), (2, 200), (3, 100)], generation=1)
+    current = standings([(3, 400), (1, 300), (2, 200), (4, 50)], generation=2)
+
+    message = json.loads(delta_message(previous, current, size=3))
+
+    assert message["generation"] == 2
+    assert message["changes"] == [
+        {
+            "rank": 1,
+            "user_id": 3,
+            "rating": 400,
+            "previous_rank": 3,
+            "previous_rating": 100,
+        },
+        {
+            "rank": 2,
+            "user_id": 1,
+            "rating": 300,
+            "previous_rank": 1,
+            "previous_rating": 300,
+        },
+        {
+            "rank": 3,
+            "user_id": 2,
+            "rating": 200,
+            "previous_rank": 2,
+            "previous_rating": 200,
+        },
+    ]
+    # user 4 is outside the top 3 and not sent at all
+    assert message["removed"] == []
+
+    assert delta_message(current, standings([(3, 400), (1, 300)], 3), size=3) == (
+        json.dumps({"type": "delta", "generation": 3, "changes": [], "removed": [2]})
+    )
+    assert delta_message(previous, previous, size=3) is None
+
+
+def test_slow_subscriber_resyncs():
+    subscription = Subscription()
+    for i in range(subscription.queue.maxsize):
+        subscription.offer(f"delta {i}", "snapshot")
+
+    subscription.offer("delta overflow", "snapshot")
+
+    assert subscription.queue.qsize() == 1
+    assert subscription.queue.get_nowait() == "snapshot"
+
+
+def test_broadcast_serializes_once_per_message():
+    async def receive_all(subscriptions, started):
+        started.set()
+        return await asyncio.gather(*(s.queue.get() for s in subscriptions))
+
+    async def scenario():
+        subscriptions = [feed.subscribe() for _ in range(1000)]
+        started = asyncio.Event()
+        receiving = asyncio.create_task(receive_all(subscriptions, started))
+        await started.wait()
+
+        broadcaster = threading.Thread(
+            target=feed.broadcast, args=("delta", "snapshot")
+        )
+        broadcaster.start()
+        messages = await receiving
+        broadcaster.join()
+
+        for subscription in subscriptions:
+            feed.unsubscribe(subscription)
+        return messages
+
+    messages = asyncio.run(scenario())
+
+    assert len(messages) == 1000
+    assert all(message is messages[0] for message in messages)
+    assert feed.subscriber_count() == 0
+
+
+def test_websocket_pushes_coalesced_deltas(setup_database, monkeypatch):
+    session, users, contest = setup_database
+    # Tick by hand only
+    feed.close()
+    monkeypatch.setattr(feed, "tick_seconds", 3600)
+
+    with client.websocket_connect("/ws/leaderboard") as websocket:
+        snapshot = websocket.receive_json()
+        assert snapshot["type"] == "snapshot"
+        assert [entry["user_id"] for entry in snapshot["entries"]] == [
+            users[1].id,
+            users[2].id,
+            users[0].id,
+        ]
+
+        # Two commits before the next tick go out as one message
+        for change in [150, 100]:
+            before = models.calculate_current_elo(users[0].id, session)
+            models.add_elo_history(
+                session, users[0].id, contest.id, before, before + change, "Test"
+            )
+            cache.mark_dirty(session)
+            session.commit()
+            cache.wait()
+        feed.tick()
+
+        delta = websocket.receive_json()
+        assert delta["type"] == "delta"
+        assert delta["generation"] == cache.peek().generation
+        assert delta["changes"][0] == {
+            "rank": 1,
+            "user_id": users[0].id,
+            "rating": 350,
+            "previous_rank": 3,
+            "previous_rating": 100,
+        }
+        assert len(delta["changes"]) == 3
+        assert delta["removed"] == []
+
+    assert feed.subscriber_count() == 0
+    feed.close()
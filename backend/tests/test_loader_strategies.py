@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
+
+from ..app import crud, models
+from ..app.database import SessionLocal, engine, set_raiseload
+
+SEVERITIES = [models.BugSeverity.HIGH, models.BugSeverity.CRITICAL]
+
+
+def create_contest(session, participants, reports_per_user=2):
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com", role="watson")
+        for i in range(participants)
+    ]
+    end_date = datetime.now(timezone.utc) - timedelta(days=1)
+    contest = models.Contest(end_date=end_date)
+    session.add_all(users + [contest])
+    session.commit()
+    session.execute(
+        models.contest_participants.insert(),
+        [
+            {
+                "contest_id": contest.id,
+                "user_id": user.id,
+                "signup_date": end_date - timedelta(days=1),
+            }
+            for user in users
+        ],
+    )
+
+    for user in users:
+        for severity in SEVERITIES[:reports_per_user]:
+            bug = models.Bug(
+                severity=severity, reported_by_id=user.id, contest_id=contest.id
+            )
+            session.add(bug)
+            session.flush()
+            session.add(
+                models.BugReport(user_id=user.id, bug_id=bug.id, contest_id=contest.id)
+            )
+    session.commit()
+
+    contest_id = contest.id
+    session.expunge_all()
+    return contest_id
+
+
+@pytest.fixture(scope="function")
+def session():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+
+    yield session
+
+    set_raiseload(False)
+    crud.leaderboard_cache.clear()
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def record_statements(work):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(" ".join(statement.replace('"', "").split()))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        work()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def test_lazy_load_raises_in_guard_mode(session):
+    contest_id = create_contest(session, participants=2)
+    set_raiseload(True)
+    contest = session.get(models.Contest, contest_id)
+
+    with pytest.raises(InvalidRequestError):
+        contest.participants
+
+    set_raiseload(False)
+    session.expunge(contest)
+    assert len(session.get(models.Contest, contest_id).participants) == 2
+
+
+def test_bugs_load_with_their_reports(session):
+    contest_id = create_contest(session, participants=6)
+    set_raiseload(True)
+
+    statements = record_statements(
+        lambda: crud.process_contest_elo(contest_id, session, chunk_size=3)
+    )
+
+    # Reports and bugs come with each page of participants, not per report
+    assert sum("FROM bug_report LEFT OUTER JOIN bug" in s for s in statements) == 2
+    assert not any("FROM bug WHERE" in s for s in statements)
+
+
+def test_pages_stream_in_fetch_batches(session, monkeypatch):
+    contest_id = create_contest(session, participants=6)
+    set_raiseload(True)
+    monkeypatch.setattr(crud, "PARTICIPANT_FETCH_SIZE", 2)
+
+    statements = record_statements(
+        lambda: crud.process_contest_elo(contest_id, session, chunk_size=6)
+    )
+
+    # yield_per with selectinload: one reports query per fetched batch
+    assert sum("FROM bug_report LEFT OUTER JOIN bug" in s for s in statements) == 3
+    assert not any("FROM bug WHERE" in s for s in statements)
+
+
+def test_participation_days_in_one_query(session):
+    contest_id = create_contest(session, participants=5, reports_per_user=0)
+    set_raiseload(True)
+
+    statements = record_statements(
+        lambda: crud.process_participation_days(contest_id, session)
+    )
+
+    # Participants in one query, days added in one batched UPDATE
+    assert sum("contest_participants" in s for s in statements) == 1
+    assert sum(s.startswith("UPDATE user") for s in statements) == 1
+    participation_days = [
+        user.participation_days for user in session.query(models.User)
+    ]
+    assert participation_days == [2] * 5
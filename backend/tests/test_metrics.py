@@ -0,0 +1,170 @@
+import os
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ..app import auth, crud, metrics, models
+from ..app.database import SessionLocal, engine
+from ..app.metrics import Counter, Histogram, Registry
+from ..app.models import contest_participants
+from ..main import app
+
+client = TestClient(app)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your-secure-admin-token")
+
+
+def sample(text: str, line_start: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(line_start + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{line_start} not in metrics")
+
+
+def test_counter_shards_are_summed_across_threads():
+    counter = Counter("jobs_total", "Jobs", ("kind",))
+
+    def work():
+        for _ in range(1000):
+            counter.inc(1, "a")
+        counter.inc(5, "b")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.value("a") == 8000
+    assert counter.value("b") == 40
+    assert len(counter._shards) == 8
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram(
+        "latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0)
+    )
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, '/a"b')
+
+    assert registry.render().splitlines() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a\\"b",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a\\"b",le="1.0"} 3',
+        'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a\\"b"} 3.65',
+        'latency_seconds_count{route="/a\\"b"} 4',
+    ]
+    assert histogram.count('/a"b') == 4
+
+
+def test_bcrypt_time_is_recorded():
+    before = metrics.BCRYPT_SECONDS.count("verify")
+    hashed = auth.get_password_hash("secret")
+    assert auth.verify_password("secret", hashed)
+
+    assert metrics.BCRYPT_SECONDS.count("verify") == before + 1
+    assert 'auth_bcrypt_duration_seconds_count{operation="hash"}' in (
+        metrics.registry.render()
+    )
+
+
+@pytest.fixture(scope="function")
+def contest_id():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com") for i in range(4)
+    ]
+    past_contest, contest = models.Contest(), models.Contest()
+    session.add_all(users + [past_contest, contest])
+    session.commit()
+    for user in users:
+        models.add_elo_history(session, user.id, past_contest.id, 0, 500, "Initial")
+        session.execute(
+            contest_participants.insert().values(contest_id=contest.id, user_id=user.id)
+        )
+    bug = models.Bug(
+        severity=models.BugSeverity.HIGH,
+        reported_by_id=users[0].id,
+        contest_id=contest.id,
+    )
+    session.add(bug)
+    session.flush()
+    session.add_all(
+        models.BugReport(user_id=user.id, bug_id=bug.id, contest_id=contest.id)
+        for user in users[:2]
+    )
+    session.commit()
+    contest_id = contest.id
+    session.close()
+
+    yield contest_id
+
+    crud.leaderboard_cache.clear()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+@pytest.mark.parametrize("mode", ["python", "sql", "batch"])
+def test_processing_duration_and_rows_written(contest_id, mode):
+    runs = metrics.ELO_PROCESSING_RUNS.value(mode, "completed")
+    rows = metrics.ELO_PROCESSING_ROWS.total(mode)
+
+    with SessionLocal() as session:
+        crud.process_contest_elo(contest_id, session, mode=mode)
+        # Processing a completed contest again writes nothing
+        crud.process_contest_elo(contest_id, session, mode=mode)
+        with pytest.raises(Exception):
+            crud.process_contest_elo(contest_id + 100, session, mode=mode)
+
+    assert metrics.ELO_PROCESSING_RUNS.value(mode, "completed") == runs + 2
+    assert metrics.ELO_PROCESSING_RUNS.value(mode, "failed") >= 1
+    # Only the two reporters' ratings change
+    assert metrics.ELO_PROCESSING_ROWS.total(mode) == rows + 2
+    assert metrics.ELO_PROCESSING_SECONDS.count(mode) >= 3
+
+
+def test_rolled_back_history_rows_are_not_counted(contest_id):
+    with SessionLocal() as session:
+        models.add_elo_history(session, 1, contest_id, 500, 510, "Adjustment")
+        models.flush_elo_history(session)
+        session.rollback()
+        assert models.take_history_rows_written(session) == 0
+
+        models.add_elo_history(session, 1, contest_id, 500, 510, "Adjustment")
+        session.commit()
+        assert models.take_history_rows_written(session) == 1
+        assert models.take_history_rows_written(session) == 0
+
+
+def test_requests_are_labelled_by_route_template(contest_id):
+    before = metrics.REQUESTS.value("GET", "/users/{user_id}/percentile", 404)
+
+    client.get("/users/12345/percentile")
+    client.get("/users/67890/percentile")
+    client.get("/no/such/route")
+
+    text = client.get("/metrics").text
+    assert metrics.REQUESTS.value("GET", "/users/{user_id}/percentile", 404) == (
+        before + 2
+    )
+    assert 'route="/users/12345/percentile"' not in text
+    assert sample(
+        text, 'http_requests_total{method="GET",route="unmatched",status="404"}'
+    )
+    assert 'http_request_duration_seconds_bucket{method="GET",' in text
+
+
+def test_pool_and_cache_metrics(contest_id):
+    crud.leaderboard_cache.get()
+    crud.leaderboard_cache.get()
+    response = client.get("/metrics")
+
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert sample(text, 'db_pool_connections{pool="primary",state="size"}') == 10
+    assert sample(text, 'leaderboard_cache_lookups_total{result="hit"}') >= 1
+    assert 0 < sample(text, "leaderboard_cache_hit_ratio") <= 1
+    assert sample(text, 'admission_admitted_total{class="interactive"}') >= 1
@@ -0,0 +1,225 @@
+import os
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, exists, func, select, text
+
+from ..app import models
+from ..app.models import BugReport, EloHistory, contest_participants
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "alembic.ini")
+
+
+@pytest.fixture(scope="module")
+def migrated_engine(tmp_path_factory):
+    url = f"sqlite:///{tmp_path_factory.mktemp('migrations') / 'migrated.db'}"
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("sqlalchemy.url", url)
+    command.upgrade(config, "head")
+
+    engine = create_engine(url)
+    yield engine
+    engine.dispose()
+
+
+def query_plan(engine, statement):
+    sql = str(
+        statement.compile(
+            dialect=engine.dialect, compile_kwargs={"literal_binds": True}
+        )
+    )
+    with engine.connect() as connection:
+        rows = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+    return [row[-1] for row in rows]
+
+
+def assert_no_full_scan(engine, statement):
+    plan = query_plan(engine, statement)
+    tables = set(models.Base.metadata.tables)
+    full_scans = [
+        step
+        for step in plan
+        if step.startswith("SCAN ") and step.split()[1].strip('"') in tables
+    ]
+    assert not full_scans, f"Full table scan in query plan: {plan}"
+    return plan
+
+
+def test_migrations_match_models(migrated_engine):
+    with migrated_engine.connect() as connection:
+        context = MigrationContext.configure(connection)
+        diff = compare_metadata(context, models.Base.metadata)
+
+    assert diff == [], f"Models and migrations have diverged: {diff}"
+
+
+def test_downgrade_to_initial_schema(tmp_path):
+    url = f"sqlite:///{tmp_path / 'downgrade.db'}"
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("sqlalchemy.url", url)
+    command.upgrade(config, "head")
+    command.downgrade(config, "0001")
+
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        indexes = connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index'")
+        ).scalars()
+        assert "idx_bug_report_contest_user" not in set(indexes)
+    engine.dispose()
+
+
+# calculate_current_elo
+def test_current_elo_uses_covering_index(migrated_engine):
+    statement = select(
+        func.sum(EloHistory.elo_points_after - EloHistory.elo_points_before)
+    ).where(EloHistory.user_id == 1)
+
+    plan = assert_no_full_scan(migrated_engine, statement)
+    assert any("COVERING INDEX idx_elo_history_user_delta" in step for step in plan)
+
+
+# process_contest_elo: reports of a single participant
+def test_participant_reports_use_index(migrated_engine):
+    statement = select(BugReport).where(
+        BugReport.user_id == 1, BugReport.contest_id == 1
+    )
+
+    plan = assert_no_full_scan(migrated_engine, statement)
+    assert any("idx_bug_report_contest_user" in step for step in plan)
+
+
+# ELOService.get_duplicate_penalty
+def test_duplicate_count_uses_index(migrated_engine):
+    statement = (
+        select(func.count())
+        .select_from(BugReport)
+        .where(BugReport.bug_id == 1, BugReport.user_id != 1)
+    )
+
+    plan = assert_no_full_scan(migrated_engine, statement)
+    assert any("idx_bug_report_bug" in step for step in plan)
+
+
+# ELOService.get_opponent_elos
+def test_opponent_elos_use_indexes(migrated_engine):
+    statement = (
+        select(EloHistory.elo_points_after)
+        .select_from(BugReport)
+        .join(EloHistory, BugReport.user_id == EloHistory.user_id)
+        .where(BugReport.contest_id == 1, BugReport.user_id != 1)
+    )
+
+    assert_no_full_scan(migrated_engine, statement)
+
+
+# crud.signup_for_contest
+def test_signup_check_uses_unique_index(migrated_engine):
+    statement = select(
+        exists()
+        .where(contest_participants.c.user_id == 1)
+        .where(contest_participants.c.contest_id == 1)
+    )
+
+    plan = assert_no_full_scan(migrated_engine, statement)
+    assert any("uq_contest_participants_contest_user" in step for step in plan)
+
+
+# Contest.participants
+def test_contest_participants_use_index(migrated_engine):
+    statement = (
+        select(models.User)
+        .join(contest_participants, contest_participants.c.user_id == models.User.id)
+        .where(contest_participants.c.contest_id == 1)
+    )
+
+    assert_no_full_scan(migrated_engine, statement)
+
+
+# crud.get_leaderboard_snapshot
+def test_leaderboard_snapshot_uses_primary_key(migrated_engine):
+    statement = (
+        select(models.LeaderboardSnapshot)
+        .where(models.LeaderboardSnapshot.contest_id == 1)
+        .order_by(models.LeaderboardSnapshot.rank)
+        .limit(100)
+    )
+
+    plan = assert_no_full_scan(migrated_engine, statement)
+    assert not any("TEMP B-TREE" in step for step in plan)
+
+
+def test_rating_timeline_backfill_includes_manual_adjustments(tmp_path):
+    url = f"sqlite:///{tmp_path / 'backfill.db'}"
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("sqlalchemy.url", url)
+    command.upgrade(config, "0002")
+
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO user (id) VALUES (1)"))
+        connection.execute(
+            text(
+                "INSERT INTO contest (id, start_date, end_date) VALUES "
+                "(1, '2024-01-01', '2024-01-02'), (2, '2024-02-01', '2024-02-02')"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO elo_history "
+                "(id, user_id, contest_id, elo_points_before, elo_points_after) "
+                "VALUES (1, 1, 1, 0, 500), (2, 1, NULL, 500, 550), "
+                "(3, 1, 2, 550, 560), (4, 1, 2, 560, 540)"
+            )
+        )
+    command.upgrade(config, "0003")
+
+    with engine.connect() as connection:
+        points = connection.execute(
+            text("SELECT contest_id, rating, delta FROM rating_timeline ORDER BY id")
+        ).all()
+    engine.dispose()
+    # The manual +50 between the contests is part of the second rating
+    assert [tuple(point) for point in points] == [(1, 500, 500), (2, 540, -10)]
+
+
+def test_unique_signups_merge_existing_duplicates(tmp_path):
+    url = f"sqlite:///{tmp_path / 'signups.db'}"
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("sqlalchemy.url", url)
+    command.upgrade(config, "0001")
+
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO user (id) VALUES (1), (2)"))
+        connection.execute(
+            text(
+                "INSERT INTO contest (id, start_date, end_date) "
+                "VALUES (1, '2024-01-01', '2024-01-08')"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO contest_participants (contest_id, user_id, signup_date) "
+                "VALUES (1, 1, '2024-01-03'), (1, 1, '2024-01-01'), "
+                "(1, 1, '2024-01-02'), (1, 2, '2024-01-05')"
+            )
+        )
+    command.upgrade(config, "0002")
+
+    with engine.connect() as connection:
+        signups = connection.execute(
+            text(
+                "SELECT contest_id, user_id, signup_date FROM contest_participants "
+                "ORDER BY user_id"
+            )
+        ).all()
+    engine.dispose()
+    # One row per participant, keeping the earliest signup
+    assert [tuple(signup) for signup in signups] == [
+        (1, 1, "2024-01-01"),
+        (1, 2, "2024-01-05"),
+    ]
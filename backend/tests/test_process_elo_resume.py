@@ -0,0 +1,205 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import joinedload
+
+from ..app import crud, models
+from ..app.database import SessionLocal, engine
+from ..main import app
+
+client = TestClient(app)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your-secure-admin-token")
+
+SEVERITIES = [
+    models.BugSeverity.CRITICAL,
+    models.BugSeverity.HIGH,
+    models.BugSeverity.MEDIUM,
+    models.BugSeverity.HIGH,
+    models.BugSeverity.CRITICAL,
+]
+
+
+@pytest.fixture(scope="function")
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com", role="watson")
+        for i in range(1, 7)
+    ]
+    past_contest, contest = models.Contest(), models.Contest()
+    session.add_all(users + [past_contest, contest])
+    session.commit()
+
+    for i, user in enumerate(users):
+        session.add(
+            models.EloHistory(
+                user_id=user.id,
+                contest_id=past_contest.id,
+                elo_points_before=0,
+                elo_points_after=100 + 50 * i,
+                change_reason="Initial ELO setup from past contest",
+            )
+        )
+    contest.participants.extend(users)
+    session.commit()
+
+    # The last participant finds nothing
+    for user, severity in zip(users, SEVERITIES):
+        bug = models.Bug(
+            severity=severity, reported_by_id=user.id, contest_id=contest.id
+        )
+        session.add(bug)
+        session.commit()
+        session.add(
+            models.BugReport(user_id=user.id, bug_id=bug.id, contest_id=contest.id)
+        )
+    session.commit()
+
+    yield session, users, contest
+
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def expected_changes(session, users, contest):
+    changes = {}
+    for user in users:
+        reports = (
+            session.query(models.BugReport)
+            .options(joinedload(models.BugReport.bug))
+            .filter_by(user_id=user.id, contest_id=contest.id)
+            .all()
+        )
+        if reports:
+            changes[user.id] = crud.elo_service.calculate_elo_change(
+                user, contest, reports, session
+            )
+    return changes
+
+
+def contest_history(session, contest):
+    return (
+        session.query(models.EloHistory)
+        .filter(models.EloHistory.contest_id == contest.id)
+        .order_by(models.EloHistory.id)
+        .all()
+    )
+
+
+def test_resume_after_failure(monkeypatch, setup_database):
+    session, users, contest = setup_database
+    expected = expected_changes(session, users, contest)
+
+    calls = []
+    calculate_elo_change = crud.elo_service.calculate_elo_change
+
+    def crash_on_fourth_user(user, *args):
+        calls.append(user.id)
+        if len(calls) == 4:
+            raise RuntimeError("worker died")
+        return calculate_elo_change(user, *args)
+
+    monkeypatch.setattr(crud.elo_service, "calculate_elo_change", crash_on_fourth_user)
+
+    with pytest.raises(RuntimeError):
+        crud.process_contest_elo(contest.id, session, chunk_size=2)
+    session.rollback()
+
+    # Only the first checkpoint survived the crash
+    ledger = session.get(models.ContestProcessing, contest.id)
+    assert ledger.status == models.PROCESSING_RUNNING
+    assert len(contest_history(session, contest)) == 2
+
+    calls.clear()
+    crud.process_contest_elo(contest.id, session, chunk_size=2)
+
+    # Finished participants were not recomputed
+    assert len(calls) == len(expected) - 2
+    history = contest_history(session, contest)
+    assert sorted(entry.user_id for entry in history) == sorted(
+        user.id for user in users[:5]
+    )
+    for entry in history:
+        assert (
+            entry.elo_points_after - entry.elo_points_before == expected[entry.user_id]
+        )
+
+    session.refresh(ledger)
+    assert ledger.status == models.PROCESSING_COMPLETED
+
+
+def test_results_do_not_depend_on_chunk_size(setup_database):
+    session, users, contest = setup_database
+    expected = expected_changes(session, users, contest)
+
+    crud.process_contest_elo(contest.id, session, chunk_size=1)
+
+    changes = {
+        entry.user_id: entry.elo_points_after - entry.elo_points_before
+        for entry in contest_history(session, contest)
+    }
+    assert changes == expected
+
+
+def test_completed_contest_is_noop(setup_database):
+    session, users, contest = setup_database
+
+    response = client.post(
+        f"/contests/{contest.id}/process_elo", headers={"admin-token": ADMIN_TOKEN}
+    )
+    assert response.json() == {
+        "message": "ELO points and roles updated for contest participants"
+    }
+    history = len(contest_history(session, contest))
+
+    response = client.post(
+        f"/contests/{contest.id}/process_elo", headers={"admin-token": ADMIN_TOKEN}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"message": "ELO already processed for this contest"}
+    assert len(contest_history(session, contest)) == history
+
+
+def test_retry_after_crash_before_roles_finishes_them(setup_database, monkeypatch):
+    session, users, contest = setup_database
+    update_user_roles = crud.update_user_roles
+    published = []
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(crud, "update_user_roles", crash)
+    monkeypatch.setattr(crud, "publish_rating_snapshot", published.append)
+    response = client.post(
+        f"/contests/{contest.id}/process_elo", headers={"admin-token": ADMIN_TOKEN}
+    )
+    assert response.status_code == 400
+
+    # The ratings committed, the roles did not
+    ledger = session.get(models.ContestProcessing, contest.id)
+    assert ledger.status == models.PROCESSING_COMPLETED
+    assert ledger.roles_applied_at is None
+    assert {user.role for user in users} == {"watson"}
+    assert not published
+
+    monkeypatch.setattr(crud, "update_user_roles", update_user_roles)
+    response = client.post(
+        f"/contests/{contest.id}/process_elo", headers={"admin-token": ADMIN_TOKEN}
+    )
+    assert response.json() == {
+        "message": "ELO points and roles updated for contest participants"
+    }
+    session.expire_all()
+    assert {user.role for user in users} == {"senior_watson"}
+    assert ledger.roles_applied_at is not None
+    assert ledger.snapshot_published_at is not None
+    assert len(published) == 1
+
+    response = client.post(
+        f"/contests/{contest.id}/process_elo", headers={"admin-token": ADMIN_TOKEN}
+    )
+    assert response.json() == {"message": "ELO already processed for this contest"}
+    assert len(published) == 1
@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy import event
+
+from ..app import crud, models
+from ..app.database import SessionLocal, engine
+
+PARTICIPANTS = 12
+CHUNK_SIZE = 3
+
+
+@pytest.fixture(scope="function")
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com", role="watson")
+        for i in range(PARTICIPANTS)
+    ]
+    contest = models.Contest()
+    session.add_all(users + [contest])
+    session.commit()
+
+    contest.participants.extend(users)
+    session.commit()
+
+    for user in users[::2]:
+        bug = models.Bug(
+            severity=models.BugSeverity.HIGH,
+            reported_by_id=user.id,
+            contest_id=contest.id,
+        )
+        session.add(bug)
+        session.commit()
+        session.add(
+            models.BugReport(user_id=user.id, bug_id=bug.id, contest_id=contest.id)
+        )
+    session.commit()
+
+    contest_id = contest.id
+    user_ids = sorted(user.id for user in users)
+    session.expunge_all()
+
+    yield session, contest_id, user_ids
+
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def test_returns_participant_ids(setup_database):
+    session, contest_id, user_ids = setup_database
+
+    assert crud.process_contest_elo(contest_id, session, CHUNK_SIZE) == user_ids
+
+
+def test_commits_once_per_chunk(setup_database):
+    session, contest_id, user_ids = setup_database
+    commits = []
+    event.listen(session, "after_commit", commits.append)
+
+    crud.process_contest_elo(contest_id, session, CHUNK_SIZE)
+
+    # One checkpoint per chunk; completion is committed with the last (here
+    # empty) chunk
+    assert len(commits) == PARTICIPANTS // CHUNK_SIZE + 1
+
+
+def test_identity_map_stays_bounded(setup_database):
+    session, contest_id, user_ids = setup_database
+    sizes = []
+    event.listen(session, "after_commit", lambda s: sizes.append(len(s.identity_map)))
+
+    crud.process_contest_elo(contest_id, session, CHUNK_SIZE)
+
+    assert max(sizes) < PARTICIPANTS
+    assert not any(
+        isinstance(obj, models.User) for obj in session.identity_map.values()
+    )
+
+
+def test_update_user_roles_takes_ids(setup_database):
+    session, contest_id, user_ids = setup_database
+    participant_ids = crud.process_contest_elo(contest_id, session, CHUNK_SIZE)
+
+    changed = crud.update_user_roles(participant_ids, session, chunk_size=CHUNK_SIZE)
+
+    # Only participants who found bugs have a rating and make the top 30
+    finders = user_ids[::2]
+    roles = dict(session.query(models.User.id, models.User.role))
+    assert sorted(changed) == finders
+    for user_id in user_ids:
+        expected = "senior_watson" if user_id in finders else "watson"
+        assert roles[user_id] == expected
@@ -0,0 +1,111 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ..app import models, rate_limit
+from ..app.database import engine
+from ..app.rate_limit import RateLimit, RateLimiter, parse_limit
+from ..main import app
+
+client = TestClient(app)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(scope="function")
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    rate_limit.limiter.reset()
+    yield
+    rate_limit.limiter.reset()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def test_parse_limit():
+    assert parse_limit("5/minute") == RateLimit(5, 5 / 60)
+    assert parse_limit("2/second") == RateLimit(2, 2)
+    assert parse_limit("off") is None
+
+
+def test_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    limiter = RateLimiter({"login:ip": RateLimit(3, 1.0)}, clock=clock)
+
+    assert [limiter.hit("login:ip", "1.2.3.4") for _ in range(3)] == [0, 0, 0]
+    assert limiter.hit("login:ip", "1.2.3.4") == pytest.approx(1.0)
+    # Other keys and unlimited scopes are unaffected
+    assert limiter.hit("login:ip", "5.6.7.8") == 0
+    assert limiter.hit("other:ip", "1.2.3.4") == 0
+
+    clock.now = 0.5
+    assert limiter.hit("login:ip", "1.2.3.4") == pytest.approx(0.5)
+    clock.now = 1.0
+    assert limiter.hit("login:ip", "1.2.3.4") == 0
+
+
+def test_refilled_buckets_are_evicted():
+    clock = FakeClock()
+    limiter = RateLimiter(
+        {"login:ip": RateLimit(2, 1.0)}, clock=clock, sweep_interval=10
+    )
+
+    for i in range(100):
+        limiter.hit("login:ip", f"10.0.0.{i}")
+    assert len(limiter) == 100
+
+    # No sweep before the interval has passed
+    clock.now = 0.5
+    limiter.hit("login:ip", "10.0.1.0")
+    assert len(limiter) == 101
+
+    # Buckets that have refilled completely are dropped, drained ones kept
+    clock.now = 10
+    limiter.hit("login:ip", "10.0.1.0")
+    limiter.hit("login:ip", "10.0.1.0")
+    assert len(limiter) == 1
+
+
+def test_allowed_path_overhead():
+    limiter = RateLimiter({"login:ip": RateLimit(10**9, 10**9)})
+
+    started = time.perf_counter()
+    for i in range(100_000):
+        limiter.hit("login:ip", "1.2.3.4")
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 1.0
+
+
+def test_login_limited_per_username(setup_database):
+    client.post("/users/", json={"username": "victim", "password": "secret"})
+
+    for _ in range(5):
+        response = client.post(
+            "/token", data={"username": "victim", "password": "guess"}
+        )
+        assert response.status_code == 401
+
+    response = client.post("/token", data={"username": "victim", "password": "secret"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+
+    # Other accounts from the same address can still log in
+    client.post("/users/", json={"username": "other", "password": "secret"})
+    response = client.post("/token", data={"username": "other", "password": "secret"})
+    assert response.status_code == 200
+
+
+def test_signup_limited_per_ip(setup_database, monkeypatch):
+    monkeypatch.setitem(rate_limit.limiter.limits, "signup:ip", RateLimit(2, 1 / 60))
+
+    statuses = [client.post("/contests/1/signup/1").status_code for _ in range(3)]
+
+    # Unknown contest, but the first two still reach the handler
+    assert statuses == [404, 404, 429]
@@ -0,0 +1,137 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import update
+
+from ..app import crud, models
+from ..app.database import SessionLocal, engine
+from ..app.models import calculate_current_elo
+
+
+@pytest.fixture(scope="function")
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com", role="watson")
+        for i in range(3)
+    ]
+    contests = [models.Contest(), models.Contest()]
+    session.add_all(users + contests)
+    session.commit()
+
+    # Every user takes part in both contests and finds one bug in each
+    for contest in contests:
+        contest.participants.extend(users)
+        for user, severity in zip(users, models.BugSeverity):
+            bug = models.Bug(
+                severity=severity, reported_by_id=user.id, contest_id=contest.id
+            )
+            session.add(bug)
+            session.flush()
+            session.add(
+                models.BugReport(user_id=user.id, bug_id=bug.id, contest_id=contest.id)
+            )
+    session.commit()
+
+    yield session, users, contests
+
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def test_stale_write_is_rejected(setup_database):
+    session, users, contests = setup_database
+    user_id = users[0].id
+
+    with SessionLocal() as other:
+        # Both transactions read the same rating ...
+        before = calculate_current_elo(user_id, session)
+        other_before = calculate_current_elo(user_id, other)
+
+        # ... the other one writes first ...
+        models.add_elo_history(
+            other, user_id, contests[1].id, other_before, other_before + 5, "Other"
+        )
+        other.commit()
+
+        # ... so this change is based on a rating that no longer exists
+        models.add_elo_history(
+            session, user_id, contests[0].id, before, before + 7, "Stale"
+        )
+        with pytest.raises(models.RatingConflict) as conflict:
+            session.commit()
+        session.rollback()
+
+    assert conflict.value.user_ids == [user_id]
+    assert calculate_current_elo(user_id, session) == 5
+    assert (
+        session.query(models.EloHistory).filter_by(change_reason="Stale").count() == 0
+    )
+
+
+def test_processing_retries_after_conflict(setup_database, monkeypatch):
+    session, users, contests = setup_database
+    apply_contest_result = crud.apply_contest_result
+    calls = []
+
+    def interleaved(user, contest, db):
+        apply_contest_result(user, contest, db)
+        calls.append(user.id)
+        if len(calls) == 1:
+            # Another worker processes the second contest mid-chunk
+            with SessionLocal() as other:
+                monkeypatch.setattr(crud, "apply_contest_result", apply_contest_result)
+                crud.process_contest_elo(contests[1].id, other)
+                monkeypatch.setattr(crud, "apply_contest_result", interleaved)
+
+    monkeypatch.setattr(crud, "apply_contest_result", interleaved)
+    crud.process_contest_elo(contests[0].id, session)
+
+    # The first attempt was thrown away and the chunk recomputed
+    assert len(calls) == 2 * len(users)
+    for user in users:
+        rows = (
+            session.query(models.EloHistory)
+            .filter_by(user_id=user.id)
+            .order_by(models.EloHistory.id)
+            .all()
+        )
+        assert [row.contest_id for row in rows] == [contests[1].id, contests[0].id]
+        # Each change builds on the rating the previous one left behind
+        assert rows[1].elo_points_before == rows[0].elo_points_after
+        assert session.get(models.User, user.id).rating_version == 2
+
+
+def test_processing_gives_up_after_retries(setup_database, monkeypatch):
+    session, users, contests = setup_database
+    apply_contest_result = crud.apply_contest_result
+
+    def always_conflicting(user, contest, db):
+        apply_contest_result(user, contest, db)
+        with SessionLocal() as other:
+            other.execute(
+                update(models.User)
+                .where(models.User.id == user.id)
+                .values(rating_version=models.User.rating_version + 1)
+            )
+            other.commit()
+
+    monkeypatch.setattr(crud, "apply_contest_result", always_conflicting)
+
+    with pytest.raises(HTTPException) as error:
+        crud.process_contest_elo(contests[0].id, session)
+
+    assert error.value.status_code == 409
+    assert session.query(models.EloHistory).count() == 0
+    ledger = session.get(models.ContestProcessing, contests[0].id)
+    assert ledger is None
+
+
+def test_sql_mode_claims_rating_versions(setup_database):
+    session, users, contests = setup_database
+
+    crud.process_contest_elo(contests[0].id, session, mode="sql")
+
+    session.expire_all()
+    assert [user.rating_version for user in users] == [1, 1, 1]
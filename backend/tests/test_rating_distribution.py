@@ -0,0 +1,105 @@
+import math
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ..app import crud, models
+from ..app.database import SessionLocal, engine
+from ..app.rating_distribution import RatingDistribution
+from ..main import app
+
+client = TestClient(app)
+cache = crud.leaderboard_cache
+
+
+def test_matches_brute_force():
+    rng = random.Random(11)
+    # Many ties, as ratings are small integers
+    ratings = [rng.randint(0, 300) for _ in range(5000)]
+    distribution = RatingDistribution(ratings)
+
+    for rating in rng.sample(ratings, 200) + [-1, 301]:
+        lower = sum(other < rating for other in ratings)
+        assert distribution.percentile(rating) == 100 * lower / len(ratings)
+        assert distribution.top_percent(rating) == 100 * (len(ratings) - lower) / len(
+            ratings
+        )
+
+    ordered = sorted(ratings)
+    for q in (0.0, 0.01, 0.1, 0.5, 0.9, 0.99, 1.0):
+        # Exact nearest-rank quantile, no approximation error
+        assert distribution.quantile(q) == ordered[max(1, math.ceil(q * 5000)) - 1]
+
+
+def test_histogram_counts_every_rating_once():
+    ratings = [0, 0, 5, 9, 10, 99, 100]
+    histogram = RatingDistribution(ratings).histogram(10)
+
+    assert len(histogram) == 10
+    assert histogram[0] == (0, 11, 5)
+    assert histogram[-1] == (99, 101, 2)
+    assert sum(entry.count for entry in histogram) == len(ratings)
+    assert all(a.high == b.low for a, b in zip(histogram, histogram[1:]))
+    # A range narrower than the bins gives one bin per rating
+    assert RatingDistribution([3, 3, 4]).histogram(10) == [(3, 4, 2), (4, 5, 1)]
+    assert RatingDistribution([]).histogram(10) == []
+
+
+def test_descending_input_matches_sorted():
+    ratings = [random.Random(2).randint(0, 50) for _ in range(100)]
+
+    assert RatingDistribution(
+        sorted(ratings, reverse=True), descending=True
+    ).ratings == (RatingDistribution(ratings).ratings)
+
+
+@pytest.fixture(scope="function")
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com") for i in range(5)
+    ]
+    contest = models.Contest()
+    session.add_all(users + [contest])
+    session.commit()
+    # The last user has no rating history
+    for user, elo in zip(users, [100, 300, 200, 200]):
+        models.add_elo_history(session, user.id, contest.id, 0, elo, "Initial")
+    session.commit()
+    cache.clear()
+
+    yield [user.id for user in users]
+
+    cache.clear()
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def test_rating_stats_endpoint(setup_database):
+    response = client.get("/stats/ratings?bins=2")
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["rated_users"] == 4
+    assert {row["quantile"]: row["rating"] for row in stats["quantiles"]}[0.5] == 200
+    assert stats["histogram"] == [
+        {"low": 100, "high": 201, "count": 3},
+        {"low": 201, "high": 301, "count": 1},
+    ]
+    assert client.get("/stats/ratings?bins=0").status_code == 422
+
+
+def test_user_percentile_endpoint(setup_database):
+    user_ids = setup_database
+
+    top = client.get(f"/users/{user_ids[1]}/percentile").json()
+    tied = client.get(f"/users/{user_ids[2]}/percentile").json()
+    unrated = client.get(f"/users/{user_ids[4]}/percentile").json()
+
+    assert (top["rating"], top["percentile"], top["top_percent"]) == (300, 75.0, 25.0)
+    assert (tied["percentile"], tied["top_percent"]) == (25.0, 75.0)
+    assert unrated["rating"] is None and unrated["rated_users"] == 4
+    assert client.get("/users/999/percentile").status_code == 404
@@ -0,0 +1,414 @@
+import importlib
+import math
+import time
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from ..app import config, crud, models
+from ..app.database import SessionLocal, engine
+from ..app.elo_service import (
+    DUPLICATE_PENALTY_MULTIPLIER,
+    ContestInput,
+    ELOService,
+)
+from ..app.glicko2 import (
+    DEFAULT_DEVIATION,
+    GLICKO2_SCALE,
+    Glicko2Engine,
+    contest_points,
+    glicko2_update,
+    performance_scores,
+)
+from ..app.models import contest_participants
+from ..app.pairwise_elo import PairwiseELOEngine, expected_scores
+from ..app.rating_engine import get_rating_engine
+
+PAST_ELOS = [1500, 1300, None, 1450, 900]
+ROLES = ["senior_watson", "reserve_watson", "watson", "senior_watson", "watson"]
+# (severity, reporter indexes)
+REPORTS = [
+    (models.BugSeverity.CRITICAL, [0, 2]),
+    (models.BugSeverity.HIGH, [2]),
+    (models.BugSeverity.MEDIUM, [1, 4]),
+]
+
+
+def scalar_volatility(phi, sigma, delta, v, tau):
+    # Step 5 of Glickman's paper, one player at a time
+    a = math.log(sigma**2)
+
+    def f(x):
+        ex = math.exp(x)
+        return (
+            ex * (delta**2 - phi**2 - v - ex) / (2 * (phi**2 + v + ex) ** 2)
+            - (x - a) / tau**2
+        )
+
+    A = a
+    if delta**2 > phi**2 + v:
+        B = math.log(delta**2 - phi**2 - v)
+    else:
+        k = 1
+        while f(a - k * tau) < 0:
+            k += 1
+        B = a - k * tau
+    f_A, f_B = f(A), f(B)
+    while abs(B - A) > 1e-6:
+        C = A + (A - B) * f_A / (f_B - f_A)
+        f_C = f(C)
+        if f_C * f_B <= 0:
+            A, f_A = B, f_B
+        else:
+            f_A /= 2
+        B, f_B = C, f_C
+    return math.exp(A / 2)
+
+
+def test_glicko2_matches_paper_example():
+    # Glickman's worked example: rating 1500, RD 200, three games
+    v, delta = 1.7785, -0.4834
+    mu, phi, sigma = glicko2_update(
+        np.array([0.0]),
+        np.array([200 / GLICKO2_SCALE]),
+        np.array([0.06]),
+        np.array([v]),
+        np.array([delta / v]),
+    )
+
+    assert sigma[0] == pytest.approx(0.05999, abs=1e-5)
+    assert phi[0] * GLICKO2_SCALE == pytest.approx(151.52, abs=0.05)
+    assert mu[0] * GLICKO2_SCALE + 1500 == pytest.approx(1464.06, abs=0.05)
+
+
+def test_vectorized_update_matches_scalar_reference():
+    rng = np.random.default_rng(7)
+    n = 200
+    phi = rng.uniform(0.3, 2.0, n)
+    sigma = rng.uniform(0.03, 0.1, n)
+    v = rng.uniform(0.5, 20, n)
+    score_gap = rng.uniform(-1, 1, n)
+
+    _, new_phi, new_sigma = glicko2_update(np.zeros(n), phi, sigma, v, score_gap)
+
+    for i in range(n):
+        expected = scalar_volatility(phi[i], sigma[i], v[i] * score_gap[i], v[i], 0.5)
+        assert new_sigma[i] == pytest.approx(expected, rel=1e-6)
+        phi_star = math.sqrt(phi[i] ** 2 + expected**2)
+        assert new_phi[i] == pytest.approx(
+            1 / math.sqrt(1 / phi_star**2 + 1 / v[i]), rel=1e-6
+        )
+
+
+def test_performance_scores_count_ties_as_half():
+    scores = performance_scores(np.array([3.0, 1.0, 1.0, 0.0]))
+
+    assert scores.tolist() == [1.0, 0.5, 0.5, 0.0]
+
+
+def test_glicko2_rates_whole_contest():
+    contest = ContestInput(
+        contest_id=1,
+        ratings={1: 500, 2: 500, 3: 500},
+        roles={1: "watson", 2: "watson", 3: "senior_watson"},
+        reports={1: [("critical", 0)], 2: [("medium", 1)]},
+        deviations={3: (60.0, 0.06)},
+    )
+
+    changes = {
+        change.user_id: change for change in Glicko2Engine().rate_contest(contest)
+    }
+
+    assert changes[1].elo_points_after > 500 > changes[3].elo_points_after
+    # The veteran's low deviation keeps their rating steadier
+    assert 500 - changes[3].elo_points_after < changes[1].elo_points_after - 500
+    assert changes[3].deviation < changes[1].deviation < DEFAULT_DEVIATION
+    assert Glicko2Engine().rate_contest(ContestInput(1, {1: 0}, {1: "watson"})) == []
+
+
+def test_glicko2_losses_at_zero_are_kept():
+    contest = ContestInput(
+        contest_id=1,
+        ratings={1: 0, 2: 0, 3: 0},
+        roles={1: "watson", 2: "watson", 3: "watson"},
+        reports={1: [("critical", 0)]},
+    )
+
+    changes = {
+        change.user_id: change.elo_points_after - change.elo_points_before
+        for change in Glicko2Engine().rate_contest(contest)
+    }
+
+    # Losing players at 0 go below it, as much as the winner goes above
+    assert changes[2] == changes[3] < 0 < changes[1]
+    assert abs(sum(changes.values())) <= 1  # Rounding only
+
+
+def test_contest_points_sum_reports():
+    contest = ContestInput(
+        contest_id=1,
+        ratings={},
+        roles={},
+        reports={
+            1: [("critical", 0), ("medium", 2)],
+            3: [(models.BugSeverity.HIGH, 1)],
+            9: [("high", 0)],  # Not among the rated users
+        },
+    )
+
+    assert contest_points(contest, [1, 2, 3]).tolist() == [
+        2.0 + 1.0 - 2 * DUPLICATE_PENALTY_MULTIPLIER,
+        0.0,
+        1.5 - DUPLICATE_PENALTY_MULTIPLIER,
+    ]
+    assert contest_points(ContestInput(1, {}, {}), [1, 2]).tolist() == [0.0, 0.0]
+
+
+def test_glicko2_rates_large_contest_quickly():
+    n = 50_000
+    rng = np.random.default_rng(1)
+    contest = ContestInput(
+        contest_id=1,
+        ratings={i: int(r) for i, r in enumerate(rng.integers(0, 2000, n))},
+        roles={i: "watson" for i in range(n)},
+        reports={
+            i: [("high", int(d))] for i, d in enumerate(rng.integers(0, 3, n // 2))
+        },
+    )
+
+    started = time.perf_counter()
+    changes = Glicko2Engine().rate_contest(contest)
+    elapsed = time.perf_counter() - started
+
+    assert len(changes) == n
+    assert elapsed < 2.0
+
+
+def test_expected_scores_match_pairwise_loop():
+    ratings = np.array([1500.0, 1300.0, 0.0, 1450.0, 900.0, 900.0, 2100.0])
+
+    expected = [
+        sum(
+            ELOService.calculate_win_probability(ratings[i], ratings[j])
+            for j in range(len(ratings))
+            if j != i
+        )
+        / (len(ratings) - 1)
+        for i in range(len(ratings))
+    ]
+
+    assert expected_scores(ratings) == pytest.approx(expected)
+    # Any block size gives the same result
+    assert expected_scores(ratings, block_elements=10) == pytest.approx(expected)
+    assert expected_scores(ratings, block_elements=1) == pytest.approx(expected)
+
+
+def test_pairwise_engine_compares_head_to_head():
+    contest = ContestInput(
+        contest_id=1,
+        ratings={1: 1500, 2: 1000, 3: 1000},
+        roles={1: "senior_watson", 2: "watson", 3: "watson"},
+        reports={2: [("critical", 0)], 3: [("medium", 0)]},
+    )
+
+    changes = {
+        change.user_id: change.elo_points_after - change.elo_points_before
+        for change in PairwiseELOEngine().rate_contest(contest)
+    }
+
+    # The favourite finding nothing loses; beating them gains the most
+    assert changes[1] < 0 < changes[3] < changes[2]
+
+
+def test_pairwise_engine_is_zero_sum_at_zero():
+    contest = ContestInput(
+        contest_id=1,
+        ratings={1: 0, 2: 0, 3: 0},
+        roles={1: "watson", 2: "watson", 3: "watson"},
+        reports={1: [("critical", 0)]},
+    )
+
+    changes = [
+        change.elo_points_after - change.elo_points_before
+        for change in PairwiseELOEngine().rate_contest(contest)
+    ]
+
+    assert changes == [16, -8, -8]
+    assert sum(changes) == 0
+
+
+def test_pairwise_engine_scores_5k_participants_quickly():
+    n = 5000
+    rng = np.random.default_rng(3)
+    contest = ContestInput(
+        contest_id=1,
+        ratings={i: int(r) for i, r in enumerate(rng.integers(0, 3000, n))},
+        roles={i: ROLES[i % len(ROLES)] for i in range(n)},
+        reports={
+            i: [("high", int(d))] for i, d in enumerate(rng.integers(0, 3, n // 3))
+        },
+    )
+
+    started = time.perf_counter()
+    changes = PairwiseELOEngine().rate_contest(contest)
+    elapsed = time.perf_counter() - started
+
+    assert len(changes) == n
+    assert elapsed < 1.0
+
+
+def test_get_rating_engine():
+    assert isinstance(get_rating_engine("elo"), ELOService)
+    assert isinstance(get_rating_engine("elo_pairwise"), PairwiseELOEngine)
+    assert isinstance(get_rating_engine("glicko2"), Glicko2Engine)
+    with pytest.raises(ValueError):
+        get_rating_engine("trueskill")
+
+
+@pytest.fixture(scope="function")
+def session():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    yield session
+    crud.leaderboard_cache.clear()
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def make_contest(session, name):
+    end_date = datetime.now(timezone.utc) - timedelta(hours=1)
+    users = [
+        models.User(username=f"{name}{i}", email=f"{name}{i}@example.com", role=role)
+        for i, role in enumerate(ROLES)
+    ]
+    past_contest = models.Contest()
+    contest = models.Contest(start_date=end_date - timedelta(days=7), end_date=end_date)
+    session.add_all(users + [past_contest, contest])
+    session.commit()
+
+    for user, elo in zip(users, PAST_ELOS):
+        if elo is not None:
+            models.add_elo_history(
+                session, user.id, past_contest.id, 0, elo, "Initial ELO setup"
+            )
+        session.execute(
+            contest_participants.insert().values(contest_id=contest.id, user_id=user.id)
+        )
+    for severity, reporters in REPORTS:
+        bug = models.Bug(
+            severity=severity,
+            reported_by_id=users[reporters[0]].id,
+            contest_id=contest.id,
+        )
+        session.add(bug)
+        session.flush()
+        for reporter in reporters:
+            session.add(
+                models.BugReport(
+                    user_id=users[reporter].id, bug_id=bug.id, contest_id=contest.id
+                )
+            )
+    session.commit()
+    return contest.id, [user.id for user in users]
+
+
+def contest_changes(session, contest_id, user_ids):
+    rows = {
+        row.user_id: (row.elo_points_after - row.elo_points_before, row.change_reason)
+        for row in session.query(models.EloHistory).filter_by(contest_id=contest_id)
+    }
+    return [rows.get(user_id) for user_id in user_ids]
+
+
+def test_batch_mode_matches_python_mode(session):
+    python_contest, python_users = make_contest(session, "python")
+    batch_contest, batch_users = make_contest(session, "batch")
+
+    crud.process_contest_elo(python_contest, session, mode="python")
+    crud.process_contest_elo(batch_contest, session, mode="batch")
+
+    assert contest_changes(session, batch_contest, batch_users) == contest_changes(
+        session, python_contest, python_users
+    )
+    assert session.query(models.RatingDeviation).count() == 0
+
+
+def test_glicko2_batch_mode_keeps_deviations(session, monkeypatch):
+    monkeypatch.setattr(crud, "rating_engine", Glicko2Engine())
+    contest_id, user_ids = make_contest(session, "glicko")
+
+    with pytest.raises(HTTPException) as error:
+        crud.process_contest_elo(contest_id, session, mode="python")
+    assert error.value.status_code == 400
+
+    crud.process_contest_elo(contest_id, session, mode="batch")
+
+    deviations = {
+        row.user_id: row.deviation for row in session.query(models.RatingDeviation)
+    }
+    assert sorted(deviations) == sorted(user_ids)
+    assert all(deviation < DEFAULT_DEVIATION for deviation in deviations.values())
+    assert len(contest_changes(session, contest_id, user_ids)) == len(user_ids)
+    # Processing again is a no-op
+    assert crud.process_contest_elo(contest_id, session, mode="batch") == []
+
+
+def test_pairwise_batch_mode(session, monkeypatch):
+    monkeypatch.setattr(crud, "rating_engine", PairwiseELOEngine())
+    contest_id, user_ids = make_contest(session, "pairwise")
+
+    crud.process_contest_elo(contest_id, session, mode="batch")
+
+    changes = contest_changes(session, contest_id, user_ids)
+    assert all(change is not None for change in changes)
+    assert session.query(models.RatingDeviation).count() == 0
+
+
+@pytest.mark.parametrize("rating_engine", [Glicko2Engine, PairwiseELOEngine])
+def test_resumed_batch_run_rates_the_whole_field(session, monkeypatch, rating_engine):
+    monkeypatch.setattr(crud, "rating_engine", rating_engine())
+    clean_contest, clean_users = make_contest(session, "clean")
+    resumed_contest, resumed_users = make_contest(session, "resumed")
+    crud.process_contest_elo(clean_contest, session, mode="batch")
+
+    # A run that stopped after applying the first two participants
+    crud.get_processing_ledger(resumed_contest, session)
+    crud.rate_participants(
+        resumed_contest,
+        [
+            SimpleNamespace(
+                **{**row._asdict(), "applied": row.id not in resumed_users[:2]}
+            )
+            for row in crud.contest_participant_rows(resumed_contest, session)
+        ],
+        session,
+    )
+    session.commit()
+    crud.process_contest_elo(resumed_contest, session, mode="batch")
+
+    assert contest_changes(session, resumed_contest, resumed_users) == contest_changes(
+        session, clean_contest, clean_users
+    )
+    deviations = {
+        row.user_id: row.deviation for row in session.query(models.RatingDeviation)
+    }
+    assert [deviations.get(user_id) for user_id in resumed_users] == [
+        deviations.get(user_id) for user_id in clean_users
+    ]
+
+
+def test_other_engines_default_to_batch_mode(monkeypatch):
+    try:
+        monkeypatch.setenv("RATING_ENGINE", "glicko2")
+        monkeypatch.delenv("ELO_PROCESSING_MODE", raising=False)
+        assert importlib.reload(config).ELO_PROCESSING_MODE == "batch"
+
+        monkeypatch.setenv("ELO_PROCESSING_MODE", "python")
+        with pytest.raises(ValueError):
+            importlib.reload(config)
+    finally:
+        monkeypatch.undo()
+        importlib.reload(config)
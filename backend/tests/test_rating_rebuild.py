@@ -0,0 +1,235 @@
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from ..app import config, crud, models, rating_rebuild
+from ..app.database import SessionLocal, engine
+from ..app.elo_service import ELOService
+from ..app.glicko2 import Glicko2Engine
+from ..app.leaderboard_cache import read_snapshot
+from ..app.rating_rebuild import RatingRebuild, RatingState
+from ..app.rating_snapshot import ROLE_CODES, RatingSnapshotReader
+
+USERS = 40
+CONTESTS = 6
+SEVERITIES = list(models.BugSeverity)
+
+
+@pytest.fixture(scope="function")
+def session():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    yield session
+    crud.leaderboard_cache.clear()
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def make_contests(session):
+    rng = random.Random(5)
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com")
+        for i in range(USERS)
+    ]
+    # Created in the reverse of their end_date order
+    now = datetime.now()
+    contests = [
+        models.Contest(
+            start_date=now - timedelta(days=i + 7), end_date=now - timedelta(days=i)
+        )
+        for i in range(CONTESTS)
+    ]
+    setup = models.Contest(start_date=now - timedelta(days=60), end_date=now)
+    session.add_all(users + contests + [setup])
+    session.commit()
+
+    # A starting rating outside any processed contest
+    models.add_elo_history(session, users[0].id, setup.id, 0, 900, "Initial ELO setup")
+    for contest in contests:
+        participants = rng.sample(users, 25)
+        contest.participants.extend(participants)
+        for _ in range(15):
+            reporters = rng.sample(participants, rng.randint(1, 3))
+            bug = models.Bug(
+                severity=rng.choice(SEVERITIES),
+                reported_by_id=reporters[0].id,
+                contest_id=contest.id,
+            )
+            session.add(bug)
+            session.flush()
+            session.add_all(
+                models.BugReport(user_id=user.id, bug_id=bug.id, contest_id=contest.id)
+                for user in reporters
+            )
+    session.commit()
+    return [contest.id for contest in reversed(contests)]
+
+
+def process_in_order(session, contest_ids):
+    for contest_id in contest_ids:
+        participants = crud.process_contest_elo(contest_id, session, mode="python")
+        crud.update_user_roles(participants, session)
+
+
+def derived_state(session):
+    return (
+        [
+            (row.user_id, row.contest_id, row.elo_points_before, row.elo_points_after)
+            for row in session.query(models.EloHistory).order_by(models.EloHistory.id)
+        ],
+        [
+            (row.user_id, row.contest_id, row.rating, row.delta)
+            for row in session.query(models.RatingPoint).order_by(models.RatingPoint.id)
+        ],
+        [
+            (row.contest_id, row.rank, row.user_id, row.rating)
+            for row in session.query(models.LeaderboardSnapshot).order_by(
+                models.LeaderboardSnapshot.contest_id, models.LeaderboardSnapshot.rank
+            )
+        ],
+        dict(session.query(models.User.id, models.User.role)),
+    )
+
+
+def scramble_ratings(session):
+    session.query(models.EloHistory).filter(
+        models.EloHistory.change_reason != "Initial ELO setup"
+    ).update({models.EloHistory.elo_points_after: 0}, synchronize_session=False)
+    session.query(models.User).update({models.User.role: "watson"})
+    session.commit()
+
+
+def test_rebuild_matches_processing(session, tmp_path):
+    contest_ids = make_contests(session)
+    process_in_order(session, contest_ids)
+    expected = derived_state(session)
+    scramble_ratings(session)
+    versions = dict(session.query(models.User.id, models.User.rating_version))
+
+    checkpoint = tmp_path / "rebuild.npz"
+    replayed = RatingRebuild(session, ELOService(), str(checkpoint), 2).run()
+
+    assert replayed == CONTESTS
+    assert derived_state(session) == expected
+    assert not checkpoint.exists()
+    # Rating changes computed from the old ratings are rejected
+    assert dict(session.query(models.User.id, models.User.rating_version)) == {
+        user_id: version + 1 for user_id, version in versions.items()
+    }
+
+
+def test_rebuild_resumes_from_checkpoint(session, tmp_path, monkeypatch):
+    contest_ids = make_contests(session)
+    process_in_order(session, contest_ids)
+    expected = derived_state(session)
+    scramble_ratings(session)
+
+    checkpoint = str(tmp_path / "rebuild.npz")
+    replay_contest = RatingRebuild.replay_contest
+
+    def fail_on_fifth(self, contest_id, state):
+        if contest_id == contest_ids[4]:
+            raise RuntimeError("interrupted")
+        replay_contest(self, contest_id, state)
+
+    monkeypatch.setattr(RatingRebuild, "replay_contest", fail_on_fifth)
+    with pytest.raises(RuntimeError):
+        RatingRebuild(session, ELOService(), checkpoint, 3).run()
+    session.rollback()
+    monkeypatch.undo()
+
+    _, done = RatingState.load(checkpoint, "elo")
+    assert done == 3
+
+    assert RatingRebuild(session, ELOService(), checkpoint, 3).run() == CONTESTS - 3
+    assert derived_state(session) == expected
+
+    RatingState(1).save(checkpoint, "elo", 0)
+    with pytest.raises(ValueError):
+        RatingState.load(checkpoint, "glicko2")
+
+
+def test_rebuild_publishes_snapshots(session, tmp_path, monkeypatch):
+    rating_path = str(tmp_path / "ratings.snapshot")
+    leaderboard_path = str(tmp_path / "leaderboard.snapshot")
+    monkeypatch.setattr(config, "RATING_SNAPSHOT_PATH", rating_path)
+    monkeypatch.setattr(crud.leaderboard_cache, "snapshot_path", leaderboard_path)
+    contest_ids = make_contests(session)
+    process_in_order(session, contest_ids)
+    scramble_ratings(session)
+    published = RatingSnapshotReader(rating_path).generation
+    stale = crud.leaderboard_cache.get()
+
+    RatingRebuild(session, ELOService()).run()
+
+    ranking = crud.get_leaderboard(session, limit=None)
+    reader = RatingSnapshotReader(rating_path)
+    assert reader.generation > published
+    for user_id, rating in ranking:
+        assert reader.get(user_id).rating == rating
+    standings = crud.leaderboard_cache.get()
+    assert standings is not stale
+    assert [(entry.user_id, entry.rating) for entry in standings.entries] == [
+        tuple(row) for row in ranking
+    ]
+    assert read_snapshot(leaderboard_path).entries == standings.entries
+
+
+def test_rebuild_with_glicko2_keeps_deviations(session):
+    contest_ids = make_contests(session)
+    process_in_order(session, contest_ids)
+
+    RatingRebuild(session, Glicko2Engine()).run()
+
+    participants = {
+        user_id for (user_id,) in session.query(models.contest_participants.c.user_id)
+    }
+    deviations = dict(
+        session.query(models.RatingDeviation.user_id, models.RatingDeviation.deviation)
+    )
+    assert set(deviations) == participants
+    assert session.query(models.EloHistory).count() > len(participants)
+
+
+def test_finishing_again_after_a_failed_publish(session, tmp_path, monkeypatch):
+    contest_ids = make_contests(session)
+    process_in_order(session, contest_ids)
+    checkpoint = tmp_path / "rebuild.npz"
+    finish = RatingRebuild.finish
+    finished = []
+
+    def publish_fails(db):
+        raise OSError("disk full")
+
+    def record_finish(self, state, contests):
+        finished.append((self, state, contests))
+        finish(self, state, contests)
+
+    monkeypatch.setattr(rating_rebuild, "publish_rating_snapshot", publish_fails)
+    monkeypatch.setattr(RatingRebuild, "finish", record_finish)
+    with pytest.raises(OSError):
+        RatingRebuild(session, Glicko2Engine(), str(checkpoint)).run()
+    monkeypatch.undo()
+
+    # The committed rebuild is not resumed, and finishing again replaces the
+    # deviations rather than inserting them twice
+    assert not checkpoint.exists()
+    deviations = session.query(models.RatingDeviation).count()
+    finish(*finished[0])
+    assert session.query(models.RatingDeviation).count() == deviations > 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_rating_state_grows():
+    state = RatingState(2)
+    state.ratings[1] = 7
+    state.roles[1] = ROLE_CODES["senior_watson"]
+
+    state.grow(5)
+
+    assert state.ratings.tolist() == [0, 7, 0, 0, 0]
+    assert state.roles[1] == ROLE_CODES["senior_watson"]
+    assert state.roles[4] == ROLE_CODES["watson"]
+    assert state.deviations.shape == (5, 2)
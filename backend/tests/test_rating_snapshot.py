@@ -0,0 +1,140 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ..app import config, crud, models
+from ..app.database import SessionLocal, engine
+from ..app.rating_snapshot import (
+    RatingRecord,
+    RatingSnapshotReader,
+    write_rating_snapshot,
+)
+from ..main import app
+
+client = TestClient(app)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your-secure-admin-token")
+REPO_ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+
+USERS = [(1, "senior_watson"), (2, "watson"), (4, "reserve_watson")]
+RANKING = [(4, 300), (1, 120)]
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    return str(tmp_path / "ratings.snapshot")
+
+
+def test_lookup_by_user_id(snapshot_path):
+    assert write_rating_snapshot(snapshot_path, USERS, RANKING) == 1
+    reader = RatingSnapshotReader(snapshot_path)
+
+    assert reader.get(4) == RatingRecord(300, 1, "reserve_watson", 1)
+    assert reader.get(1) == RatingRecord(120, 2, "senior_watson", 1)
+    # A user without rating history has no rank
+    assert reader.get(2) == RatingRecord(0, None, "watson", 1)
+    # Gaps in the ids and ids past the end are unknown users
+    assert reader.get(3) is None
+    assert reader.get(99) is None
+
+
+def test_missing_snapshot(snapshot_path):
+    reader = RatingSnapshotReader(snapshot_path)
+
+    assert reader.get(1) is None
+    assert reader.generation == 0
+
+    write_rating_snapshot(snapshot_path, USERS, RANKING)
+    assert reader.get(1).rating == 120
+
+
+def test_reader_follows_new_generation_from_another_process(snapshot_path):
+    write_rating_snapshot(snapshot_path, USERS, RANKING)
+    reader = RatingSnapshotReader(snapshot_path)
+    assert reader.get(1).rank == 2
+    mapping = reader._mapping
+
+    # Another worker publishes new ratings
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; from backend.app.rating_snapshot import write_rating_snapshot;"
+            "write_rating_snapshot(sys.argv[1], [(1, 'senior_watson'), (5, 'watson')],"
+            " [(1, 500), (5, 10)])",
+            snapshot_path,
+        ],
+        cwd=REPO_ROOT,
+        check=True,
+    )
+
+    # The old mapping learns it is stale from its own header
+    assert mapping.superseded()
+    assert reader.get(1) == RatingRecord(500, 1, "senior_watson", 2)
+    assert reader.get(5) == RatingRecord(10, 2, "watson", 2)
+    assert reader.get(4) is None
+    assert reader.generation == 2
+    # Mapped once per generation, not per lookup
+    assert reader._mapping is reader._current()
+
+
+@pytest.fixture
+def setup_database(snapshot_path, monkeypatch):
+    models.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(config, "RATING_SNAPSHOT_PATH", snapshot_path)
+    monkeypatch.setattr(crud, "rating_snapshot", RatingSnapshotReader(snapshot_path))
+    crud.leaderboard_cache.clear()
+    session = SessionLocal()
+
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com", role="watson")
+        for i in range(1, 3)
+    ]
+    contest = models.Contest()
+    session.add_all(users + [contest])
+    session.commit()
+    contest.participants.extend(users)
+    bug = models.Bug(
+        severity=models.BugSeverity.HIGH,
+        reported_by_id=users[0].id,
+        contest_id=contest.id,
+    )
+    session.add(bug)
+    session.flush()
+    session.add(
+        models.BugReport(user_id=users[0].id, bug_id=bug.id, contest_id=contest.id)
+    )
+    session.commit()
+
+    yield session, users, contest
+
+    crud.leaderboard_cache.clear()
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def test_process_elo_publishes_snapshot(setup_database):
+    session, users, contest = setup_database
+
+    # Nothing published yet: answered from the database
+    response = client.get(f"/users/{users[0].id}/rating")
+    assert response.status_code == 200
+    assert response.json()["generation"] == 0
+
+    response = client.post(
+        f"/contests/{contest.id}/process_elo", headers={"admin-token": ADMIN_TOKEN}
+    )
+    assert response.status_code == 200
+
+    response = client.get(f"/users/{users[0].id}/rating")
+    assert response.json() == {
+        "user_id": users[0].id,
+        "rating": models.calculate_current_elo(users[0].id, session),
+        "rank": 1,
+        "role": "senior_watson",
+        "generation": 1,
+    }
+
+    assert client.get("/users/999/rating").status_code == 404
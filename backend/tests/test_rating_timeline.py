@@ -0,0 +1,117 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ..app import models
+from ..app.database import SessionLocal, engine
+from ..app.models import calculate_current_elo
+from ..main import app
+
+client = TestClient(app)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your-secure-admin-token")
+
+
+@pytest.fixture(scope="module")
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com", role="watson")
+        for i in range(1, 4)
+    ]
+    session.add_all(users)
+    contests = [models.Contest(), models.Contest(), models.Contest()]
+    session.add_all(contests)
+    session.commit()
+
+    # Contest 1: user1 and user2, contest 2: user1 and user3
+    contests[0].participants.extend([users[0], users[1]])
+    contests[1].participants.extend([users[0], users[2]])
+    session.commit()
+
+    for contest, user, severity in [
+        (contests[0], users[0], models.BugSeverity.CRITICAL),
+        (contests[0], users[1], models.BugSeverity.MEDIUM),
+        (contests[1], users[0], models.BugSeverity.HIGH),
+        (contests[1], users[2], models.BugSeverity.CRITICAL),
+    ]:
+        bug = models.Bug(
+            severity=severity, reported_by_id=user.id, contest_id=contest.id
+        )
+        session.add(bug)
+        session.commit()
+        session.add(
+            models.BugReport(user_id=user.id, bug_id=bug.id, contest_id=contest.id)
+        )
+    session.commit()
+
+    for contest in contests[:2]:
+        response = client.post(
+            f"/contests/{contest.id}/process_elo", headers={"admin-token": ADMIN_TOKEN}
+        )
+        assert response.status_code == 200
+
+    yield session, users, contests
+
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def test_timeline_is_running_total(setup_database):
+    session, users, contests = setup_database
+
+    response = client.get(f"/users/{users[0].id}/elo_history")
+    assert response.status_code == 200
+
+    points = response.json()
+    assert [point["contest_id"] for point in points] == [
+        contests[0].id,
+        contests[1].id,
+    ]
+    assert points[0]["rating"] == points[0]["delta"]
+    assert points[1]["rating"] == points[0]["rating"] + points[1]["delta"]
+    assert points[-1]["rating"] == calculate_current_elo(users[0].id, session)
+
+
+def test_rating_at_contest_participated(setup_database):
+    session, users, contests = setup_database
+    timeline = client.get(f"/users/{users[0].id}/elo_history").json()
+
+    response = client.get(f"/users/{users[0].id}/elo_history/{contests[0].id}")
+    assert response.status_code == 200
+    assert response.json() == timeline[0]
+
+
+def test_rating_at_contest_not_participated(setup_database):
+    session, users, contests = setup_database
+    timeline = client.get(f"/users/{users[1].id}/elo_history").json()
+
+    # user2 skipped contest 2, so their rating carries over from contest 1
+    response = client.get(f"/users/{users[1].id}/elo_history/{contests[1].id}")
+    assert response.status_code == 200
+    assert response.json() == {
+        "contest_id": contests[1].id,
+        "rating": timeline[-1]["rating"],
+        "delta": 0,
+    }
+
+    # user3 had no rating before contest 2
+    response = client.get(f"/users/{users[2].id}/elo_history/{contests[0].id}")
+    assert response.status_code == 200
+    assert response.json() == {"contest_id": contests[0].id, "rating": 0, "delta": 0}
+
+
+def test_rating_at_unprocessed_contest(setup_database):
+    session, users, contests = setup_database
+
+    response = client.get(f"/users/{users[0].id}/elo_history/{contests[2].id}")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "No rating history found for this contest"
+
+
+def test_elo_history_unknown_user(setup_database):
+    response = client.get("/users/999/elo_history")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "User not found"
@@ -0,0 +1,79 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from ..app import config, database, models, rate_limit
+from ..app.database import ReadOnlySessionError, ReadSessionLocal, engine
+from ..main import PRIMARY_COOKIE, app
+
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    monkeypatch.setattr(config, "READ_DATABASE_URL", url)
+    monkeypatch.setattr(database, "_read_engine", None)
+    rate_limit.limiter.reset()
+
+    models.Base.metadata.create_all(bind=engine)
+    replica_engine = create_engine(url)
+    models.Base.metadata.create_all(bind=replica_engine)
+    replica_engine.dispose()
+
+    yield TestClient(app)
+
+    database.get_read_engine().dispose()
+    rate_limit.limiter.reset()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def usernames(client):
+    return [user["username"] for user in client.get("/users/").json()]
+
+
+def test_get_requests_read_from_replica(replica):
+    client = replica
+    TestClient(app).post("/users/", json={"username": "writer", "password": "x"})
+
+    # Not replicated yet, and this client has not written anything
+    assert usernames(client) == []
+    assert database.get_read_engine() is not engine
+
+
+def test_client_reads_its_own_writes(replica):
+    client = replica
+
+    response = client.post("/users/", json={"username": "writer", "password": "x"})
+    assert response.status_code == 200
+    assert PRIMARY_COOKIE in response.cookies
+    assert usernames(client) == ["writer"]
+
+    # Once the window has passed, back to the replica
+    client.cookies.set(PRIMARY_COOKIE, "0")
+    assert usernames(client) == []
+    client.cookies.set(PRIMARY_COOKIE, "garbage")
+    assert usernames(client) == []
+
+
+def test_read_session_refuses_writes(replica):
+    session = ReadSessionLocal()
+    try:
+        session.add(models.User(username="sneaky", hashed_password="x"))
+        with pytest.raises(ReadOnlySessionError):
+            session.commit()
+    finally:
+        session.close()
+
+
+def test_without_replica_everything_uses_primary(monkeypatch):
+    monkeypatch.setattr(config, "READ_DATABASE_URL", None)
+    rate_limit.limiter.reset()
+    models.Base.metadata.create_all(bind=engine)
+    client = TestClient(app)
+    try:
+        response = client.post("/users/", json={"username": "solo", "password": "x"})
+        assert PRIMARY_COOKIE not in response.cookies
+        assert database.get_read_engine() is engine
+        assert usernames(client) == ["solo"]
+    finally:
+        rate_limit.limiter.reset()
+        models.Base.metadata.drop_all(bind=engine)
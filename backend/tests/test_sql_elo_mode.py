@@ -0,0 +1,184 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import joinedload
+
+from ..app import crud, models
+from ..app.database import SessionLocal, engine
+
+ROLES = [
+    "senior_watson",
+    "senior_watson",
+    "reserve_watson",
+    "reserve_watson",
+    "watson",
+    "watson",
+    "watson",
+    "senior_watson",
+]
+PAST_ELOS = [1500, 10, 1300, None, 1200, 900, None, 1450]
+# (bug index, reporter indexes): duplicates across leagues, single finds
+REPORTS = [
+    (0, [0, 2, 4]),
+    (1, [2, 5]),
+    (2, [4]),
+    (3, [5]),
+    (4, [0]),
+]
+
+
+@pytest.fixture(scope="function")
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com", role=role)
+        for i, role in enumerate(ROLES)
+    ]
+    past_contest, contest = models.Contest(), models.Contest()
+    session.add_all(users + [past_contest, contest])
+    session.commit()
+
+    for user, elo in zip(users, PAST_ELOS):
+        if elo is not None:
+            session.add(
+                models.EloHistory(
+                    user_id=user.id,
+                    contest_id=past_contest.id,
+                    elo_points_before=0,
+                    elo_points_after=elo,
+                    change_reason="Initial ELO setup from past contest",
+                )
+            )
+    contest.participants.extend(users)
+    session.commit()
+
+    severities = [
+        models.BugSeverity.CRITICAL,
+        models.BugSeverity.HIGH,
+        models.BugSeverity.MEDIUM,
+        models.BugSeverity.CRITICAL,
+        models.BugSeverity.HIGH,
+    ]
+    for bug_index, reporters in REPORTS:
+        bug = models.Bug(
+            severity=severities[bug_index],
+            reported_by_id=users[reporters[0]].id,
+            contest_id=contest.id,
+        )
+        session.add(bug)
+        session.commit()
+        for reporter in reporters:
+            session.add(
+                models.BugReport(
+                    user_id=users[reporter].id, bug_id=bug.id, contest_id=contest.id
+                )
+            )
+    session.commit()
+
+    yield session, users, contest
+
+    session.close()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def contest_rows(session, contest_id):
+    history = {
+        (row.user_id, row.elo_points_before, row.elo_points_after, row.change_reason)
+        for row in session.query(models.EloHistory).filter_by(contest_id=contest_id)
+    }
+    points = {
+        (row.user_id, row.rating, row.delta)
+        for row in session.query(models.RatingPoint).filter_by(contest_id=contest_id)
+    }
+    return history, points
+
+
+def reset_contest(session, contest_id):
+    for model in [
+        models.EloHistory,
+        models.RatingPoint,
+        models.ContestProcessingEntry,
+        models.ContestProcessing,
+        models.LeaderboardSnapshot,
+    ]:
+        session.query(model).filter_by(contest_id=contest_id).delete()
+    session.commit()
+
+
+def test_sql_mode_matches_python_mode(setup_database):
+    session, users, contest = setup_database
+
+    crud.process_contest_elo(contest.id, session, mode="python")
+    python_rows = contest_rows(session, contest.id)
+    reset_contest(session, contest.id)
+
+    crud.process_contest_elo(contest.id, session, mode="sql")
+    sql_rows = contest_rows(session, contest.id)
+
+    assert sql_rows == python_rows
+    # Four finders and three penalised seniors/reserves; the Watson is skipped
+    assert len(sql_rows[0]) == 7
+
+
+def test_sql_mode_matches_calculate_elo_change(setup_database):
+    session, users, contest = setup_database
+
+    expected = {}
+    for user in users:
+        reports = (
+            session.query(models.BugReport)
+            .options(joinedload(models.BugReport.bug))
+            .filter_by(user_id=user.id, contest_id=contest.id)
+            .all()
+        )
+        if reports:
+            expected[user.id] = crud.elo_service.calculate_elo_change(
+                user, contest, reports, session
+            )
+
+    crud.process_contest_elo(contest.id, session, mode="sql")
+
+    changes = {
+        row.user_id: row.elo_points_after - row.elo_points_before
+        for row in session.query(models.EloHistory).filter_by(
+            contest_id=contest.id, change_reason="Contest participation"
+        )
+    }
+    assert changes == expected
+
+
+def test_sql_mode_penalties(setup_database):
+    session, users, contest = setup_database
+
+    crud.process_contest_elo(contest.id, session, mode="sql")
+
+    penalties = {
+        row.user_id: (row.elo_points_before, row.elo_points_after, row.change_reason)
+        for row in session.query(models.EloHistory).filter(
+            models.EloHistory.contest_id == contest.id,
+            models.EloHistory.change_reason != "Contest participation",
+        )
+    }
+    assert penalties == {
+        users[1].id: (10, 0, "Penalty for senior_watson not finding bugs"),
+        users[3].id: (0, 0, "Penalty for reserve_watson not finding bugs"),
+        users[7].id: (1450, 1430, "Penalty for senior_watson not finding bugs"),
+    }
+    ledger = session.get(models.ContestProcessing, contest.id)
+    assert ledger.status == models.PROCESSING_COMPLETED
+
+
+def test_postgresql_variant_truncates():
+    statement = crud.elo_service.contest_elo_changes_query(1)
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+
+    assert "CAST(TRUNC(" in sql
+    assert "power(" in sql
+
+
+def test_unknown_mode(setup_database):
+    session, users, contest = setup_database
+
+    with pytest.raises(Exception, match="Unknown processing mode"):
+        crud.process_contest_elo(contest.id, session, mode="gpu")
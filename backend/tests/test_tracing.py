@@ -0,0 +1,204 @@
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ..app import crud, models, tracing
+from ..app.database import SessionLocal, engine
+from ..app.models import contest_participants
+from ..app.tracing import JsonLinesExporter, MemoryCollector, Tracer, tail
+from ..main import app
+
+client = TestClient(app)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your-secure-admin-token")
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    collector = MemoryCollector(100_000)
+    monkeypatch.setattr(tracing, "tracer", Tracer(1.0, collector))
+    return collector
+
+
+def by_name(spans):
+    found = {}
+    for span in spans:
+        found.setdefault(span["name"], []).append(span)
+    return found
+
+
+def test_spans_nest_and_inherit_contest_id(collector):
+    with tracing.trace("run", contest_id=7) as root:
+        with tracing.span("stage") as stage:
+            stage.set(rows=3)
+            with tracing.trace("inner"):
+                pass
+        root.set(done=True)
+
+    spans = by_name(collector.spans())
+    run, stage, inner = spans["run"][0], spans["stage"][0], spans["inner"][0]
+    assert run["parent_id"] is None
+    assert stage["parent_id"] == run["span_id"]
+    # A nested trace() joins the open trace
+    assert inner["parent_id"] == stage["span_id"]
+    assert {run["trace_id"], stage["trace_id"], inner["trace_id"]} == {run["trace_id"]}
+    assert stage["tags"] == {"contest_id": 7, "rows": 3}
+    assert run["tags"]["done"] is True
+    assert all(span["duration_ms"] >= 0 for span in collector.spans())
+
+
+def test_sampling(monkeypatch):
+    collector = MemoryCollector(100)
+    samples = iter([0.3, 0.05])
+    monkeypatch.setattr(
+        tracing, "tracer", Tracer(0.1, collector, sampler=lambda: next(samples))
+    )
+
+    with tracing.trace("skipped"):
+        # Inside an unsampled trace nothing is recorded, nested traces included
+        with tracing.span("child"), tracing.trace("nested"):
+            pass
+    with tracing.trace("sampled"):
+        pass
+    with tracing.span("outside"):
+        pass
+
+    assert [span["name"] for span in collector.spans()] == ["sampled"]
+    monkeypatch.setattr(tracing, "tracer", Tracer(0.0, collector))
+    with tracing.trace("disabled"):
+        pass
+    assert len(collector.spans()) == 1
+
+
+def test_errors_and_dropped_spans(collector, monkeypatch):
+    monkeypatch.setattr(tracing, "MAX_SPANS_PER_TRACE", 3)
+
+    with pytest.raises(ValueError):
+        with tracing.trace("run"):
+            for _ in range(5):
+                with tracing.span("stage"):
+                    pass
+            with tracing.span("failing"):
+                raise ValueError
+
+    spans = by_name(collector.spans())
+    assert len(spans["stage"]) == 3
+    assert "failing" not in spans
+    assert spans["run"][0]["tags"] == {"error": "ValueError", "dropped_spans": 3}
+
+
+def test_traced_tags_row_counts(collector):
+    @tracing.traced("load")
+    def load():
+        return [1, 2]
+
+    assert load() == [1, 2]
+    with tracing.trace("run"):
+        load()
+
+    assert by_name(collector.spans())["load"][0]["tags"] == {"rows": 2}
+
+
+def test_json_lines_exporter(tmp_path, monkeypatch):
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(tracing, "tracer", Tracer(1.0, JsonLinesExporter(str(path))))
+
+    with tracing.trace("run", contest_id=1):
+        with tracing.span("stage"):
+            pass
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["name"] for line in lines] == ["stage", "run"]
+    assert tracing.tracer.exporter.spans() == lines
+    assert tracing.tracer.exporter.spans(1) == lines[-1:]
+
+    for contest_id in range(2, 30):
+        with tracing.trace("run", contest_id=contest_id):
+            pass
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    # Read back from the end in blocks smaller than a line
+    with open(path, "rb") as f:
+        assert [json.loads(line) for line in tail(f, 5, block_size=7)] == lines[-5:]
+    assert tracing.tracer.exporter.spans(100) == lines
+
+
+@pytest.fixture(scope="function")
+def contest_id():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    users = [
+        models.User(username=f"user{i}", email=f"user{i}@example.com") for i in range(4)
+    ]
+    past_contest, contest = models.Contest(), models.Contest()
+    session.add_all(users + [past_contest, contest])
+    session.commit()
+    for user in users:
+        models.add_elo_history(session, user.id, past_contest.id, 0, 500, "Initial")
+        session.execute(
+            contest_participants.insert().values(contest_id=contest.id, user_id=user.id)
+        )
+    bug = models.Bug(
+        severity=models.BugSeverity.HIGH,
+        reported_by_id=users[0].id,
+        contest_id=contest.id,
+    )
+    session.add(bug)
+    session.flush()
+    session.add_all(
+        models.BugReport(user_id=user.id, bug_id=bug.id, contest_id=contest.id)
+        for user in users[:2]
+    )
+    session.commit()
+    contest_id = contest.id
+    session.close()
+
+    yield contest_id
+
+    crud.leaderboard_cache.clear()
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def test_process_elo_request_is_one_trace(contest_id, collector):
+    response = client.post(
+        f"/contests/{contest_id}/process_elo", headers={"admin-token": ADMIN_TOKEN}
+    )
+    assert response.status_code == 200
+
+    spans = collector.spans()
+    stages = by_name(spans)
+    assert len({span["trace_id"] for span in spans}) == 1
+    assert all(span["tags"]["contest_id"] == contest_id for span in spans)
+    assert stages["process_elo"][0]["parent_id"] is None
+    assert stages["load_participants"][0]["tags"]["rows"] == 4
+    assert len(stages["elo.calculate_elo_change"]) == 2
+    assert len(stages["elo.duplicate_count"]) == 2
+    assert stages["elo.opponent_ratings"][0]["tags"]["rows"] == 1
+    assert sum(span["tags"]["rows"] for span in stages["write_history"]) == 2
+    assert stages["update_user_roles"][0]["tags"]["rows"] == 4
+    for stage in ("leaderboard_snapshot", "contest_stats", "publish_rating_snapshot"):
+        assert stage in stages
+
+    response = client.get("/traces?limit=2", headers={"admin-token": ADMIN_TOKEN})
+    assert response.json() == spans[-2:]
+    assert client.get("/traces").status_code == 422
+    for limit in (0, -1, 10001):
+        response = client.get(
+            f"/traces?limit={limit}", headers={"admin-token": ADMIN_TOKEN}
+        )
+        assert response.status_code == 422
+
+
+def test_batch_mode_spans(contest_id, collector):
+    with SessionLocal() as session:
+        crud.process_contest_elo(contest_id, session, mode="batch")
+
+    stages = by_name(collector.spans())
+    assert stages["process_contest_elo"][0]["tags"]["mode"] == "batch"
+    assert stages["rate_contest"][0]["tags"] == {
+        "contest_id": contest_id,
+        "engine": "elo",
+        # Only the two reporters' ratings change
+        "rows": 2,
+    }
+    assert "elo.load_contest_reports" in stages